@@ -1,45 +1,119 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from .database import get_db, init_db
-from . import schemas, crud, models
-from .security import create_access_token, verify_password
-import os
-
-app = FastAPI()
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-
-@app.on_event("startup")
-async def startup_event():
-    init_db()
-
-@app.post("/token", response_model=schemas.Token)
-async def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(), 
-    db: Session = Depends(get_db)
-):
-    user = crud.get_user(db, form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    access_token = create_access_token(data={"sub": user.username})
-    return {"access_token": access_token, "token_type": "bearer"}
-
-@app.get("/users/me", response_model=schemas.UserOut)
-async def read_users_me(
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
-):
-    # Implementazione semplificata per esempio
-    current_user = crud.get_user(db, "testuser")
-    if not current_user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return current_user
-
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+"""Application factory: un'unica app FastAPI per uvicorn, i worker e il benchmark.
+
+Uso: uvicorn --factory app:create_app   (oppure uvicorn main:app)
+
+Lo schema non viene toccato all'avvio: va applicato prima con `python -m migrate`.
+"""
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from config import settings
+from serialization import ORJSONResponse
+import asyncio
+import importlib
+import metrics
+
+# Moduli in routes/ registrati di default; importati solo quando l'app viene creata
+ROUTERS = ("monitoring", "accounts", "history", "wallet", "rankings", "lobby", "tournaments", "archive", "admin", "realtime")
+
+_wired = False
+
+def _wire_process():
+    """Hook di processo (metriche sui motori, gauge, listener degli eventi): una volta sola anche con più app"""
+    global _wired
+    if _wired:
+        return
+    from database import engine, async_engine
+    from auth import token_cache
+    from hashing import hash_pool
+    from events import hub, listen, receive
+    from cache import response_cache
+    from table_manager import table_manager
+    from matchmaking import matchmaker
+    from cluster import cluster
+    import leaderboard
+
+    listen(response_cache.on_event)
+    # Messaggi degli altri worker
+    cluster.on("event", receive)
+    cluster.on("cache", response_cache.on_remote)
+    cluster.on("leaderboard", leaderboard.on_remote)
+    metrics.instrument_engine(engine)
+    metrics.instrument_engine(async_engine.sync_engine)
+    metrics.registry.gauge("hash_pool_pending", "Hash bcrypt in corso o in coda", lambda: hash_pool.pending)
+    metrics.registry.gauge("token_cache_size", "Token verificati in cache", lambda: token_cache.stats()["size"])
+    metrics.registry.gauge("event_subscribers", "Iscritti WebSocket/SSE", lambda: hub.stats()["subscribers"])
+    metrics.registry.gauge("active_tables", "Tavoli attivi in memoria", lambda: len(table_manager))
+    metrics.registry.gauge("matchmaking_queue_depth", "Giocatori in coda di matchmaking", matchmaker.depth)
+    _wired = True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from events import hub
+    from cache import response_cache
+    from coinbase import payout_queue
+    from hashing import hash_pool
+    from table_manager import table_manager
+    from bracket import bracket_scheduler
+    from matchmaking import matchmaker
+    from idempotency import idempotency_store
+    from history import rollup_worker
+    from archive import archiver
+    from cluster import cluster
+    import outbox
+
+    hub.bind(asyncio.get_running_loop())
+    response_cache.bind(asyncio.get_running_loop())
+    cluster.bind(asyncio.get_running_loop())
+    await cluster.start()
+    await asyncio.to_thread(table_manager.load)
+    table_manager.start_flusher()
+    outbox.start()
+    bracket_scheduler.start()
+    matchmaker.start()
+    idempotency_store.start()
+    rollup_worker.start()
+    archiver.start()
+    try:
+        yield
+    finally:
+        await archiver.stop()
+        await rollup_worker.stop()
+        await idempotency_store.stop()
+        await matchmaker.stop()
+        await bracket_scheduler.stop()
+        await table_manager.stop()
+        await outbox.stop()
+        await payout_queue.aclose()
+        await cluster.stop()
+        hash_pool.shutdown()
+
+def _add_exception_handlers(app: FastAPI):
+    from hashing import HashPoolSaturated
+    from ratelimit import RateLimited, retry_after_header
+    from idempotency import IdempotencyConflict
+
+    @app.exception_handler(HashPoolSaturated)
+    async def hash_pool_saturated_handler(request: Request, exc: HashPoolSaturated):
+        return JSONResponse(status_code=429, content={"detail": "Server occupato, riprova"}, headers={"Retry-After": "1"})
+
+    @app.exception_handler(RateLimited)
+    async def rate_limited_handler(request: Request, exc: RateLimited):
+        return JSONResponse(status_code=429, content={"detail": "Troppe richieste, riprova più tardi"},
+                            headers={"Retry-After": retry_after_header(exc)})
+
+    @app.exception_handler(IdempotencyConflict)
+    async def idempotency_conflict_handler(request: Request, exc: IdempotencyConflict):
+        return JSONResponse(status_code=422, content={"detail": "Idempotency-Key già usata per una richiesta diversa"})
+
+def create_app(routers=None):
+    """Crea l'app; routers: nomi dei moduli in routes/ da registrare (default APP_ROUTERS, o tutti)"""
+    if routers is None:
+        routers = [name for name in settings.APP_ROUTERS.split(",") if name] or ROUTERS
+    _wire_process()
+    app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+    app.add_middleware(metrics.MetricsMiddleware)
+    _add_exception_handlers(app)
+    for name in routers:
+        app.include_router(importlib.import_module(f"routes.{name}").router)
+    return app
@@ -0,0 +1,252 @@
+"""Archiviazione dei tavoli e dei tornei conclusi.
+
+I tavoli e i tornei chiusi da più di ARCHIVE_AFTER_HOURS (finished_at)
+vengono spostati a blocchi in archived_tables e archived_tournaments, una riga
+per partita con i giocatori denormalizzati. Le righe di tables,
+table_players, tournaments, tournament_players e tournament_eliminations
+vengono cancellate nella stessa transazione. Le tabelle calde restano grandi
+quanto i giochi in corso e le liste della lobby non rallentano con lo storico.
+
+I tavoli di un torneo vengono archiviati insieme al torneo. Ogni blocco è una
+transazione: due worker che archiviano lo stesso blocco si scontrano sulla
+chiave primaria dell'archivio e uno dei due rinuncia. Lo scontro vale come
+archiviazione concorrente solo se le righe in conflitto hanno davvero lasciato
+le tabelle calde: una riga viva con un id già archiviato è un errore.
+
+Uso: python -m archive                     archivia tutto ciò che è concluso
+     python -m archive --older-than-hours 0
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, delete, func, exists, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import (Table, TablePlayer, Tournament, TournamentPlayer, TournamentElimination, User,
+                    ArchivedTable, ArchivedTournament)
+from serialization import table_info, tournament_info, usernames_by
+from cache import response_cache
+from config import settings
+import argparse
+import asyncio
+
+ARCHIVE_AFTER = settings.ARCHIVE_AFTER_HOURS * 3600
+ARCHIVE_BATCH = settings.ARCHIVE_BATCH
+ARCHIVE_INTERVAL = settings.ARCHIVE_INTERVAL
+LIST_PAGE_SIZE = settings.LIST_PAGE_SIZE
+
+# ========== SPOSTAMENTO ==========
+
+def _move_tables(db: Session, table_ids, now: datetime):
+    rows = db.execute(
+        select(Table.id, Table.name, Table.winner, Table.tournament_id, Table.round, Table.created_at)
+        .where(Table.id.in_(table_ids))
+    ).all()
+    players = usernames_by(db, TablePlayer.table_id, table_ids, TablePlayer.user_id, (TablePlayer.id,))
+    db.execute(insert(ArchivedTable), [
+        {
+            "id": row.id, "name": row.name, "winner": row.winner, "players": players[row.id],
+            "tournament_id": row.tournament_id, "round": row.round, "created_at": row.created_at, "archived_at": now,
+        }
+        for row in rows
+    ])
+    db.execute(delete(TablePlayer).where(TablePlayer.table_id.in_(table_ids)))
+    db.execute(delete(Table).where(Table.id.in_(table_ids)))
+
+def _rounds(db: Session, tournament_ids):
+    """tournament_id -> [{"round", "eliminated"}], come tournament.round_history ma per molti tornei"""
+    rows = db.execute(
+        select(TournamentElimination.tournament_id, TournamentElimination.round, User.username)
+        .join(User, User.id == TournamentElimination.user_id)
+        .where(TournamentElimination.tournament_id.in_(tournament_ids))
+        .order_by(TournamentElimination.tournament_id, TournamentElimination.round, TournamentElimination.id)
+    )
+    rounds = defaultdict(dict)
+    for tournament_id, round, username in rows:
+        rounds[tournament_id].setdefault(round, []).append(username)
+    return {t: [{"round": r, "eliminated": names} for r, names in by_round.items()] for t, by_round in rounds.items()}
+
+def _move_tournaments(db: Session, tournament_ids, now: datetime):
+    rows = db.execute(
+        select(Tournament.id, Tournament.name, Tournament.round, Tournament.winner, Tournament.created_at, Tournament.started_at)
+        .where(Tournament.id.in_(tournament_ids))
+    ).all()
+    players = usernames_by(db, TournamentPlayer.tournament_id, tournament_ids, TournamentPlayer.user_id, (TournamentPlayer.id,))
+    rounds = _rounds(db, tournament_ids)
+    table_ids = db.scalars(select(Table.id).where(Table.tournament_id.in_(tournament_ids))).all()
+    for i in range(0, len(table_ids), ARCHIVE_BATCH):
+        _move_tables(db, table_ids[i:i + ARCHIVE_BATCH], now)
+    db.execute(insert(ArchivedTournament), [
+        {
+            "id": row.id, "name": row.name, "round": row.round, "winner": row.winner, "players": players[row.id],
+            "rounds": rounds.get(row.id, []), "created_at": row.created_at, "started_at": row.started_at,
+            "archived_at": now,
+        }
+        for row in rows
+    ])
+    db.execute(delete(TournamentElimination).where(TournamentElimination.tournament_id.in_(tournament_ids)))
+    db.execute(delete(TournamentPlayer).where(TournamentPlayer.tournament_id.in_(tournament_ids)))
+    db.execute(delete(Tournament).where(Tournament.id.in_(tournament_ids)))
+
+def _reused_ids(db: Session, tournament_ids, table_ids):
+    """Righe vive del blocco con un id già presente nell'archivio: (tornei, tavoli)"""
+    tournaments = db.scalars(
+        select(Tournament.id)
+        .where(Tournament.id.in_(tournament_ids), exists().where(ArchivedTournament.id == Tournament.id))
+    ).all()
+    tables = db.scalars(
+        select(Table.id)
+        .where(or_(Table.id.in_(table_ids), Table.tournament_id.in_(tournament_ids)),
+               exists().where(ArchivedTable.id == Table.id))
+    ).all()
+    return tournaments, tables
+
+def archive_once(db: Session, batch: int = ARCHIVE_BATCH, older_than: float = ARCHIVE_AFTER):
+    """Archivia un blocco di tornei e uno di tavoli conclusi; restituisce (tornei, tavoli)"""
+    cutoff = datetime.utcnow() - timedelta(seconds=older_than)
+    # L'età si conta dalla chiusura; le righe chiuse prima di finished_at ripiegano sulla creazione
+    tournament_finished = func.coalesce(Tournament.finished_at, Tournament.created_at)
+    table_finished = func.coalesce(Table.finished_at, Table.created_at)
+    tournament_ids = db.scalars(
+        select(Tournament.id)
+        .where(Tournament.winner.isnot(None), tournament_finished < cutoff)
+        .order_by(Tournament.id).limit(batch)
+    ).all()
+    table_ids = db.scalars(
+        select(Table.id)
+        .where(Table.winner.isnot(None), Table.tournament_id.is_(None), table_finished < cutoff)
+        .order_by(Table.id).limit(batch)
+    ).all()
+    if not tournament_ids and not table_ids:
+        db.rollback()
+        return 0, 0
+    now = datetime.utcnow()
+    try:
+        if tournament_ids:
+            _move_tournaments(db, tournament_ids, now)
+        if table_ids:
+            _move_tables(db, table_ids, now)
+        db.commit()
+    except IntegrityError as error:
+        db.rollback()
+        tournaments, tables = _reused_ids(db, tournament_ids, table_ids)
+        db.rollback()
+        if tournaments or tables:
+            # Id riassegnati prima di sqlite_autoincrement: ritentare non servirebbe mai
+            raise RuntimeError(f"id già archiviati in uso: tornei {tournaments}, tavoli {tables}") from error
+        # Lo stesso blocco è stato archiviato da un altro worker
+        return 0, 0
+    # I conclusi spariscono dalle liste della lobby e compaiono in quelle dell'archivio
+    response_cache.invalidate("archive")
+    if tournament_ids:
+        response_cache.invalidate("tournaments")
+    if table_ids:
+        response_cache.invalidate("tables")
+    return len(tournament_ids), len(table_ids)
+
+def archive_all(batch: int = ARCHIVE_BATCH, older_than: float = ARCHIVE_AFTER):
+    """Archivia a blocchi finché resta lavoro; gira in un thread con una sessione propria"""
+    db = SessionLocal()
+    totals = [0, 0]
+    try:
+        while True:
+            tournaments, tables = archive_once(db, batch, older_than)
+            totals[0] += tournaments
+            totals[1] += tables
+            if tournaments < batch and tables < batch:
+                return {"tournaments": totals[0], "tables": totals[1]}
+    finally:
+        db.close()
+
+class Archiver:
+    """Archivia in background ogni interval secondi"""
+
+    def __init__(self, interval: float = ARCHIVE_INTERVAL):
+        self.interval = interval
+        self.archived = {"tournaments": 0, "tables": 0}
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                done = await asyncio.to_thread(archive_all)
+                for kind, n in done.items():
+                    self.archived[kind] += n
+            except Exception:
+                # I blocchi falliti sono stati annullati: restano nelle tabelle calde fino al prossimo giro
+                pass
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+archiver = Archiver()
+
+# ========== LETTURA ==========
+
+def archived_table_info(row):
+    return table_info(row.id, row.name, row.players or [], False, row.winner)
+
+def list_tables(db: Session, before: int = None, limit: int = LIST_PAGE_SIZE):
+    """Tavoli della lobby archiviati, dal più recente; i tavoli dei tornei stanno nel loro torneo"""
+    stmt = select(ArchivedTable.id, ArchivedTable.name, ArchivedTable.players, ArchivedTable.winner) \
+        .where(ArchivedTable.tournament_id.is_(None))
+    if before is not None:
+        stmt = stmt.where(ArchivedTable.id < before)
+    return [archived_table_info(row) for row in db.execute(stmt.order_by(ArchivedTable.id.desc()).limit(limit))]
+
+def get_table(db: Session, table_id: int):
+    row = db.execute(
+        select(ArchivedTable.id, ArchivedTable.name, ArchivedTable.players, ArchivedTable.winner)
+        .where(ArchivedTable.id == table_id)
+    ).first()
+    return archived_table_info(row) if row is not None else None
+
+def _eliminated(rounds):
+    return [username for r in rounds or [] for username in r["eliminated"]]
+
+def list_tournaments(db: Session, before: int = None, limit: int = LIST_PAGE_SIZE):
+    stmt = select(ArchivedTournament.id, ArchivedTournament.name, ArchivedTournament.round,
+                  ArchivedTournament.players, ArchivedTournament.rounds, ArchivedTournament.winner)
+    if before is not None:
+        stmt = stmt.where(ArchivedTournament.id < before)
+    return [
+        tournament_info(row.id, row.name, row.round, row.players or [], _eliminated(row.rounds), row.winner)
+        for row in db.execute(stmt.order_by(ArchivedTournament.id.desc()).limit(limit))
+    ]
+
+def get_tournament(db: Session, tournament_id: int):
+    """Torneo archiviato con turni e tabellone completo"""
+    row = db.get(ArchivedTournament, tournament_id)
+    if row is None:
+        return None
+    tables = db.execute(
+        select(ArchivedTable.id, ArchivedTable.round, ArchivedTable.players, ArchivedTable.winner)
+        .where(ArchivedTable.tournament_id == tournament_id)
+        .order_by(ArchivedTable.round, ArchivedTable.id)
+    )
+    return {
+        **tournament_info(row.id, row.name, row.round, row.players or [], _eliminated(row.rounds), row.winner),
+        "rounds": row.rounds or [],
+        "tables": [
+            {"table_id": t.id, "round": t.round, "players": t.players or [], "winner": t.winner}
+            for t in tables
+        ],
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=ARCHIVE_BATCH)
+    parser.add_argument("--older-than-hours", type=float, default=ARCHIVE_AFTER / 3600)
+    args = parser.parse_args()
+    done = archive_all(args.batch, args.older_than_hours * 3600)
+    print(f"{done['tournaments']} tornei e {done['tables']} tavoli archiviati")
+
+if __name__ == "__main__":
+    main()
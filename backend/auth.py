@@ -1,21 +1,81 @@
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from jose import jwt
-import os
+from collections import OrderedDict, namedtuple
+from threading import Lock
+from jose import jwt, JWTError
+from config import settings
+from metrics import jwt_decode_duration
+import hashlib
+import time
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "120"))
+SECRET_KEY = settings.SECRET_KEY
+ALGORITHM = settings.ALGORITHM
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# Identità estratta da un token già verificato
+Principal = namedtuple("Principal", ["username", "user_id", "exp"])
 
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+class TokenCache:
+    """Cache LRU limitata dei token verificati, ogni voce scade all'exp del token"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def _key(token: str):
+        # Non teniamo in memoria i token in chiaro
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str):
+        key = self._key(token)
+        with self._lock:
+            principal = self._entries.get(key)
+            if principal is not None:
+                if principal.exp > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return principal
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, principal: Principal):
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = principal
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE)
+
+def decode_access_token(token: str):
+    """Restituisce il Principal del token, verificando la firma solo al primo utilizzo"""
+    principal = token_cache.get(token)
+    if principal is not None:
+        return principal
+    start = time.perf_counter()
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    finally:
+        jwt_decode_duration.observe(time.perf_counter() - start)
+    username = payload.get("sub")
+    exp = payload.get("exp")
+    if username is None or exp is None:
+        return None
+    return Principal(username=username, user_id=None, exp=exp)
@@ -0,0 +1,128 @@
+"""Latenza della lobby con un grande storico di tavoli conclusi, prima e dopo l'archiviazione.
+
+Semina --history tavoli conclusi (con i loro posti) e --live tavoli vivi in
+coda, come in un database in produzione da tempo, poi misura le query della
+lobby in tre configurazioni:
+
+  legacy     senza gli indici parziali: i tavoli vivi si trovano scorrendo lo storico
+  partial    con ix_tables_live: la lobby non legge più i conclusi
+  archived   dopo `archive.archive_all`: le tabelle calde contengono solo i vivi
+
+Per ogni query riporta la mediana in ms di --runs esecuzioni (query e
+costruzione dei dict, senza HTTP), oltre a tempo e velocità dell'archiviazione.
+
+ATTENZIONE: il database indicato con --db viene svuotato e riseminato.
+
+Uso: python -m bench.archive --db sqlite:///./bench.db --history 1000000 --live 200
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+def seed(history: int, live: int, seats: int, users: int, chunk: int = 50000):
+    from sqlalchemy import insert
+    from database import Base, engine
+    from models import User, Table, TablePlayer
+    from datetime import datetime, timedelta
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    # Lo storico è più vecchio della soglia di archiviazione
+    old = datetime.utcnow() - timedelta(days=30)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"username": f"bench-{i}", "hashed_password": "x", "balance_micro": 0} for i in range(users)])
+        for start in range(0, history, chunk):
+            ids = range(start + 1, min(start + chunk, history) + 1)
+            conn.execute(insert(Table), [
+                {"id": i, "name": f"table-{i}", "in_game": False, "winner": f"bench-{i % users}", "created_at": old}
+                for i in ids
+            ])
+            conn.execute(insert(TablePlayer), [
+                {"table_id": i, "user_id": (i + s) % users + 1} for i in ids for s in range(seats)
+            ])
+        # I vivi sono gli ultimi creati: metà aperti, metà in gioco
+        conn.execute(insert(Table), [
+            {"id": history + i + 1, "name": f"live-{i}", "in_game": i % 2 == 1} for i in range(live)
+        ])
+        conn.execute(insert(TablePlayer), [
+            {"table_id": history + i + 1, "user_id": (i + s) % users + 1} for i in range(live) for s in range(seats)
+        ])
+
+def measure(runs: int):
+    from database import SessionLocal
+    from poker import list_tables
+    queries = {
+        "open": lambda s: list_tables(s, "open"),
+        "in_game": lambda s: list_tables(s, "in_game"),
+        "open_page_2": lambda s: list_tables(s, "open", after=list_tables(s, "open", limit=1)[0]["table_id"]),
+    }
+    result = {}
+    db = SessionLocal()
+    try:
+        for name, query in queries.items():
+            query(db)  # cache del DB calda
+            samples = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                query(db)
+                samples.append(time.perf_counter() - start)
+            result[name] = round(statistics.median(samples) * 1000, 3)
+    finally:
+        db.close()
+    return result
+
+def hot_rows():
+    from sqlalchemy import func, select
+    from database import SessionLocal
+    from models import Table, TablePlayer
+    db = SessionLocal()
+    try:
+        return {"tables": db.scalar(select(func.count(Table.id))), "table_players": db.scalar(select(func.count(TablePlayer.id)))}
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="sqlite:///./bench.db", help="database da svuotare e seminare")
+    parser.add_argument("--history", type=int, default=1_000_000, help="tavoli conclusi")
+    parser.add_argument("--live", type=int, default=200, help="tavoli aperti o in gioco")
+    parser.add_argument("--seats", type=int, default=2)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=5000, help="tavoli per transazione di archiviazione")
+    args = parser.parse_args()
+    # database.py legge DATABASE_URL all'import: va impostato prima di toccare i moduli dell'app
+    os.environ["DATABASE_URL"] = args.db
+
+    from database import engine
+    from models import Table
+    import archive
+
+    start = time.perf_counter()
+    seed(args.history, args.live, args.seats, args.users)
+    seeded = time.perf_counter() - start
+    live_index = next(index for index in Table.__table__.indexes if index.name == "ix_tables_live")
+
+    results = {}
+    live_index.drop(engine)
+    results["legacy"] = {"hot": hot_rows(), "lobby_ms": measure(args.runs)}
+    live_index.create(engine)
+    results["partial"] = {"hot": hot_rows(), "lobby_ms": measure(args.runs)}
+    start = time.perf_counter()
+    done = archive.archive_all(args.batch, older_than=0)
+    elapsed = time.perf_counter() - start
+    results["archived"] = {"hot": hot_rows(), "lobby_ms": measure(args.runs)}
+
+    print(json.dumps({
+        "db": args.db.split("://", 1)[0],
+        "history": args.history,
+        "live": args.live,
+        "seed_seconds": round(seeded, 1),
+        "archive": {**done, "seconds": round(elapsed, 1), "tables_per_sec": round(done["tables"] / elapsed) if elapsed else None},
+        "results": results,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
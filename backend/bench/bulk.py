@@ -0,0 +1,118 @@
+"""Throughput e memoria di export e import amministrativi (bulk) al crescere delle righe.
+
+Per ogni dimensione in --sizes semina --users utenti e N transazioni, esporta
+le transazioni in NDJSON e CSV su file e le reimporta in un secondo database
+vuoto. Riporta righe/s e, in una seconda corsa, il picco di memoria Python
+(tracemalloc) di ogni passo: con lo streaming il picco resta lo stesso a 100k
+e a 1M righe, mentre `db.query(Transaction).all()` cresce con la tabella
+(colonna all_mb, solo fino a --all-max righe).
+
+ATTENZIONE: i database indicati con --db e --target vengono svuotati e riseminati.
+
+Uso: python -m bench.bulk --db sqlite:///./bench.db --target sqlite:///./bench-import.db --sizes 100000,1000000
+"""
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+def seed(users: int, transactions: int, chunk: int = 50000):
+    from datetime import datetime
+    from sqlalchemy import insert
+    from database import Base, engine
+    from models import User, Transaction
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": i + 1, "username": f"bench-{i}", "hashed_password": "x", "balance_micro": 0} for i in range(users)
+        ])
+        for start in range(0, transactions, chunk):
+            conn.execute(insert(Transaction), [
+                {"id": i + 1, "user_id": i % users + 1, "amount_micro": 1_000_000 + i, "tx_type": "deposit",
+                 "tx_hash": f"0x{i:x}", "created_at": now}
+                for i in range(start, min(start + chunk, transactions))
+            ])
+
+def timed(work):
+    start = time.perf_counter()
+    result = work()
+    return result, time.perf_counter() - start
+
+def peak_mb(work):
+    """Picco di memoria Python di work(), in una corsa a parte: tracemalloc rallenta molto"""
+    tracemalloc.start()
+    try:
+        work()
+        return round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+    finally:
+        tracemalloc.stop()
+
+def export_to(path: str, fmt: str):
+    import bulk
+    with open(path, "wb") as target:
+        for chunk in bulk.export("transactions", fmt):
+            target.write(chunk)
+
+def load_all():
+    from database import SessionLocal
+    from models import Transaction
+    db = SessionLocal()
+    try:
+        return len(db.query(Transaction).all())
+    finally:
+        db.close()
+
+def import_into(target: str, path: str, fmt: str):
+    """Importa path in target: bulk legge SessionLocal, quindi lo si ricollega al database di destinazione"""
+    from sqlalchemy import create_engine
+    from database import Base, SessionLocal, engine_options
+    import bulk
+    engine = create_engine(target, **engine_options(target))
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    source = SessionLocal.kw["bind"]
+    SessionLocal.configure(bind=engine)
+    try:
+        with open(path, encoding="utf-8", newline="") as lines:
+            # Gli utenti non servono: SQLite non verifica le FK senza PRAGMA foreign_keys
+            return bulk.import_lines("transactions", fmt, lines)
+    finally:
+        SessionLocal.configure(bind=source)
+        engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="sqlite:///./bench.db", help="database da svuotare e seminare")
+    parser.add_argument("--target", default="sqlite:///./bench-import.db", help="database da svuotare in cui importare")
+    parser.add_argument("--sizes", default="100000,1000000", help="transazioni da esportare, separate da virgole")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--all-max", type=int, default=1_000_000, help="oltre questo numero di righe non misura .all()")
+    parser.add_argument("--dir", default=".", help="cartella dei file esportati")
+    args = parser.parse_args()
+    # database.py legge DATABASE_URL all'import: va impostato prima di toccare i moduli dell'app
+    os.environ["DATABASE_URL"] = args.db
+
+    steps = []
+    for size in (int(n) for n in args.sizes.split(",") if n):
+        seed(args.users, size)
+        step = {"rows": size}
+        for fmt in ("ndjson", "csv"):
+            path = os.path.join(args.dir, f"bench-transactions.{fmt}")
+            _, elapsed = timed(lambda: export_to(path, fmt))
+            step[f"export_{fmt}"] = {"rows_per_sec": round(size / elapsed), "peak_mb": peak_mb(lambda: export_to(path, fmt)),
+                                     "file_mb": round(os.path.getsize(path) / 2**20, 1)}
+            result, elapsed = timed(lambda: import_into(args.target, path, fmt))
+            step[f"import_{fmt}"] = {"rows_per_sec": round(result["inserted"] / elapsed),
+                                     "peak_mb": peak_mb(lambda: import_into(args.target, path, fmt))}
+            os.remove(path)
+        if size <= args.all_max:
+            step["all_mb"] = peak_mb(load_all)
+        steps.append(step)
+    print(json.dumps({"db": args.db.split("://", 1)[0], "steps": steps}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark dell'avvio a freddo di un worker: tempo e memoria fino alla prima richiesta servibile.
+
+Ogni corsa è un processo Python nuovo che importa la factory, crea l'app,
+esegue lo startup (lifespan) e risponde a una richiesta in-process; riporta
+la mediana dei tempi di ogni fase, la RSS massima e i moduli caricati.
+
+Lo schema va già applicato: il benchmark lancia `python -m migrate` una
+volta prima delle corse, come farebbe il deploy.
+
+Uso: python -m bench.coldstart --db sqlite:///./bench.db --runs 10
+     python -m bench.coldstart --routers monitoring,accounts
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Eseguito in un processo nuovo: niente import prima della prima misura
+WORKER = """
+import time
+t0 = time.perf_counter()
+import asyncio, json, resource, sys
+from app import create_app
+t1 = time.perf_counter()
+app = create_app(%(routers)s)
+t2 = time.perf_counter()
+
+async def serve():
+    import httpx
+    async with app.router.lifespan_context(app):
+        t3 = time.perf_counter()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            await client.get("/stats/events")
+        return t3, time.perf_counter()
+
+t3, t4 = asyncio.run(serve())
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "create_app_ms": (t2 - t1) * 1000,
+    "startup_ms": (t3 - t2) * 1000,
+    "first_request_ms": (t4 - t3) * 1000,
+    "total_ms": (t4 - t0) * 1000,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+}))
+"""
+
+def run(runs: int, routers, env):
+    code = WORKER % {"routers": repr(routers)}
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND, env=env, capture_output=True, text=True, check=True)
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {key: round(statistics.median(s[key] for s in samples), 1) for key in samples[0]}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="sqlite:///./bench.db")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--routers", default=None, help="sottoinsieme di router (default: tutti)")
+    args = parser.parse_args()
+    env = dict(os.environ, DATABASE_URL=args.db)
+    subprocess.run([sys.executable, "-m", "migrate"], cwd=BACKEND, env=env, check=True, capture_output=True)
+    routers = args.routers.split(",") if args.routers else None
+    print(json.dumps({"runs": args.runs, "routers": routers or "all", **run(args.runs, routers, env)}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""Harness di benchmark riproducibile per le API.
+
+Semina un database dedicato (SQLite o Postgres) con utenti, tavoli e tornei,
+poi esegue scenari realistici contro l'app FastAPI in-process (httpx
+ASGITransport) oppure via HTTP contro un uvicorn avviato dal harness.
+Coinbase è sostituito dallo stand-in locale di bench.payouts.
+
+Per ogni scenario riporta req/s, p50/p95/p99, status e statement SQL per
+richiesta (solo in-process). I risultati si salvano in JSON con --out e si
+confrontano con una corsa precedente tramite --baseline.
+
+ATTENZIONE: il database indicato con --db viene svuotato e riseminato.
+
+Uso: python -m bench.harness --db sqlite:///./bench.db --users 2000 --tables 200 --tournaments 20 --out run.json
+     python -m bench.harness --mode http --scenarios lobby,leaderboard --baseline run.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import httpx
+from bench.load import percentile
+from bench.payouts import StandInCoinbase
+
+BENCH_PASSWORD = "bench-password"
+SCENARIOS = ("login_storm", "lobby", "joins", "leaderboard", "fees")
+
+def seed(users: int, tables: int, tournaments: int, seats: int, balance: float):
+    """Ricrea lo schema e inserisce i dati con INSERT multipli; restituisce gli username"""
+    from sqlalchemy import insert
+    from database import Base, engine
+    from models import User, Table, TablePlayer, Tournament, TournamentPlayer
+    from hashing import pwd_context
+    import ledger
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    # Un solo hash bcrypt riusato per tutti: la semina non deve misurare bcrypt
+    hashed = pwd_context.hash(BENCH_PASSWORD)
+    usernames = [f"bench-{i}" for i in range(users)]
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {
+                "username": name,
+                "hashed_password": hashed,
+                "balance_micro": ledger.to_micro(balance),
+                "games_played": rng.randint(0, 200),
+                "games_won": rng.randint(0, 50),
+                "tournaments_played": rng.randint(0, 20),
+                "tournaments_won": rng.randint(0, 5),
+            }
+            for name in usernames
+        ])
+        if tables:
+            # Schema appena ricreato: gli id partono da 1. Metà dei tavoli aperti, metà in gioco
+            conn.execute(insert(Table), [
+                {"name": f"table-{i}", "in_game": i % 2 == 1} for i in range(tables)
+            ])
+            conn.execute(insert(TablePlayer), [
+                {"table_id": t + 1, "user_id": (t * seats + s) % users + 1}
+                for t in range(tables) for s in range(min(seats, users))
+            ])
+        if tournaments:
+            per_tournament = max(1, users // (tournaments * 2))
+            conn.execute(insert(Tournament), [
+                {"name": f"tournament-{i}", "round": 1} for i in range(tournaments)
+            ])
+            conn.execute(insert(TournamentPlayer), [
+                {"tournament_id": t + 1, "user_id": (t * per_tournament + s) % users + 1}
+                for t in range(tournaments) for s in range(min(per_tournament, users))
+            ])
+    return usernames
+
+class StatementCounter:
+    """Conta gli statement SQL eseguiti dai motori sync e async del processo"""
+
+    def __init__(self):
+        self.count = 0
+
+    def install(self):
+        from sqlalchemy import event
+        from database import engine, async_engine
+        for target in (engine, async_engine.sync_engine):
+            event.listen(target, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+def build_requests(name: str, count: int, usernames, tokens, tables: int, rng: random.Random):
+    """Sequenza di (method, path, kwargs) per uno scenario"""
+    def auth(i):
+        return {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+
+    if name == "login_storm":
+        return [
+            ("POST", "/token", {"data": {"username": usernames[i % len(usernames)], "password": BENCH_PASSWORD}})
+            for i in range(count)
+        ]
+    if name == "lobby":
+        return [("GET", "/tables", {"params": {"status": "open"}}) for _ in range(count)]
+    if name == "joins":
+        # I tavoli aperti hanno id dispari (indice pari in seed)
+        open_ids = list(range(1, tables + 1, 2)) or [1]
+        return [
+            ("POST", "/tables/join", {"json": {"table_id": rng.choice(open_ids)}, "headers": auth(i)})
+            for i in range(count)
+        ]
+    if name == "leaderboard":
+        requests = []
+        for i in range(count):
+            if i % 4 == 3:
+                requests.append(("GET", f"/leaderboard/rank/{rng.choice(usernames)}", {}))
+            else:
+                by = ("games_won", "tournaments_won", "usdc_balance")[i % 3]
+                requests.append(("GET", "/leaderboard", {"params": {"by": by}}))
+        return requests
+    if name == "fees":
+        return [("POST", "/pay_game_fee", {"headers": auth(i)}) for i in range(count)]
+    raise ValueError(f"Scenario sconosciuto: {name}")
+
+async def run_scenario(client: httpx.AsyncClient, requests, concurrency: int, counter: StatementCounter = None):
+    latencies, statuses = [], {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(method, path, kwargs):
+        async with semaphore:
+            start = time.perf_counter()
+            r = await client.request(method, path, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+    before = counter.count if counter else None
+    start = time.perf_counter()
+    await asyncio.gather(*(one(*request) for request in requests))
+    elapsed = time.perf_counter() - start
+    result = {
+        "requests": len(requests),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "req_per_sec": round(len(requests) / elapsed, 1),
+        "statuses": statuses,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        # Include anche il lavoro in background (flusher, outbox) avvenuto durante lo scenario
+        "sql_per_request": round((counter.count - before) / len(requests), 2) if counter else None,
+    }
+    return result
+
+async def run_all(client, scenarios, count, concurrency, usernames, tables, counter=None):
+    from auth import create_access_token
+    rng = random.Random(7)
+    tokens = [create_access_token(data={"sub": name}) for name in usernames[:max(concurrency, 100)]]
+    results = {}
+    for name in scenarios:
+        # Il login storm paga bcrypt: poche richieste bastano
+        n = max(1, count // 10) if name == "login_storm" else count
+        requests = build_requests(name, n, usernames, tokens, tables, rng)
+        results[name] = await run_scenario(client, requests, concurrency, counter)
+    return results
+
+async def run_inprocess(args, usernames, coinbase_url):
+    import coinbase
+    import ratelimit
+    from app import create_app
+    app = create_app()
+    coinbase.coinbase_client.base_url = coinbase_url
+    # config può essere già stato letto all'import di bench.payouts: la scelta fatta in main() va applicata qui
+    ratelimit.limiter.enabled = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    counter = StatementCounter()
+    counter.install()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            return await run_all(client, args.scenarios, args.requests, args.concurrency,
+                                 usernames, args.tables, counter)
+
+async def wait_ready(url: str, timeout: float = 30):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while time.perf_counter() < deadline:
+            try:
+                await client.get("/stats/events")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Il server {url} non risponde")
+
+async def run_http(args, usernames, coinbase_url):
+    server = None
+    url = args.url
+    if url is None:
+        url = f"http://127.0.0.1:{args.port}"
+        env = dict(os.environ, DATABASE_URL=args.db, COINBASE_API_URL=coinbase_url)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "--factory", "app:create_app", "--port", str(args.port), "--log-level", "warning"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env
+        )
+    try:
+        await wait_ready(url)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+            return await run_all(client, args.scenarios, args.requests, args.concurrency, usernames, args.tables)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+def compare(before: dict, after: dict):
+    """Variazione percentuale per scenario rispetto a una corsa precedente"""
+    def delta(old, new):
+        if not old or new is None:
+            return None
+        return round((new - old) / old * 100, 1)
+    diff = {}
+    for name, result in after["scenarios"].items():
+        old = before.get("scenarios", {}).get(name)
+        if old:
+            diff[name] = {key: delta(old.get(key), result.get(key))
+                          for key in ("req_per_sec", "p50_ms", "p95_ms", "p99_ms", "sql_per_request")}
+    return diff
+
+async def run(args):
+    usernames = seed(args.users, args.tables, args.tournaments, args.seats, args.balance)
+    stand_in = StandInCoinbase(latency=args.coinbase_latency)
+    coinbase_url = await stand_in.start()
+    try:
+        if args.mode == "inprocess":
+            scenarios = await run_inprocess(args, usernames, coinbase_url)
+        else:
+            scenarios = await run_http(args, usernames, coinbase_url)
+    finally:
+        await stand_in.close()
+    return {
+        "mode": args.mode,
+        "db": args.db.split("://", 1)[0],
+        "seed": {"users": args.users, "tables": args.tables, "tournaments": args.tournaments, "seats": args.seats},
+        "coinbase_requests": stand_in.requests,
+        "scenarios": scenarios,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=("inprocess", "http"), default="inprocess")
+    parser.add_argument("--db", default="sqlite:///./bench.db", help="database da svuotare e seminare")
+    parser.add_argument("--url", help="server già avviato (solo --mode http; deve usare lo stesso --db)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--tables", type=int, default=200)
+    parser.add_argument("--tournaments", type=int, default=20)
+    parser.add_argument("--seats", type=int, default=4)
+    parser.add_argument("--balance", type=float, default=100.0)
+    parser.add_argument("--requests", type=int, default=1000, help="richieste per scenario")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--coinbase-latency", type=float, default=0.02)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--out", help="salva il risultato in JSON")
+    parser.add_argument("--baseline", help="risultato JSON di una corsa precedente da confrontare")
+    args = parser.parse_args()
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"scenario sconosciuto: {name}")
+    # database.py legge DATABASE_URL all'import: va impostato prima di toccare i moduli dell'app
+    os.environ["DATABASE_URL"] = args.db
+    # Tutto il carico arriva da un solo IP: il rate limiting si misura a parte con bench.ratelimit
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    result = asyncio.run(run(args))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            result["vs_baseline"] = compare(json.load(f), result)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
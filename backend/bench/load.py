@@ -0,0 +1,99 @@
+"""Benchmark di carico misto contro un server in esecuzione.
+
+Ogni client alterna letture (/me, /tables, /leaderboard) e scritture
+(/deposit) per una durata fissa. Il risultato si può salvare con --out e
+confrontare con una corsa precedente tramite --baseline, per misurare
+req/s e p99 prima e dopo una modifica (es. handler sync contro async).
+
+Uso: python -m bench.load --url http://127.0.0.1:8000 --clients 50 --seconds 20 --out after.json --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+import httpx
+
+MIX = [
+    ("GET", "/me", None),
+    ("GET", "/tables", None),
+    ("GET", "/leaderboard", None),
+    ("POST", "/deposit", {"amount": 1.0}),
+]
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index] * 1000, 2)
+
+async def register(client: httpx.AsyncClient):
+    username = f"load-{uuid.uuid4().hex[:10]}"
+    response = await client.post("/register", json={"username": username, "password": "bench-password"})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def run(url: str, clients: int, seconds: float):
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        headers = [await register(client) for _ in range(clients)]
+        latencies = {path: [] for _, path, _ in MIX}
+        statuses = {}
+        deadline = time.perf_counter() + seconds
+
+        async def worker(auth: dict, offset: int):
+            step = offset
+            while time.perf_counter() < deadline:
+                method, path, body = MIX[step % len(MIX)]
+                step += 1
+                start = time.perf_counter()
+                r = await client.request(method, path, json=body, headers=auth)
+                latencies[path].append(time.perf_counter() - start)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(auth, i) for i, auth in enumerate(headers)))
+        elapsed = time.perf_counter() - start
+
+    everything = [sample for samples in latencies.values() for sample in samples]
+    return {
+        "clients": clients,
+        "seconds": round(elapsed, 3),
+        "requests": len(everything),
+        "req_per_sec": round(len(everything) / elapsed, 1),
+        "statuses": statuses,
+        "p50_ms": percentile(everything, 50),
+        "p99_ms": percentile(everything, 99),
+        "endpoints": {
+            path: {"count": len(samples), "p50_ms": percentile(samples, 50), "p99_ms": percentile(samples, 99)}
+            for path, samples in latencies.items()
+        },
+    }
+
+def compare(before: dict, after: dict):
+    def delta(key):
+        if not before.get(key) or after.get(key) is None:
+            return None
+        return round((after[key] - before[key]) / before[key] * 100, 1)
+    return {"req_per_sec_pct": delta("req_per_sec"), "p50_pct": delta("p50_ms"), "p99_pct": delta("p99_ms")}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--out", help="salva il risultato in JSON")
+    parser.add_argument("--baseline", help="risultato JSON di una corsa precedente da confrontare")
+    args = parser.parse_args()
+    result = asyncio.run(run(args.url, args.clients, args.seconds))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            result["vs_baseline"] = compare(json.load(f), result)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark di una tempesta di login contro un server in esecuzione.
+
+Misura login/s e latenze mentre un secondo flusso interroga un endpoint
+economico, per verificare che resti reattivo durante il carico bcrypt.
+
+Uso: python -m bench.logins --url http://127.0.0.1:8000 --logins 500 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+import httpx
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index] * 1000, 2)
+
+async def run(url: str, logins: int, concurrency: int, probe_path: str):
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        username, password = f"bench-{uuid.uuid4().hex[:8]}", "bench-password"
+        response = await client.post("/register", json={"username": username, "password": password})
+        response.raise_for_status()
+
+        latencies, statuses, probe_latencies = [], {}, []
+        semaphore = asyncio.Semaphore(concurrency)
+        done = asyncio.Event()
+
+        async def login():
+            async with semaphore:
+                start = time.perf_counter()
+                r = await client.post("/token", data={"username": username, "password": password})
+                latencies.append(time.perf_counter() - start)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+        async def probe():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get(probe_path)
+                probe_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+
+        prober = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await prober
+
+    return {
+        "logins": logins,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "logins_per_sec": round(statuses.get(200, 0) / elapsed, 1),
+        "statuses": statuses,
+        "login_p50_ms": percentile(latencies, 50),
+        "login_p99_ms": percentile(latencies, 99),
+        "probe_path": probe_path,
+        "probe_p50_ms": percentile(probe_latencies, 50),
+        "probe_p99_ms": percentile(probe_latencies, 99),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--logins", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--probe", default="/stats/hash_pool")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.url, args.logins, args.concurrency, args.probe)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Benchmark del matchmaking: tavoli formati al secondo con decine di migliaia di giocatori in coda.
+
+Semina un database dedicato con gli utenti, li mette tutti in coda (su più
+puntate e dimensioni di tavolo) e misura quanto impiega il motore a
+svuotare le code, scrittura in blocco di tavoli e posti inclusa.
+
+ATTENZIONE: il database indicato con --db viene svuotato e riseminato.
+
+Uso: python -m bench.matchmaking --db sqlite:///./bench.db --players 50000 --batch 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import namedtuple
+
+Player = namedtuple("Player", ["id", "username"])
+
+async def run(players: int, batch: int, stakes: int, sizes):
+    from matchmaking import Matchmaker
+    from table_manager import table_manager
+    from bench.load import percentile
+
+    matchmaker = Matchmaker(batch=batch)
+    start = time.perf_counter()
+    for i in range(players):
+        matchmaker.enqueue(Player(i + 1, f"bench-{i}"), stake_micro=(i % stakes) * 1_000_000, size=sizes[i % len(sizes)])
+    enqueue_seconds = time.perf_counter() - start
+    queued = matchmaker.depth()
+
+    rounds, write_times = 0, []
+    start = time.perf_counter()
+    while True:
+        t0 = time.perf_counter()
+        formed = await matchmaker.match_once()
+        if not formed:
+            break
+        write_times.append(time.perf_counter() - t0)
+        rounds += 1
+    elapsed = time.perf_counter() - start
+    return {
+        "players": players,
+        "queues": stakes * len(sizes),
+        "enqueue_per_sec": round(players / enqueue_seconds, 1),
+        "tables_formed": matchmaker.matched,
+        "players_seated": queued - matchmaker.depth(),
+        "left_in_queue": matchmaker.depth(),
+        "seconds": round(elapsed, 3),
+        "tables_per_sec": round(matchmaker.matched / elapsed, 1) if elapsed else None,
+        "batches": rounds,
+        "batch_p50_ms": percentile(write_times, 50),
+        "batch_p99_ms": percentile(write_times, 99),
+        "active_tables": len(table_manager),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="sqlite:///./bench.db", help="database da svuotare e seminare")
+    parser.add_argument("--players", type=int, default=50000)
+    parser.add_argument("--batch", type=int, default=500, help="tavoli per scrittura")
+    parser.add_argument("--stakes", type=int, default=4, help="numero di puntate distinte")
+    parser.add_argument("--sizes", default="2,6,9", help="dimensioni di tavolo richieste")
+    args = parser.parse_args()
+    os.environ["DATABASE_URL"] = args.db
+
+    from bench.harness import seed
+    seed(args.players, 0, 0, 0, 0)
+    sizes = [int(s) for s in args.sizes.split(",")]
+    print(json.dumps(asyncio.run(run(args.players, args.batch, args.stakes, sizes)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Benchmark dei payout Coinbase contro un server HTTP locale che fa da stand-in.
+
+Uso: python -m bench.payouts --payouts 2000 --concurrency 200 --latency 0.05
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from coinbase import CoinbaseClient, PayoutQueue
+
+class StandInCoinbase:
+    """Server HTTP/1.1 keep-alive minimale che risponde come l'API send di Coinbase"""
+
+    def __init__(self, latency: float = 0.0, fail_every: int = 0):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.requests = 0
+        self.connections = 0
+        self.seen_keys = set()
+        self._ids = itertools.count(1)
+        self._server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                body = json.loads(await reader.readexactly(length)) if length else {}
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if self.fail_every and self.requests % self.fail_every == 0:
+                    status, payload = "503 Service Unavailable", {"errors": ["busy"]}
+                else:
+                    self.seen_keys.add(body.get("idem"))
+                    status, payload = "201 Created", {"data": {"id": f"tx-{next(self._ids)}", "status": "completed"}}
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+async def run(payouts: int, concurrency: int, latency: float, fail_every: int, max_connections: int):
+    server = StandInCoinbase(latency, fail_every)
+    base_url = await server.start()
+    client = CoinbaseClient(base_url=base_url, api_key="bench", wallet_id="bench",
+                            max_connections=max_connections, backoff=0.01)
+    queue = PayoutQueue(client)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fee_payment(i):
+        # Ogni coroutine simula una richiesta /pay_game_fee concorrente
+        async with semaphore:
+            return await queue.submit(0.03, f"user{i}", f"bench-{i}")
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(fee_payment(i) for i in range(payouts)))
+    elapsed = time.perf_counter() - start
+    await queue.aclose()
+    await server.close()
+    ok = sum(1 for success, _, _ in results if success)
+    return {
+        "payouts": payouts,
+        "succeeded": ok,
+        "seconds": round(elapsed, 3),
+        "payouts_per_sec": round(payouts / elapsed, 1),
+        "http_requests": server.requests,
+        "tcp_connections": server.connections,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--payouts", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--fail-every", type=int, default=0)
+    parser.add_argument("--max-connections", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.payouts, args.concurrency, args.latency,
+                                     args.fail_every, args.max_connections)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Benchmark di scalabilità orizzontale: req/s con 1, 2, ... N worker.
+
+Per ogni numero di worker semina di nuovo il database (bench.harness.seed),
+avvia i worker come farebbe `python -m serve` e li carica con più processi
+client: ciascuno distribuisce le richieste su tutti i worker in round robin,
+come un bilanciatore senza affinità. Il mix comprende letture (lobby, /me,
+posizione in classifica) e join ai tavoli, che arrivano anche a worker non
+proprietari e vengono inoltrati.
+
+Per ogni corsa riporta req/s, p50/p99, la quota di richieste inoltrate e
+l'efficienza rispetto a un worker (req/s / (N * req/s con 1 worker)). La
+scala lineare richiede almeno N core liberi per i worker più quelli dei
+client: con meno core l'efficienza misura la contesa, non l'app.
+
+Senza Redis i worker usano il bus in memoria: la throughput non cambia, ma
+eventi e invalidazioni non attraversano i processi (--bus redis per averli).
+
+ATTENZIONE: il database indicato con --db viene svuotato e riseminato.
+
+Uso: python -m bench.scaling --db sqlite:///./bench.db --workers 1,2,4 --seconds 10
+     python -m bench.scaling --db postgresql://... --workers 1,2,4,8 --bus redis --client-procs 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import itertools
+import httpx
+from bench.load import percentile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def build_mix(usernames, tokens, tables: int, rng: random.Random):
+    open_ids = list(range(1, tables + 1, 2)) or [1]
+    mix = []
+    for token in tokens:
+        auth = {"Authorization": f"Bearer {token}"}
+        mix.append(("GET", "/tables", {"params": {"status": "open"}}))
+        mix.append(("GET", "/me", {"headers": auth}))
+        mix.append(("GET", f"/leaderboard/rank/{rng.choice(usernames)}", {}))
+        mix.append(("POST", "/tables/join", {"json": {"table_id": rng.choice(open_ids)}, "headers": auth}))
+    return mix
+
+async def drive(urls, mix, concurrency: int, seconds: float):
+    """Ciclo di carico di un processo client: ogni richiesta va al worker successivo"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    clients = [httpx.AsyncClient(base_url=url, timeout=60, limits=limits) for url in urls]
+    latencies, statuses = [], {}
+    turn = itertools.count()
+    deadline = time.perf_counter() + seconds
+
+    async def loop(offset: int):
+        step = offset
+        while time.perf_counter() < deadline:
+            method, path, kwargs = mix[step % len(mix)]
+            client = clients[next(turn) % len(clients)]
+            step += concurrency
+            start = time.perf_counter()
+            r = await client.request(method, path, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(loop(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        await client.aclose()
+    return {"elapsed": elapsed, "statuses": statuses, "latencies": latencies}
+
+def client_main(spec: dict):
+    """Entry point dei processi client: legge la specifica da argv, stampa il risultato in JSON"""
+    from auth import create_access_token
+    rng = random.Random(spec["seed"])
+    tokens = [create_access_token(data={"sub": name}) for name in spec["users"]]
+    mix = build_mix(spec["usernames"], tokens, spec["tables"], rng)
+    rng.shuffle(mix)
+    result = asyncio.run(drive(spec["urls"], mix, spec["concurrency"], spec["seconds"]))
+    print(json.dumps(result))
+
+async def wait_ready(urls, timeout: float = 60):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient() as client:
+        for url in urls:
+            while True:
+                try:
+                    await client.get(url + "/stats/cluster")
+                    break
+                except httpx.TransportError:
+                    if time.perf_counter() > deadline:
+                        raise RuntimeError(f"Il worker {url} non risponde")
+                    await asyncio.sleep(0.2)
+
+async def cluster_stats(urls):
+    async with httpx.AsyncClient() as client:
+        return [(await client.get(url + "/stats/cluster")).json() for url in urls]
+
+def run_step(workers: int, args, env):
+    import serve
+    from bench.harness import seed
+    # Ogni corsa riparte dagli stessi dati: i join delle precedenti non restano nei tavoli
+    usernames = seed(args.users, args.tables, 0, args.seats, 100.0)
+    urls = serve.peers("127.0.0.1", args.port, workers)
+    procs = [serve.spawn(i, urls, "127.0.0.1", args.port, env, quiet=True) for i in range(workers)]
+    try:
+        asyncio.run(wait_ready(urls))
+        clients = []
+        for c in range(args.client_procs):
+            spec = {
+                "urls": urls,
+                "users": usernames[c::args.client_procs][:args.concurrency],
+                "usernames": usernames,
+                "tables": args.tables,
+                "concurrency": args.concurrency,
+                "seconds": args.seconds,
+                "seed": c,
+            }
+            clients.append(subprocess.Popen(
+                [sys.executable, "-m", "bench.scaling", "--client", json.dumps(spec)],
+                cwd=BACKEND, env=env, stdout=subprocess.PIPE, text=True
+            ))
+        results = [json.loads(proc.communicate()[0].strip().splitlines()[-1]) for proc in clients]
+        stats = asyncio.run(cluster_stats(urls))
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait()
+
+    latencies = [sample for r in results for sample in r["latencies"]]
+    statuses = {}
+    for r in results:
+        for status, n in r["statuses"].items():
+            statuses[status] = statuses.get(status, 0) + n
+    elapsed = max(r["elapsed"] for r in results)
+    return {
+        "workers": workers,
+        "requests": len(latencies),
+        "req_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "statuses": statuses,
+        "forwarded": sum(s["forwarded"] for s in stats),
+        "forward_errors": sum(s["forward_errors"] for s in stats),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="sqlite:///./bench.db", help="database da svuotare e seminare")
+    parser.add_argument("--workers", default="1,2,4", help="numeri di worker da provare, separati da virgole")
+    parser.add_argument("--port", type=int, default=8801)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--client-procs", type=int, default=os.cpu_count() or 1, help="processi che generano il carico")
+    parser.add_argument("--concurrency", type=int, default=32, help="richieste in volo per processo client")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--tables", type=int, default=200)
+    parser.add_argument("--seats", type=int, default=4)
+    parser.add_argument("--bus", choices=("memory", "redis"), default="memory")
+    parser.add_argument("--client", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.client:
+        client_main(json.loads(args.client))
+        return
+
+    # database.py legge DATABASE_URL all'import: va impostato prima di seminare
+    os.environ["DATABASE_URL"] = args.db
+    env = dict(os.environ, RATE_LIMIT_ENABLED="false", CLUSTER_BACKEND=args.bus, BCRYPT_ROUNDS="4")
+    steps = [run_step(int(n), args, env) for n in args.workers.split(",") if n]
+    base = steps[0]["req_per_sec"] / steps[0]["workers"]
+    for step in steps:
+        step["efficiency"] = round(step["req_per_sec"] / (step["workers"] * base), 3)
+    print(json.dumps({"db": args.db.split("://", 1)[0], "cpus": os.cpu_count(), "bus": args.bus,
+                      "client_procs": args.client_procs, "steps": steps}, indent=2))
+
+if __name__ == "__main__":
+    main()
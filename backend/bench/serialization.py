@@ -0,0 +1,159 @@
+"""Microbenchmark della serializzazione delle liste: CPU per risposta su 10k righe.
+
+Confronta il percorso precedente (oggetti ORM con selectinload, modelli
+pydantic, jsonable_encoder e json.dumps) con quello attuale (sole colonne
+necessarie, dict costruiti da serialization e orjson) su tavoli, tornei e
+classifica. Il tempo è CPU di processo (time.process_time), query incluse,
+così il confronto non dipende dal carico della macchina.
+
+ATTENZIONE: il database indicato con --db viene svuotato e riseminato.
+
+Uso: python -m bench.serialization --db sqlite:///./bench.db --rows 10000 --page 100
+"""
+import argparse
+import json
+import os
+import time
+from typing import List, Optional
+from pydantic import BaseModel
+
+# Copie dei modelli di risposta: il percorso precedente li istanziava per ogni riga
+class LegacyTableInfo(BaseModel):
+    table_id: int
+    name: str
+    players: List[str]
+    in_game: bool
+    winner: Optional[str] = None
+
+class LegacyTournamentInfo(BaseModel):
+    tournament_id: int
+    name: str
+    round: int
+    players: List[str]
+    eliminated: List[str]
+    winner: Optional[str] = None
+
+class LegacyUserOut(BaseModel):
+    username: str
+    usdc_balance: float
+    games_played: int
+    games_won: int
+    tournaments_played: int
+    tournaments_won: int
+
+def legacy_dumps(data) -> bytes:
+    from fastapi.encoders import jsonable_encoder
+    return json.dumps(jsonable_encoder(data), separators=(",", ":")).encode()
+
+def legacy_tables(db, after, limit):
+    from sqlalchemy.orm import selectinload
+    from models import Table
+    tables = db.query(Table).options(selectinload(Table.players)) \
+        .filter(Table.tournament_id.is_(None), Table.id > after).order_by(Table.id).limit(limit).all()
+    return legacy_dumps([
+        LegacyTableInfo(table_id=t.id, name=t.name, players=[u.username for u in t.players], in_game=t.in_game, winner=t.winner)
+        for t in tables
+    ]), tables[-1].id if tables else None
+
+def legacy_tournaments(db, after, limit):
+    from sqlalchemy.orm import selectinload
+    from models import Tournament
+    tournaments = db.query(Tournament).options(selectinload(Tournament.players), selectinload(Tournament.eliminated)) \
+        .filter(Tournament.id > after).order_by(Tournament.id).limit(limit).all()
+    return legacy_dumps([
+        LegacyTournamentInfo(
+            tournament_id=t.id, name=t.name, round=t.round, players=[u.username for u in t.players],
+            eliminated=[u.username for u in t.eliminated], winner=t.winner
+        )
+        for t in tournaments
+    ]), tournaments[-1].id if tournaments else None
+
+def legacy_users(db, after, limit):
+    from models import User
+    users = db.query(User).filter(User.id > after).order_by(User.id).limit(limit).all()
+    return legacy_dumps([
+        LegacyUserOut(
+            username=u.username, usdc_balance=u.usdc_balance, games_played=u.games_played, games_won=u.games_won,
+            tournaments_played=u.tournaments_played, tournaments_won=u.tournaments_won
+        )
+        for u in users
+    ]), users[-1].id if users else None
+
+def current_tables(db, after, limit):
+    from poker import list_tables
+    from serialization import dumps
+    items = list_tables(db, after=after, limit=limit)
+    return dumps(items), items[-1]["table_id"] if items else None
+
+def current_tournaments(db, after, limit):
+    from tournament import list_tournaments
+    from serialization import dumps
+    items = list_tournaments(db, after=after, limit=limit)
+    return dumps(items), items[-1]["tournament_id"] if items else None
+
+def current_users(db, after, limit):
+    from sqlalchemy import select
+    from models import User
+    from serialization import USER_COLUMNS, user_out, dumps
+    rows = db.execute(select(*USER_COLUMNS).where(User.id > after).order_by(User.id).limit(limit)).all()
+    return dumps([user_out(r) for r in rows]), rows[-1].id if rows else None
+
+PATHS = {
+    "tables": (legacy_tables, current_tables),
+    "tournaments": (legacy_tournaments, current_tournaments),
+    "users": (legacy_users, current_users),
+}
+
+def measure(fetch, limit: int, repeat: int):
+    """Scorre tutte le pagine repeat volte; restituisce (CPU ms per risposta, righe, byte)"""
+    from database import SessionLocal
+    cpu, responses, size = 0.0, 0, 0
+    for _ in range(repeat):
+        db = SessionLocal()
+        try:
+            after = 0
+            while after is not None:
+                start = time.process_time()
+                body, after = fetch(db, after, limit)
+                cpu += time.process_time() - start
+                responses += 1
+                size += len(body)
+                # Come tra una richiesta e l'altra: la sessione non accumula oggetti
+                db.expunge_all()
+        finally:
+            db.close()
+    return round(cpu * 1000 / responses, 3), responses // repeat, size // repeat
+
+def run(limit: int, repeat: int, rows: int):
+    results = {}
+    for name, (legacy, current) in PATHS.items():
+        legacy_ms, pages, legacy_bytes = measure(legacy, limit, repeat)
+        current_ms, _, current_bytes = measure(current, limit, repeat)
+        results[name] = {
+            "pages": pages,
+            "legacy_cpu_ms_per_response": legacy_ms,
+            "cpu_ms_per_response": current_ms,
+            "legacy_cpu_us_per_row": round(legacy_ms * 1000 * pages / rows, 2),
+            "cpu_us_per_row": round(current_ms * 1000 * pages / rows, 2),
+            "speedup": round(legacy_ms / current_ms, 2) if current_ms else None,
+            "legacy_bytes": legacy_bytes,
+            "bytes": current_bytes,
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="sqlite:///./bench.db", help="database da svuotare e seminare")
+    parser.add_argument("--rows", type=int, default=10000, help="righe per tavoli, tornei e utenti")
+    parser.add_argument("--page", type=int, default=100, help="righe per risposta")
+    parser.add_argument("--seats", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    os.environ["DATABASE_URL"] = args.db
+
+    from bench.harness import seed
+    seed(args.rows, args.rows, args.rows, args.seats, 100.0)
+    print(json.dumps({"rows": args.rows, "page": args.page, "results": run(args.page, args.repeat, args.rows)}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Stress test del ledger: prelievi paralleli sullo stesso conto.
+
+Il saldo iniziale copre solo metà dei prelievi: alla fine il saldo deve
+essere esattamente iniziale - riusciti * importo, mai negativo, con una
+Transaction per ogni prelievo riuscito.
+
+Uso: DATABASE_URL=sqlite:///./bench_ledger.db python -m bench.withdrawals --threads 16 --per-thread 200
+"""
+import argparse
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import OperationalError
+from database import SessionLocal, Base, engine
+from models import User, Transaction
+import ledger
+
+def run(threads: int, per_thread: int, amount_micro: int):
+    Base.metadata.create_all(bind=engine)
+    initial = amount_micro * threads * per_thread // 2
+    db = SessionLocal()
+    user = User(username=f"bench-{uuid.uuid4().hex[:8]}", hashed_password="", balance_micro=initial)
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+
+    def worker(_):
+        succeeded = rejected = retries = 0
+        session = SessionLocal()
+        try:
+            for _ in range(per_thread):
+                while True:
+                    try:
+                        ledger.debit(session, user_id, amount_micro, "withdraw")
+                        session.commit()
+                        succeeded += 1
+                    except ledger.InsufficientFunds:
+                        session.rollback()
+                        rejected += 1
+                    except OperationalError:
+                        # SQLite occupato da un altro writer: si riprova lo stesso prelievo
+                        session.rollback()
+                        retries += 1
+                        continue
+                    break
+        finally:
+            session.close()
+        return succeeded, rejected, retries
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(worker, range(threads)))
+    elapsed = time.perf_counter() - start
+
+    succeeded = sum(r[0] for r in results)
+    db = SessionLocal()
+    final = db.query(User.balance_micro).filter(User.id == user_id).scalar()
+    recorded = db.query(Transaction).filter(Transaction.user_id == user_id).count()
+    db.close()
+    expected = initial - succeeded * amount_micro
+    return {
+        "attempts": threads * per_thread,
+        "succeeded": succeeded,
+        "rejected": sum(r[1] for r in results),
+        "retries": sum(r[2] for r in results),
+        "seconds": round(elapsed, 3),
+        "withdrawals_per_sec": round(threads * per_thread / elapsed, 1),
+        "initial_micro": initial,
+        "final_micro": final,
+        "expected_micro": expected,
+        "transactions": recorded,
+        "lost_updates": final != expected or recorded != succeeded or final < 0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--per-thread", type=int, default=200)
+    parser.add_argument("--amount", type=float, default=0.03)
+    args = parser.parse_args()
+    result = run(args.threads, args.per_thread, ledger.to_micro(args.amount))
+    print(json.dumps(result, indent=2))
+    if result["lost_updates"]:
+        raise SystemExit("Aggiornamenti persi: il ledger non è consistente")
+
+if __name__ == "__main__":
+    main()
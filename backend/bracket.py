@@ -0,0 +1,222 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import insert, update, select, exists, and_, case
+from sqlalchemy.orm import Session, lazyload
+from database import SessionLocal
+from models import Table, TablePlayer, Tournament, TournamentPlayer, User
+from events import tournament_event
+from tournament import remaining_players, eliminate
+from settlement import settle_tournaments
+from config import settings
+import asyncio
+import random
+
+TOURNAMENT_TABLE_SIZE = settings.TOURNAMENT_TABLE_SIZE
+BRACKET_INTERVAL = settings.BRACKET_INTERVAL
+BRACKET_WORKERS = settings.BRACKET_WORKERS
+READY_BATCH = 100
+
+def seed_tables(players, size: int = TOURNAMENT_TABLE_SIZE):
+    """Distribuisce i giocatori su ceil(n/size) tavoli, con al più un posto di differenza tra tavoli. O(n)"""
+    count = max(1, -(-len(players) // size))
+    return [players[i::count] for i in range(count)]
+
+def spawn_round(tournament: Tournament, db: Session):
+    """Crea in blocco i tavoli del turno corrente; con un solo superstite chiude il torneo"""
+    remaining = remaining_players(tournament.id, db)
+    if len(remaining) <= 1:
+        if remaining:
+            settle_tournaments([(tournament.id, remaining[0][1])], db)
+        else:
+            db.commit()
+        return 0
+    random.shuffle(remaining)
+    seats = seed_tables(remaining)
+    table_ids = db.scalars(
+        insert(Table).returning(Table.id, sort_by_parameter_order=True),
+        [
+            {
+                "name": f"{tournament.name} R{tournament.round} #{i + 1}",
+                "in_game": True,
+                "tournament_id": tournament.id,
+                "round": tournament.round,
+            }
+            for i in range(len(seats))
+        ]
+    ).all()
+    db.execute(insert(TablePlayer), [
+        {"table_id": table_id, "user_id": user_id}
+        for table_id, players in zip(table_ids, seats) for user_id, _ in players
+    ])
+    db.commit()
+    tournament_event("round", tournament.id, round=tournament.round, tables=len(table_ids), players=len(remaining))
+    return len(table_ids)
+
+def start_bracket(tournament_id: int, db: Session):
+    """Chiude le iscrizioni e genera il primo turno; None se il torneo non è avviabile"""
+    tournament = db.query(Tournament).options(lazyload("*")).filter(Tournament.id == tournament_id).first()
+    if tournament is None or tournament.winner or tournament.started_at:
+        return None
+    entrants = db.query(TournamentPlayer).filter(TournamentPlayer.tournament_id == tournament_id).count()
+    if entrants < 2:
+        return None
+    # UPDATE condizionale: due avvii concorrenti non generano due tabelloni
+    started = db.execute(
+        update(Tournament)
+        .where(Tournament.id == tournament_id, Tournament.started_at.is_(None))
+        .values(started_at=datetime.utcnow()),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    if not started:
+        db.rollback()
+        return None
+    spawn_round(tournament, db)
+    return tournament
+
+def report_matches(results, db: Session):
+    """Registra i vincitori dei tavoli di torneo; gli altri giocatori del tavolo sono eliminati
+
+    results: coppie (table_id, winner_username). Ignora i tavoli già chiusi o
+    con un vincitore non seduto al tavolo. Restituisce (tavoli chiusi, tornei toccati).
+    """
+    winners = dict(results)
+    if not winners:
+        return [], set()
+    tables = db.query(Table.id, Table.tournament_id, Table.round) \
+        .filter(Table.id.in_(list(winners)), Table.tournament_id.isnot(None), Table.winner.is_(None)).all()
+    if not tables:
+        return [], set()
+    seats = defaultdict(dict)
+    for table_id, user_id, username in db.query(TablePlayer.table_id, User.id, User.username) \
+            .join(User, User.id == TablePlayer.user_id) \
+            .filter(TablePlayer.table_id.in_([t.id for t in tables])):
+        seats[table_id][username] = user_id
+
+    valid = {t.id: t for t in tables if winners[t.id] in seats[t.id]}
+    if not valid:
+        return [], set()
+
+    # UPDATE condizionale come in settlement.settle_tables: tra due report
+    # concorrenti dello stesso tavolo solo uno lo chiude ed elimina i perdenti
+    closed = db.execute(
+        update(Table)
+        .where(Table.id.in_(list(valid)), Table.winner.is_(None))
+        .values(winner=case({t: winners[t] for t in valid}, value=Table.id), in_game=False, finished_at=datetime.utcnow())
+        .returning(Table.id),
+        execution_options={"synchronize_session": False}
+    ).scalars().all()
+    if not closed:
+        db.rollback()
+        return [], set()
+
+    losers = defaultdict(list)
+    for table_id in closed:
+        _, tournament_id, round = valid[table_id]
+        losers[(tournament_id, round)].extend(u for name, u in seats[table_id].items() if name != winners[table_id])
+    for (tournament_id, round), user_ids in losers.items():
+        eliminate(tournament_id, round, user_ids, db)
+    db.commit()
+
+    for table_id in closed:
+        tournament_event("match", valid[table_id].tournament_id, table_id=table_id, winner=winners[table_id])
+    return closed, {valid[table_id].tournament_id for table_id in closed}
+
+def ready_tournaments(db: Session, limit: int = READY_BATCH):
+    """Tornei avviati il cui turno corrente non ha più tavoli aperti, con una sola query"""
+    open_tables = exists().where(and_(
+        Table.tournament_id == Tournament.id,
+        Table.round == Tournament.round,
+        Table.winner.is_(None)
+    ))
+    return db.scalars(
+        select(Tournament.id)
+        .where(Tournament.started_at.isnot(None), Tournament.winner.is_(None), ~open_tables)
+        .order_by(Tournament.id)
+        .limit(limit)
+    ).all()
+
+def advance(tournament_id: int):
+    """Passa al turno successivo; gira in un thread con una sessione propria"""
+    db = SessionLocal()
+    try:
+        tournament = db.query(Tournament).options(lazyload("*")).filter(Tournament.id == tournament_id).first()
+        if tournament is None or tournament.winner:
+            return False
+        # Il round atteso fa da guardia: un solo worker avanza lo stesso turno
+        advanced = db.execute(
+            update(Tournament)
+            .where(Tournament.id == tournament_id, Tournament.round == tournament.round, Tournament.winner.is_(None))
+            .values(round=Tournament.round + 1),
+            execution_options={"synchronize_session": False}
+        ).rowcount
+        if not advanced:
+            db.rollback()
+            return False
+        tournament.round += 1
+        spawn_round(tournament, db)
+        return True
+    finally:
+        db.close()
+
+class BracketScheduler:
+    """Avanza in background i tornei con il turno concluso, più tornei in parallelo"""
+
+    def __init__(self, interval: float = BRACKET_INTERVAL, workers: int = BRACKET_WORKERS):
+        self.interval = interval
+        self.workers = workers
+        self.advanced = 0
+        self._task = None
+        self._wake = None
+
+    def _ready(self):
+        db = SessionLocal()
+        try:
+            return ready_tournaments(db)
+        finally:
+            db.close()
+
+    async def tick(self):
+        ready = await asyncio.to_thread(self._ready)
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def run(tournament_id):
+            async with semaphore:
+                return await asyncio.to_thread(advance, tournament_id)
+
+        results = await asyncio.gather(*(run(t) for t in ready), return_exceptions=True)
+        advanced = sum(1 for r in results if r is True)
+        self.advanced += advanced
+        if advanced and len(ready) == READY_BATCH:
+            # Altri tornei possono essere pronti: niente attesa al prossimo giro
+            self.wake()
+        return advanced
+
+    def wake(self):
+        """Chiamata dopo report_matches: non aspetta il prossimo intervallo"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.tick()
+            except Exception:
+                # Nessun avanzamento perso: al prossimo giro la query li ritrova
+                pass
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+bracket_scheduler = BracketScheduler()
@@ -0,0 +1,240 @@
+"""Export in streaming e import a blocchi di utenti, saldi e transazioni.
+
+L'export legge con yield_per (cursore lato server su PostgreSQL, cursore
+pigro su SQLite) e serializza un blocco di EXPORT_BATCH righe alla volta in
+NDJSON o CSV: la memoria non dipende dal numero di righe. L'import legge
+il flusso un record alla volta (il CSV passa intero da csv.reader, quindi un
+campo tra virgolette può contenere a capo) e inserisce blocchi di
+IMPORT_BATCH righe con un INSERT executemany, una transazione per blocco.
+
+Gli id vengono conservati e le righe con un id già presente saltate: un
+import interrotto si riprende rilanciandolo sullo stesso file. Gli importi
+restano interi in micro-USDC, senza arrotondamenti. Gli utenti vanno
+importati prima delle loro transazioni; le transazioni con id già coperto
+dai rollup (history) non entrano nelle statistiche giornaliere, quindi
+vanno importate in un database nuovo.
+
+Uso: python -m bulk export users --output users.ndjson
+     python -m bulk export transactions --format csv --after 1000000 > transactions.csv
+     python -m bulk import users users.ndjson
+     python -m bulk import transactions transactions.csv
+"""
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import select, insert, text
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import User, Transaction
+from config import settings
+import argparse
+import csv
+import io
+import sys
+import time
+import orjson
+import metrics
+
+EXPORT_BATCH = settings.EXPORT_BATCH
+IMPORT_BATCH = settings.IMPORT_BATCH
+
+# kind -> (modello, colonne nell'ordine dell'export)
+KINDS = {
+    "users": (User, ("id", "username", "hashed_password", "balance_micro", "games_played", "games_won",
+                     "tournaments_played", "tournaments_won", "created_at")),
+    "balances": (User, ("id", "username", "balance_micro")),
+    "transactions": (Transaction, ("id", "user_id", "amount_micro", "tx_type", "tx_hash", "created_at")),
+}
+# balances è una vista ridotta di users per le riconciliazioni: non si importa
+IMPORT_KINDS = ("users", "transactions")
+FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def format_for(path: str):
+    return "csv" if path.endswith(".csv") else "ndjson"
+
+# ========== EXPORT ==========
+
+def _ndjson(fields, rows):
+    return b"".join(orjson.dumps(dict(zip(fields, row))) + b"\n" for row in rows)
+
+def _csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerows([value.isoformat() if isinstance(value, datetime) else value for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+def export(kind: str, fmt: str = "ndjson", after: int = None, batch: int = EXPORT_BATCH):
+    """Righe di kind per id crescente, un bytes per blocco; after riprende dopo l'ultimo id ricevuto
+
+    Apre una sessione propria e la tiene per tutto l'export: una sola query,
+    quindi una fotografia coerente anche mentre l'app scrive.
+    """
+    model, fields = KINDS[kind]
+    stmt = select(*(getattr(model, field) for field in fields)).order_by(model.id)
+    if after is not None:
+        stmt = stmt.where(model.id > after)
+    db = SessionLocal()
+    try:
+        if fmt == "csv":
+            yield _csv([fields])
+        result = db.execute(stmt.execution_options(yield_per=batch))
+        for rows in result.partitions():
+            yield _ndjson(fields, rows) if fmt == "ndjson" else _csv(rows)
+            metrics.bulk_rows.inc(len(rows), operation="export", kind=kind)
+    finally:
+        db.close()
+
+# ========== IMPORT ==========
+
+def _converter(column):
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat
+    return python_type
+
+class Parser:
+    """Converte le righe di testo di un export nei dict da inserire; la prima riga CSV è l'intestazione"""
+
+    def __init__(self, kind: str, fmt: str):
+        model, self.fields = KINDS[kind]
+        self.fmt = fmt
+        self.convert = {field: _converter(model.__table__.c[field]) for field in self.fields}
+        self.header = None
+        self.line = 0
+
+    def _records(self, lines):
+        if self.fmt == "ndjson":
+            for line in lines:
+                self.line += 1
+                if line.strip():
+                    yield orjson.loads(line)
+            return
+        # Le righe arrivano con il loro a capo: csv.reader ricompone i campi che ne contengono
+        reader = csv.reader(lines, strict=True)
+        try:
+            for values in reader:
+                self.line = reader.line_num
+                if not values:
+                    continue
+                if self.header is None:
+                    self.header = values
+                    missing = set(self.fields) - set(values)
+                    if missing:
+                        raise ValueError(f"colonne mancanti: {', '.join(sorted(missing))}")
+                    continue
+                yield dict(zip(self.header, values))
+        finally:
+            # Anche su un errore di csv.reader, che non arriva al corpo del ciclo
+            self.line = reader.line_num
+
+    def _row(self, data: dict):
+        row = {}
+        for field in self.fields:
+            if field not in data:
+                raise ValueError(f"manca il campo {field}")
+            value = data[field]
+            # Nel CSV il valore vuoto è NULL
+            row[field] = None if value is None or value == "" else self.convert[field](value)
+        return row
+
+    def rows(self, lines):
+        """dict delle righe di un export, senza intestazione e righe vuote; ValueError alla prima non valida"""
+        try:
+            for data in self._records(lines):
+                yield self._row(data)
+        except (ValueError, TypeError, csv.Error) as e:
+            raise ValueError(f"riga {self.line}: {e}") from e
+
+def batches(rows, size: int = IMPORT_BATCH):
+    """Liste di al più size righe, lette dall'iteratore solo quando servono"""
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+def import_batch(db: Session, kind: str, rows):
+    """Inserisce le righe con un id nuovo; restituisce (id inseriti, righe saltate). Il commit lo fa il chiamante"""
+    model, _ = KINDS[kind]
+    existing = set(db.scalars(select(model.id).where(model.id.in_([row["id"] for row in rows]))))
+    new = [row for row in rows if row["id"] not in existing]
+    if new:
+        db.execute(insert(model), new)
+    metrics.bulk_rows.inc(len(new), operation="import", kind=kind)
+    return [row["id"] for row in new], len(rows) - len(new)
+
+def sync_sequence(db: Session, kind: str):
+    """Con id espliciti la sequenza di PostgreSQL resta indietro: la riallinea al massimo id"""
+    if db.bind.dialect.name != "postgresql":
+        return
+    table = KINDS[kind][0].__tablename__
+    db.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT COALESCE(MAX(id), 1) FROM {table}))"))
+
+def summary(kind: str, inserted: int, skipped: int, elapsed: float):
+    rows = inserted + skipped
+    return {"kind": kind, "inserted": inserted, "skipped": skipped, "seconds": round(elapsed, 3),
+            "rows_per_sec": round(rows / elapsed) if elapsed else None}
+
+def import_lines(kind: str, fmt: str, lines, batch: int = IMPORT_BATCH):
+    """Importa le righe di testo di un export (con il loro a capo, come da un file) a blocchi di batch righe"""
+    parser = Parser(kind, fmt)
+    inserted = skipped = 0
+    start = time.perf_counter()
+    db = SessionLocal()
+    try:
+        for rows in batches(parser.rows(lines), batch):
+            ids, n = import_batch(db, kind, rows)
+            db.commit()
+            inserted, skipped = inserted + len(ids), skipped + n
+        sync_sequence(db, kind)
+        db.commit()
+    finally:
+        db.close()
+    return summary(kind, inserted, skipped, time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    out = commands.add_parser("export", help="scrive le righe su --output o sullo stdout")
+    out.add_argument("kind", choices=tuple(KINDS))
+    out.add_argument("--format", choices=FORMATS, help="default: dall'estensione di --output, altrimenti ndjson")
+    out.add_argument("--output", default="-")
+    out.add_argument("--after", type=int, help="riprende dopo questo id")
+    out.add_argument("--batch", type=int, default=EXPORT_BATCH)
+    into = commands.add_parser("import", help="legge un export da file o dallo stdin (-)")
+    into.add_argument("kind", choices=IMPORT_KINDS)
+    into.add_argument("input")
+    into.add_argument("--format", choices=FORMATS, help="default: dall'estensione del file, altrimenti ndjson")
+    into.add_argument("--batch", type=int, default=IMPORT_BATCH)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        fmt = args.format or format_for(args.output)
+        target = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        rows = 0
+        start = time.perf_counter()
+        try:
+            for chunk in export(args.kind, fmt, args.after, args.batch):
+                target.write(chunk)
+                rows += chunk.count(b"\n")
+        finally:
+            if target is not sys.stdout.buffer:
+                target.close()
+        elapsed = time.perf_counter() - start
+        rows -= fmt == "csv"  # intestazione
+        # Il riepilogo va sullo stderr: lo stdout può essere l'export stesso
+        print(f"{rows} righe esportate in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} righe/s)", file=sys.stderr)
+    else:
+        fmt = args.format or format_for(args.input)
+        source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8", newline="")
+        try:
+            result = import_lines(args.kind, fmt, source, args.batch)
+        except ValueError as e:
+            # I blocchi precedenti sono committati: corretto il file, si rilancia
+            sys.exit(f"import interrotto, {e}")
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        print(f"{result['inserted']} righe importate, {result['skipped']} già presenti, "
+              f"in {result['seconds']:.1f}s ({result['rows_per_sec'] or 0} righe/s)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
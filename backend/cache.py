@@ -0,0 +1,180 @@
+from collections import OrderedDict
+from threading import Lock, get_ident
+from config import settings
+from metrics import cache_requests
+from cluster import cluster
+import hashlib
+import time
+
+CACHE_BACKEND = settings.CACHE_BACKEND
+CACHE_TTL = settings.CACHE_TTL
+CACHE_MAX_ENTRIES = settings.CACHE_MAX_ENTRIES
+REDIS_URL = settings.REDIS_URL
+
+# Namespace invalidato da ciascuna famiglia di eventi ("table.join" -> "tables")
+EVENT_NAMESPACES = {"table": "tables", "tournament": "tournaments"}
+
+class MemoryBackend:
+    """LRU in-process con scadenza: valori bytes, versioni dei namespace in un dict"""
+
+    def __init__(self, maxsize: int = CACHE_MAX_ENTRIES):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = Lock()
+
+    async def version(self, namespace: str):
+        return self._versions.get(namespace, 0)
+
+    def bump(self, namespace: str):
+        # Sincrona: l'invalidazione è visibile prima che la mutazione risponda
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+    async def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def size(self):
+        return len(self._entries)
+
+class RedisBackend:
+    """Backend condiviso tra processi su un server compatibile Redis (GET, SET EX, INCR)
+
+    client: un client con l'interfaccia di redis.asyncio; se omesso si usa REDIS_URL.
+    """
+
+    def __init__(self, client=None, url: str = REDIS_URL, prefix: str = "lisprocoin:cache:"):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self._loop = None
+        self._loop_thread = None
+        self._pending = set()
+
+    def bind(self, loop):
+        self._loop = loop
+        self._loop_thread = get_ident()
+
+    async def version(self, namespace: str):
+        value = await self.client.get(f"{self.prefix}v:{namespace}")
+        return int(value) if value else 0
+
+    def bump(self, namespace: str):
+        # Le mutazioni girano anche nei thread: l'INCR viene schedulato sul loop
+        if self._loop is None:
+            return
+        if get_ident() == self._loop_thread:
+            self._spawn(namespace)
+        else:
+            self._loop.call_soon_threadsafe(self._spawn, namespace)
+
+    def _spawn(self, namespace: str):
+        task = self._loop.create_task(self.client.incr(f"{self.prefix}v:{namespace}"))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def get(self, key: str):
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+
+    def size(self):
+        return None
+
+class ResponseCache:
+    """JSON già serializzato per endpoint e pagina, con ETag e invalidazione per namespace
+
+    Ogni namespace ha una versione che entra nella chiave: invalidare significa
+    incrementarla, le voci vecchie non vengono più lette e scadono da sole.
+    """
+
+    def __init__(self, backend, ttl: float = CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def bind(self, loop):
+        if hasattr(self.backend, "bind"):
+            self.backend.bind(loop)
+
+    def invalidate(self, namespace: str):
+        self.backend.bump(namespace)
+        # Con Redis la versione è già condivisa; le LRU degli altri worker vanno avvisate
+        if isinstance(self.backend, MemoryBackend):
+            cluster.broadcast("cache", namespace=namespace)
+
+    def on_remote(self, message: dict):
+        self.backend.bump(message["namespace"])
+
+    def on_event(self, event: dict):
+        # Gli eventi arrivano già a tutti i worker: l'invalidazione resta locale
+        namespace = EVENT_NAMESPACES.get(event["type"].split(".", 1)[0])
+        if namespace is not None:
+            self.backend.bump(namespace)
+
+    @staticmethod
+    def etag(body: bytes):
+        return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+    async def lookup(self, namespace: str, key: str):
+        """Restituisce (versione, etag, body); etag e body sono None se la voce manca"""
+        version = await self.backend.version(namespace)
+        raw = await self.backend.get(f"{namespace}:{version}:{key}")
+        if raw is None:
+            return version, None, None
+        etag, _, body = raw.partition(b" ")
+        return version, etag.decode(), body
+
+    async def store(self, namespace: str, key: str, version: int, body: bytes):
+        etag = self.etag(body)
+        # La versione letta prima di costruire la risposta: se nel frattempo è cambiata la voce è già orfana
+        await self.backend.set(f"{namespace}:{version}:{key}", etag.encode() + b" " + body, self.ttl)
+        return etag
+
+    def record(self, namespace: str, result: str):
+        if result == "hit":
+            self.hits += 1
+        elif result == "miss":
+            self.misses += 1
+        else:
+            self.not_modified += 1
+        cache_requests.inc(namespace=namespace, result=result)
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.not_modified
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": self.backend.size(),
+            "hits": self.hits,
+            "not_modified": self.not_modified,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.not_modified) / lookups, 4) if lookups else None,
+        }
+
+def make_backend(name: str = CACHE_BACKEND):
+    if name == "redis":
+        return RedisBackend()
+    return MemoryBackend()
+
+response_cache = ResponseCache(make_backend())
@@ -0,0 +1,348 @@
+"""Modalità a più worker: bus condiviso tra processi e proprietà dei tavoli per table_id.
+
+Ogni worker conosce l'indirizzo di tutti gli altri (CLUSTER_PEERS, nell'ordine
+degli id) e il proprio WORKER_ID. Lo stato caldo di un tavolo vive solo sul
+worker table_id % N: le operazioni su un tavolo arrivate a un altro worker
+vengono inoltrate al proprietario, quindi davanti ai worker basta un
+bilanciatore qualunque. Le code di matchmaking vivono sul worker 0.
+
+Eventi, invalidazioni della cache e aggiornamenti della classifica passano dal
+bus: MemoryBus nel processo singolo e nei test, RedisBus tra processi.
+"""
+from collections import OrderedDict
+from threading import Lock, get_ident
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from config import settings
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import time
+
+CLUSTER_BACKEND = settings.CLUSTER_BACKEND
+CLUSTER_PEERS = [url.rstrip("/") for url in settings.CLUSTER_PEERS.split(",") if url]
+WORKER_ID = settings.WORKER_ID
+FORWARD_TIMEOUT = settings.CLUSTER_FORWARD_TIMEOUT
+REDIS_URL = settings.REDIS_URL
+CLUSTER_SECRET = (settings.CLUSTER_SECRET or settings.SECRET_KEY).encode()
+FORWARD_MAX_AGE = settings.CLUSTER_FORWARD_MAX_AGE
+
+logger = logging.getLogger("lisprocoin.cluster")
+
+# Worker che tiene le code di matchmaking: i gruppi si formano in un solo processo
+MATCHMAKING_WORKER = 0
+# Le richieste inoltrate lo portano, firmato: chi le riceve le serve senza inoltrarle di nuovo.
+# Senza firma valida un client potrebbe farsi servire da un worker non proprietario.
+# Formato origine:destinazione:timestamp:nonce:firma; ogni firma vale una volta sola
+FORWARDED_HEADER = "x-cluster-forwarded"
+# Esito della verifica salvato nello scope: il nonce si consuma al primo controllo
+TRUSTED_SCOPE_KEY = "cluster.trusted"
+# IP del client originale, considerato solo sulle richieste con firma valida
+CLIENT_IP_HEADER = "x-cluster-client-ip"
+FORWARD_HEADERS = ("authorization", "content-type", "idempotency-key", "x-admin-token", "if-none-match")
+# Header della risposta del proprietario restituiti al client
+RESPONSE_HEADERS = ("retry-after", "etag", "cache-control", "idempotent-replayed")
+
+def sign(origin: int, target: int, timestamp: str, nonce: str, method: str, path: str):
+    message = f"{origin}|{target}|{timestamp}|{nonce}|{method}|{path}".encode()
+    return hmac.new(CLUSTER_SECRET, message, hashlib.sha256).hexdigest()
+
+def forwarded_header(origin: int, target: int, method: str, path: str):
+    timestamp, nonce = str(int(time.time())), secrets.token_hex(16)
+    return f"{origin}:{target}:{timestamp}:{nonce}:{sign(origin, target, timestamp, nonce, method, path)}"
+
+class NonceCache:
+    """Nonce delle firme accettate, ricordati finché la loro firma può essere ancora valida"""
+
+    def __init__(self, max_age: float):
+        self.max_age = max_age
+        self._seen = OrderedDict()
+        self._lock = Lock()
+
+    def add(self, nonce: str, now: float):
+        """False se il nonce è già stato usato"""
+        with self._lock:
+            # Il timestamp è accettato fino a max_age nel futuro: il nonce va ricordato il doppio
+            while self._seen and next(iter(self._seen.values())) < now - 2 * self.max_age:
+                self._seen.popitem(last=False)
+            if nonce in self._seen:
+                return False
+            self._seen[nonce] = now
+            return True
+
+    def __len__(self):
+        return len(self._seen)
+
+class MemoryBus:
+    """Bus in-process: i messaggi arrivano subito, nello stesso thread, a tutti gli iscritti"""
+
+    def __init__(self):
+        self._handlers = []
+
+    def bind(self, loop):
+        pass
+
+    def subscribe(self, handler):
+        self._handlers.append(handler)
+
+    def publish(self, message: dict):
+        for handler in list(self._handlers):
+            handler(message)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+class RedisBus:
+    """Pub/sub tra processi su un canale Redis; i messaggi viaggiano come JSON
+
+    client: un client con l'interfaccia di redis.asyncio; se omesso si usa REDIS_URL.
+    La consegna è best effort: durante una disconnessione i messaggi vanno persi
+    e i client in tempo reale si risincronizzano come dopo un distacco.
+    """
+
+    def __init__(self, client=None, url: str = REDIS_URL, channel: str = "lisprocoin:cluster"):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self.client = client
+        self.channel = channel
+        self.errors = 0
+        self._handlers = []
+        self._loop = None
+        self._loop_thread = None
+        self._pending = set()
+        self._pubsub = None
+        self._task = None
+
+    def bind(self, loop):
+        self._loop = loop
+        self._loop_thread = get_ident()
+
+    def subscribe(self, handler):
+        self._handlers.append(handler)
+
+    def publish(self, message: dict):
+        # Thread-safe come Hub.publish: il PUBLISH parte sempre dal loop
+        if self._loop is None:
+            return
+        data = json.dumps(message, separators=(",", ":"))
+        if get_ident() == self._loop_thread:
+            self._spawn(data)
+        else:
+            self._loop.call_soon_threadsafe(self._spawn, data)
+
+    def _spawn(self, data: str):
+        task = self._loop.create_task(self.client.publish(self.channel, data))
+        self._pending.add(task)
+        task.add_done_callback(self._done)
+
+    def _done(self, task):
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    async def _listen(self):
+        while True:
+            try:
+                if self._pubsub is None:
+                    self._pubsub = self.client.pubsub()
+                    await self._pubsub.subscribe(self.channel)
+                async for message in self._pubsub.listen():
+                    if message["type"] == "message":
+                        self._dispatch(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Connessione persa: ci si riabbona dopo una pausa
+                self.errors += 1
+                pubsub, self._pubsub = self._pubsub, None
+                if pubsub is not None:
+                    await asyncio.gather(pubsub.aclose(), return_exceptions=True)
+                await asyncio.sleep(1)
+
+    def _dispatch(self, message: dict):
+        for handler in self._handlers:
+            try:
+                handler(message)
+            except Exception:
+                self.errors += 1
+
+    async def start(self):
+        # Iscrizione prima di servire richieste: nessun evento perso all'avvio
+        self._pubsub = self.client.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self._task = asyncio.get_running_loop().create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._pending, return_exceptions=True)
+            self._task = None
+        if self._pubsub is not None:
+            await asyncio.gather(self._pubsub.aclose(), return_exceptions=True)
+            self._pubsub = None
+
+class Cluster:
+    """Questo worker, i suoi peer e il bus: chi possiede cosa e come raggiungerlo"""
+
+    def __init__(self, bus, peers=CLUSTER_PEERS, worker_id: int = WORKER_ID, timeout: float = FORWARD_TIMEOUT,
+                 max_age: float = FORWARD_MAX_AGE):
+        self.bus = bus
+        self.peers = list(peers)
+        self.worker_id = worker_id
+        self.timeout = timeout
+        self.max_age = max_age
+        self.sent = 0
+        self.received = 0
+        self.forwarded = 0
+        self.forward_errors = 0
+        self.rejected = 0
+        self._nonces = NonceCache(max_age)
+        self._handlers = {}
+        self._client = None
+        bus.subscribe(self._receive)
+
+    @property
+    def size(self):
+        return max(1, len(self.peers))
+
+    @property
+    def enabled(self):
+        return len(self.peers) > 1
+
+    def owner(self, table_id: int):
+        return table_id % self.size
+
+    def owns(self, table_id: int):
+        return self.owner(table_id) == self.worker_id
+
+    def on(self, kind: str, handler):
+        """handler(message) riceve i messaggi di tipo kind pubblicati dagli altri worker"""
+        self._handlers[kind] = handler
+
+    def broadcast(self, kind: str, **fields):
+        """Pubblica agli altri worker; nel processo singolo non c'è nessuno da avvisare"""
+        if not self.enabled:
+            return
+        self.sent += 1
+        self.bus.publish({"kind": kind, "origin": self.worker_id, **fields})
+
+    def _receive(self, message: dict):
+        if message.get("origin") == self.worker_id:
+            return
+        handler = self._handlers.get(message.get("kind"))
+        if handler is not None:
+            self.received += 1
+            handler(message)
+
+    def trusted(self, request: Request):
+        """True se la richiesta arriva da un altro worker del cluster, con firma valida, recente e mai vista"""
+        if TRUSTED_SCOPE_KEY not in request.scope:
+            request.scope[TRUSTED_SCOPE_KEY] = self._verify(request)
+        return request.scope[TRUSTED_SCOPE_KEY]
+
+    def _verify(self, request: Request):
+        header = request.headers.get(FORWARDED_HEADER)
+        if header is None:
+            return False
+        parts = header.split(":")
+        if len(parts) != 5 or not all(part.isdigit() for part in parts[:3]):
+            self.rejected += 1
+            return False
+        origin, target, timestamp, nonce, signature = parts
+        now = time.time()
+        valid = (
+            int(target) == self.worker_id
+            and abs(now - int(timestamp)) <= self.max_age
+            and hmac.compare_digest(signature, sign(int(origin), int(target), timestamp, nonce, request.method, request.url.path))
+            # Per ultimo: solo una firma autentica consuma il nonce
+            and self._nonces.add(nonce, now)
+        )
+        if not valid:
+            self.rejected += 1
+        return valid
+
+    def local(self, request: Request, worker: int):
+        """True se la richiesta va servita qui: worker giusto, o già inoltrata da un altro"""
+        return worker == self.worker_id or not self.enabled or self.trusted(request)
+
+    async def forward(self, worker: int, request: Request, content: bytes = None):
+        """Ripete la richiesta sul worker indicato e ne restituisce la risposta così com'è"""
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        from ratelimit import client_ip
+        headers = {name: request.headers[name] for name in FORWARD_HEADERS if name in request.headers}
+        headers[FORWARDED_HEADER] = forwarded_header(self.worker_id, worker, request.method, request.url.path)
+        headers[CLIENT_IP_HEADER] = client_ip(request)
+        if content is None:
+            content = await request.body()
+        try:
+            response = await self._client.request(
+                request.method, self.peers[worker] + request.url.path,
+                params=request.query_params.multi_items(), content=content, headers=headers
+            )
+        except Exception:
+            self.forward_errors += 1
+            return JSONResponse(status_code=503, content={"detail": "Worker del tavolo non raggiungibile, riprova"},
+                                headers={"Retry-After": "1"})
+        self.forwarded += 1
+        passed = {name: response.headers[name] for name in RESPONSE_HEADERS if name in response.headers}
+        return Response(response.content, status_code=response.status_code,
+                        media_type=response.headers.get("content-type"), headers=passed)
+
+    def bind(self, loop):
+        self.bus.bind(loop)
+
+    async def start(self):
+        for problem in config_warnings(self):
+            logger.warning(problem)
+        await self.bus.start()
+
+    async def stop(self):
+        await self.bus.stop()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self):
+        return {
+            "worker_id": self.worker_id,
+            "workers": self.size,
+            "bus": type(self.bus).__name__,
+            "sent": self.sent,
+            "received": self.received,
+            "forwarded": self.forwarded,
+            "forward_errors": self.forward_errors,
+            "forward_rejected": self.rejected,
+            "bus_errors": getattr(self.bus, "errors", 0),
+        }
+
+def make_bus(name: str = CLUSTER_BACKEND):
+    if name == "redis":
+        return RedisBus()
+    return MemoryBus()
+
+def config_warnings(cluster: Cluster):
+    """Configurazioni che con più worker fanno divergere lo stato tra i processi"""
+    if not cluster.enabled:
+        return []
+    problems = []
+    if not settings.CLUSTER_SECRET and settings.SECRET_KEY == "supersecretkey":
+        problems.append("CLUSTER_SECRET e SECRET_KEY di default: chiunque può firmare richieste inoltrate")
+    if isinstance(cluster.bus, MemoryBus):
+        problems.append("CLUSTER_BACKEND=memory: eventi e invalidazioni non raggiungono gli altri worker")
+    if settings.RATE_LIMIT_ENABLED and settings.RATE_LIMIT_BACKEND != "redis":
+        problems.append("RATE_LIMIT_BACKEND=memory: ogni worker applica i limiti per conto suo")
+    from database import DATABASE_URL
+    if DATABASE_URL.startswith("sqlite"):
+        problems.append("DATABASE_URL su SQLite: le scritture di tutti i worker passano da un solo file")
+    return problems
+
+cluster = Cluster(make_bus())
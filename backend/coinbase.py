@@ -1,27 +1,56 @@
-import requests
-import os
-import json
+import httpx
+import asyncio
+import random
+import uuid
+from config import settings
+from metrics import coinbase_duration, coinbase_errors
+import time
+
+COINBASE_API_URL = settings.COINBASE_API_URL
+COINBASE_TIMEOUT = settings.COINBASE_TIMEOUT
+COINBASE_MAX_CONNECTIONS = settings.COINBASE_MAX_CONNECTIONS
+COINBASE_MAX_RETRIES = settings.COINBASE_MAX_RETRIES
+COINBASE_BACKOFF = settings.COINBASE_BACKOFF
+PAYOUT_BATCH_WINDOW = settings.PAYOUT_BATCH_WINDOW
+PAYOUT_BATCH_SIZE = settings.PAYOUT_BATCH_SIZE
+
+# Risposte per cui ha senso riprovare: rate limit ed errori temporanei lato Coinbase
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_session = None
+
+def _sync_session():
+    # requests serve solo ai vecchi helper sincroni: importarlo all'avvio costa ~60 ms per worker
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
+
+def _payout_body(amount: float, user_wallet: str, idempotency_key: str):
+    return {
+        "type": "send",
+        "to": user_wallet,
+        "amount": str(amount),
+        "currency": "USDC",
+        "description": "Lisprocoin Game Payout",
+        "idem": idempotency_key
+    }
 
 def send_usdc(amount: float, user_wallet: str):
     """Invia USDC da Coinbase a un wallet utente"""
-    COINBASE_API_KEY = os.getenv("COINBASE_API_KEY")
-    COINBASE_WALLET_ID = os.getenv("COINBASE_WALLET_ID")
-    
-    url = "https://api.coinbase.com/v2/accounts/{}/transactions".format(COINBASE_WALLET_ID)
+    COINBASE_API_KEY = settings.COINBASE_API_KEY
+    COINBASE_WALLET_ID = settings.COINBASE_WALLET_ID
+
+    url = "{}/v2/accounts/{}/transactions".format(COINBASE_API_URL, COINBASE_WALLET_ID)
     headers = {
         "Authorization": f"Bearer {COINBASE_API_KEY}",
         "Content-Type": "application/json"
     }
-    data = {
-        "type": "send",
-        "to": user_wallet,
-        "amount": str(amount),
-        "currency": "USDC",
-        "description": "Lisprocoin Game Payout"
-    }
-    
+    data = _payout_body(amount, user_wallet, uuid.uuid4().hex)
+
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = _sync_session().post(url, headers=headers, json=data, timeout=COINBASE_TIMEOUT)
         if response.status_code == 201:
             tx_data = response.json()
             return True, "Success", tx_data['data']['id']
@@ -31,15 +60,191 @@ def send_usdc(amount: float, user_wallet: str):
 
 def verify_coinbase_payment(tx_hash: str):
     """Verifica una transazione Coinbase (semplificata)"""
-    COINBASE_API_KEY = os.getenv("COINBASE_API_KEY")
-    url = f"https://api.coinbase.com/v2/transactions/{tx_hash}"
+    COINBASE_API_KEY = settings.COINBASE_API_KEY
+    url = f"{COINBASE_API_URL}/v2/transactions/{tx_hash}"
     headers = {"Authorization": f"Bearer {COINBASE_API_KEY}"}
-    
+
     try:
-        response = requests.get(url, headers=headers)
+        response = _sync_session().get(url, headers=headers, timeout=COINBASE_TIMEOUT)
         if response.status_code == 200:
             tx_data = response.json()
             return tx_data['data']['status'] == 'completed'
         return False
     except:
         return False
+
+class CoinbaseClient:
+    """Client Coinbase asincrono con pool keep-alive condiviso, timeout e retry"""
+
+    def __init__(self, base_url: str = None, api_key: str = None, wallet_id: str = None,
+                 max_connections: int = COINBASE_MAX_CONNECTIONS, timeout: float = COINBASE_TIMEOUT,
+                 max_retries: int = COINBASE_MAX_RETRIES, backoff: float = COINBASE_BACKOFF,
+                 transport: httpx.AsyncBaseTransport = None):
+        self.base_url = base_url or COINBASE_API_URL
+        self.api_key = api_key
+        self.wallet_id = wallet_id
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # Trasporto alternativo (es. httpx.MockTransport nei test); None usa la rete
+        self.transport = transport
+        self._client = None
+        self._semaphore = asyncio.Semaphore(max_connections)
+
+    def _http(self):
+        if self._client is None:
+            api_key = self.api_key or settings.COINBASE_API_KEY
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {api_key}"},
+                timeout=self.timeout,
+                transport=self.transport,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        # Il semaforo si lega al loop che lo usa: il prossimo lifespan può girare su un altro
+        self._semaphore = asyncio.Semaphore(self.max_connections)
+
+    async def _request(self, operation: str, method: str, url: str, **kwargs):
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            try:
+                async with self._semaphore:
+                    start = time.perf_counter()
+                    response = await self._http().request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                coinbase_duration.observe(time.perf_counter() - start, operation=operation, outcome="transport_error")
+                coinbase_errors.inc(operation=operation, reason=type(e).__name__)
+                if last:
+                    raise
+            else:
+                coinbase_duration.observe(time.perf_counter() - start, operation=operation, outcome=str(response.status_code))
+                if response.status_code >= 400:
+                    coinbase_errors.inc(operation=operation, reason=str(response.status_code))
+                if response.status_code not in RETRY_STATUS or last:
+                    return response
+                retry_after = response.headers.get("Retry-After")
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+            # Backoff esponenziale con jitter per non sincronizzare i retry
+            await asyncio.sleep(delay * (1 + random.random()))
+            delay *= 2
+
+    async def send_usdc(self, amount: float, user_wallet: str, idempotency_key: str = None):
+        """Invia USDC; la chiave di idempotenza rende sicuri i retry"""
+        wallet_id = self.wallet_id or settings.COINBASE_WALLET_ID
+        data = _payout_body(amount, user_wallet, idempotency_key or uuid.uuid4().hex)
+        try:
+            response = await self._request("send", "POST", f"/v2/accounts/{wallet_id}/transactions", json=data)
+            if response.status_code == 201:
+                tx_data = response.json()
+                return True, "Success", tx_data['data']['id']
+            return False, f"Error {response.status_code}: {response.text}", None
+        except Exception as e:
+            return False, str(e), None
+
+    async def verify_payment(self, tx_hash: str):
+        try:
+            response = await self._request("verify", "GET", f"/v2/transactions/{tx_hash}")
+            if response.status_code == 200:
+                return response.json()['data']['status'] == 'completed'
+            return False
+        except Exception:
+            return False
+
+class PayoutQueue:
+    """Raggruppa i payout che arrivano ravvicinati e li invia insieme sul pool condiviso"""
+
+    def __init__(self, client: CoinbaseClient, window: float = PAYOUT_BATCH_WINDOW,
+                 max_batch: int = PAYOUT_BATCH_SIZE):
+        self.client = client
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = None
+        self._worker = None
+        self._inflight = set()
+
+    def _ensure_worker(self):
+        # La coda si lega al loop che la usa: vive fino ad aclose, che la svuota e la azzera
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            # Se il task è morto si riavvia solo lui: i payout già in coda restano
+            self._worker = asyncio.get_running_loop().create_task(self._run(self._queue))
+
+    async def submit(self, amount: float, user_wallet: str, idempotency_key: str = None):
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((amount, user_wallet, idempotency_key, future))
+        return await future
+
+    async def _run(self, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = [await queue.get()]
+                deadline = loop.time() + self.window
+                while len(batch) < self.max_batch:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                self._dispatch(batch)
+                batch = []
+        finally:
+            # Cancellato a metà raccolta: il blocco già tolto dalla coda parte comunque
+            if batch:
+                self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        task = asyncio.get_running_loop().create_task(self._flush(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _flush(self, batch):
+        results = await asyncio.gather(
+            *(self.client.send_usdc(amount, wallet, key) for amount, wallet, key, _ in batch),
+            return_exceptions=True
+        )
+        for (_, _, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def aclose(self):
+        """Ferma il worker, invia i payout ancora in coda e attende tutti gli invii"""
+        worker, queue = self._worker, self._queue
+        # Azzerati prima di ogni await: un submit successivo riparte con coda e worker nuovi
+        self._worker = self._queue = None
+        if worker is not None:
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions=True)
+        if queue is not None:
+            pending = []
+            while not queue.empty():
+                pending.append(queue.get_nowait())
+            for i in range(0, len(pending), self.max_batch):
+                self._dispatch(pending[i:i + self.max_batch])
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        await self.client.aclose()
+
+coinbase_client = CoinbaseClient()
+payout_queue = PayoutQueue(coinbase_client)
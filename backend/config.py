@@ -0,0 +1,136 @@
+from dotenv import load_dotenv
+import os
+
+# Il .env va caricato prima che qualunque modulo legga la configurazione
+load_dotenv()
+
+class Settings:
+    """Configurazione letta una sola volta all'avvio"""
+
+    def __init__(self):
+        # Applicazione: router da registrare, separati da virgole (vuoto = tutti)
+        self.APP_ROUTERS = os.getenv("APP_ROUTERS", "")
+
+        # Autenticazione
+        self.SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
+        self.ALGORITHM = os.getenv("ALGORITHM", "HS256")
+        self.ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "120"))
+        self.TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+        # bcrypt
+        self.BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+        self.HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+        self.HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "64"))
+
+        # Fee
+        self.REGISTRATION_FEE = float(os.getenv("REGISTRATION_FEE", "20.0"))
+        self.GAME_FEE = float(os.getenv("GAME_FEE", "0.03"))
+        self.TOURNAMENT_FEE = float(os.getenv("TOURNAMENT_FEE", "1.0"))
+
+        # Coinbase
+        self.COINBASE_API_URL = os.getenv("COINBASE_API_URL", "https://api.coinbase.com")
+        self.COINBASE_API_KEY = os.getenv("COINBASE_API_KEY")
+        self.COINBASE_WALLET_ID = os.getenv("COINBASE_WALLET_ID")
+        self.COINBASE_TIMEOUT = float(os.getenv("COINBASE_TIMEOUT", "10"))
+        self.COINBASE_MAX_CONNECTIONS = int(os.getenv("COINBASE_MAX_CONNECTIONS", "20"))
+        self.COINBASE_MAX_RETRIES = int(os.getenv("COINBASE_MAX_RETRIES", "3"))
+        self.COINBASE_BACKOFF = float(os.getenv("COINBASE_BACKOFF", "0.2"))
+        self.PAYOUT_BATCH_WINDOW = float(os.getenv("PAYOUT_BATCH_WINDOW", "0.02"))
+        self.PAYOUT_BATCH_SIZE = int(os.getenv("PAYOUT_BATCH_SIZE", "50"))
+
+        # Outbox dei pagamenti
+        self.OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "4"))
+        self.OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "20"))
+        self.OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "0.5"))
+        self.OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+        self.OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+
+        # Eventi in tempo reale
+        self.EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "256"))
+        self.SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+        # Tavoli attivi in memoria
+        self.TABLE_FLUSH_INTERVAL = float(os.getenv("TABLE_FLUSH_INTERVAL", "0.5"))
+
+        # Classifica
+        self.LEADERBOARD_PAGE_SIZE = int(os.getenv("LEADERBOARD_PAGE_SIZE", "50"))
+        self.LEADERBOARD_MAX_PAGE_SIZE = int(os.getenv("LEADERBOARD_MAX_PAGE_SIZE", "200"))
+
+        # Liste di tavoli e tornei
+        self.LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "50"))
+        self.LIST_MAX_PAGE_SIZE = int(os.getenv("LIST_MAX_PAGE_SIZE", "200"))
+
+        # Archiviazione di tavoli e tornei conclusi
+        self.ARCHIVE_AFTER_HOURS = float(os.getenv("ARCHIVE_AFTER_HOURS", "24"))
+        self.ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "1000"))
+        self.ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "300"))
+
+        # Tabellone dei tornei
+        self.TOURNAMENT_TABLE_SIZE = int(os.getenv("TOURNAMENT_TABLE_SIZE", "6"))
+        self.BRACKET_INTERVAL = float(os.getenv("BRACKET_INTERVAL", "1.0"))
+        self.BRACKET_WORKERS = int(os.getenv("BRACKET_WORKERS", "4"))
+
+        # Matchmaking
+        self.MATCH_INTERVAL = float(os.getenv("MATCH_INTERVAL", "0.05"))
+        self.MATCH_BATCH = int(os.getenv("MATCH_BATCH", "500"))
+        self.MATCH_DEFAULT_SIZE = int(os.getenv("MATCH_DEFAULT_SIZE", "6"))
+        self.MATCH_MAX_SIZE = int(os.getenv("MATCH_MAX_SIZE", "9"))
+        self.MATCH_WAIT_TIMEOUT = float(os.getenv("MATCH_WAIT_TIMEOUT", "25"))
+        # Ticket già assegnati a un tavolo, tenuti per chi interroga lo stato dopo l'assegnazione
+        self.MATCH_RESULTS_KEEP = int(os.getenv("MATCH_RESULTS_KEEP", "10000"))
+
+        # Cache delle risposte di lobby e classifica
+        self.CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # 'memory' o 'redis'
+        self.CACHE_TTL = float(os.getenv("CACHE_TTL", "30"))
+        self.CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2000"))
+        self.REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+        # Rate limiting: regole "nome=richieste/secondi", separate da virgole
+        self.RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+        self.RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # 'memory' o 'redis'
+        self.RATE_LIMIT_RULES = os.getenv(
+            "RATE_LIMIT_RULES", "register=5/60,token=10/60,payments=20/60,leaderboard=60/10")
+        self.RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+        # Solo dietro un proxy fidato: altrimenti X-Forwarded-For è falsificabile dal client
+        self.RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"
+
+        # Idempotency-Key sulle operazioni di denaro
+        self.IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+        self.IDEMPOTENCY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+        self.IDEMPOTENCY_PURGE_INTERVAL = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "3600"))
+
+        # Storico e statistiche dei giocatori
+        self.ROLLUP_INTERVAL = float(os.getenv("ROLLUP_INTERVAL", "60"))
+        self.ROLLUP_BATCH = int(os.getenv("ROLLUP_BATCH", "5000"))
+        # Transazioni più recenti di così restano fuori dal giro: potrebbero non essere ancora committate
+        self.ROLLUP_LAG_SECONDS = float(os.getenv("ROLLUP_LAG_SECONDS", "5"))
+        # Id saltati dall'high-water mark: si ricontrollano per questo tempo, poi sono rollback
+        self.ROLLUP_WINDOW_SECONDS = float(os.getenv("ROLLUP_WINDOW_SECONDS", "3600"))
+        self.STATS_DEFAULT_DAYS = int(os.getenv("STATS_DEFAULT_DAYS", "30"))
+        self.STATS_MAX_DAYS = int(os.getenv("STATS_MAX_DAYS", "366"))
+
+        # Export e import amministrativi
+        # Vuoto = endpoint /admin disattivati; altrimenti valore atteso nell'header X-Admin-Token
+        self.ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+        self.EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "1000"))
+        self.IMPORT_BATCH = int(os.getenv("IMPORT_BATCH", "1000"))
+
+        # Più worker: URL di tutti i worker nell'ordine degli id, separati da virgole (vuoto = processo singolo)
+        self.CLUSTER_PEERS = os.getenv("CLUSTER_PEERS", "")
+        self.WORKER_ID = int(os.getenv("WORKER_ID", "0"))
+        self.CLUSTER_BACKEND = os.getenv("CLUSTER_BACKEND", "memory")  # 'memory' o 'redis'
+        # Deve superare MATCH_WAIT_TIMEOUT: anche il long polling del matchmaking viene inoltrato
+        self.CLUSTER_FORWARD_TIMEOUT = float(os.getenv("CLUSTER_FORWARD_TIMEOUT", "30"))
+        # Firma delle richieste inoltrate tra worker; vuoto = SECRET_KEY, comunque uguale su tutti i worker
+        self.CLUSTER_SECRET = os.getenv("CLUSTER_SECRET", "")
+        # Secondi di validità di una firma: oltre, o se già vista, la richiesta inoltrata è rifiutata
+        self.CLUSTER_FORWARD_MAX_AGE = float(os.getenv("CLUSTER_FORWARD_MAX_AGE", "30"))
+
+        # Metriche e profiling
+        self.SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+        # Vuoto = profiler disattivato; altrimenti valore atteso nell'header X-Profile
+        self.PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+        self.PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+        self.PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+
+settings = Settings()
@@ -0,0 +1,89 @@
+"""Dipendenze e helper condivisi dai router dell'API"""
+from fastapi import Depends, HTTPException, Request
+from fastapi.responses import Response
+from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
+from config import settings
+from models import User
+from auth import decode_access_token, token_cache
+from cache import response_cache
+from ratelimit import limiter, client_ip
+from idempotency import idempotency_store, fingerprint, MAX_KEY_LENGTH
+from serialization import dumps
+import hmac
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    # Cache per richiesta: la riga utente viene caricata una sola volta
+    user = getattr(request.state, "user", None)
+    if user is not None:
+        return user
+    principal = decode_access_token(token)
+    if principal is None:
+        raise HTTPException(status_code=401, detail="Token error")
+    if principal.user_id is not None:
+        user = await db.get(User, principal.user_id)
+    else:
+        user = await db.scalar(select(User).where(User.username == principal.username))
+        if user is not None:
+            token_cache.put(token, principal._replace(user_id=user.id))
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    request.state.user = user
+    return user
+
+def require_admin(request: Request):
+    """Endpoint di amministrazione: solo con ADMIN_TOKEN configurato e presentato in X-Admin-Token"""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", ""), settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token error")
+
+def limit_by_ip(rule: str):
+    """Dipendenza di rate limiting per le route senza autenticazione"""
+    async def dependency(request: Request):
+        await limiter.check(rule, "ip:" + client_ip(request))
+    return Depends(dependency)
+
+def limit_by_user(rule: str):
+    """Dipendenza di rate limiting per utente; get_current_user resta una sola volta per richiesta"""
+    async def dependency(current_user: User = Depends(get_current_user)):
+        await limiter.check(rule, f"user:{current_user.id}")
+    return Depends(dependency)
+
+async def idempotent(request: Request, current_user: User, db: AsyncSession, work):
+    """Esegue work(session) e committa; con Idempotency-Key una ripetizione riceve la risposta originale"""
+    key = request.headers.get("idempotency-key")
+    if key is None:
+        result = await db.run_sync(work)
+        await db.commit()
+        return result
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key non valida")
+    fp = fingerprint(request.method, request.url.path, await request.body())
+    status_code, body, replayed = await idempotency_store.run(db, current_user.id, key, fp, work)
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return Response(body, status_code=status_code, media_type="application/json", headers=headers)
+
+async def cached_json(request: Request, namespace: str, build):
+    """Risposta JSON dalla cache; build() viene chiamata solo se la voce manca"""
+    key = request.url.path + "?" + "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    version, etag, body = await response_cache.lookup(namespace, key)
+    if body is None:
+        response_cache.record(namespace, "miss")
+        body = dumps(await build())
+        etag = await response_cache.store(namespace, key, version, body)
+    else:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in (t.strip() for t in if_none_match.split(","))):
+            response_cache.record(namespace, "not_modified")
+            return Response(status_code=304, headers={"ETag": etag})
+        response_cache.record(namespace, "hit")
+    return Response(body, media_type="application/json", headers={"ETag": etag, "Cache-Control": "no-cache"})
@@ -0,0 +1,119 @@
+from collections import defaultdict
+from threading import get_ident
+from config import settings
+from cluster import cluster
+import asyncio
+import json
+import re
+
+EVENT_QUEUE_SIZE = settings.EVENT_QUEUE_SIZE
+
+# Argomenti a cui ci si può iscrivere: la lobby e i singoli tavoli/tornei
+TOPIC_RE = re.compile(r"^(lobby|table:\d+|tournament:\d+)$")
+
+def valid_topic(topic: str):
+    return TOPIC_RE.match(topic) is not None
+
+class Subscriber:
+    __slots__ = ("queue", "lagging")
+
+    def __init__(self, size: int):
+        self.queue = asyncio.Queue(maxsize=size)
+        self.lagging = False
+
+class Hub:
+    """Pub/sub in-process: gli eventi vengono serializzati una volta e smistati alle code degli iscritti"""
+
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.published = 0
+        self.disconnected = 0
+        self._topics = defaultdict(set)
+        self._loop = None
+        self._loop_thread = None
+
+    def bind(self, loop):
+        self._loop = loop
+        self._loop_thread = get_ident()
+
+    def subscribe(self, topic: str):
+        subscriber = Subscriber(self.queue_size)
+        self._topics[topic].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, topic: str, subscriber: Subscriber):
+        subscribers = self._topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._topics[topic]
+
+    def publish(self, topic: str, event: dict):
+        """Thread-safe: gli handler sync girano nel threadpool, il fan-out avviene sul loop"""
+        if self._loop is None or topic not in self._topics:
+            return
+        data = json.dumps(event, separators=(",", ":"))
+        if get_ident() == self._loop_thread:
+            self._fanout(topic, data)
+        else:
+            self._loop.call_soon_threadsafe(self._fanout, topic, data)
+
+    def _fanout(self, topic: str, data: str):
+        self.published += 1
+        for subscriber in list(self._topics.get(topic, ())):
+            try:
+                subscriber.queue.put_nowait(data)
+            except asyncio.QueueFull:
+                self._drop(topic, subscriber)
+
+    def _drop(self, topic: str, subscriber: Subscriber):
+        # Backpressure: un client lento viene staccato e dovrà risincronizzarsi
+        self.unsubscribe(topic, subscriber)
+        self.disconnected += 1
+        subscriber.lagging = True
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+    def stats(self):
+        return {
+            "topics": len(self._topics),
+            "subscribers": sum(len(s) for s in self._topics.values()),
+            "published": self.published,
+            "disconnected": self.disconnected
+        }
+
+hub = Hub()
+
+# Callback sincrone chiamate per ogni evento di dominio (es. invalidazione della cache)
+_listeners = []
+
+def listen(callback):
+    _listeners.append(callback)
+
+def _notify(event: dict):
+    for callback in _listeners:
+        callback(event)
+
+def _deliver(event: dict, topics):
+    _notify(event)
+    for topic in topics:
+        hub.publish(topic, event)
+
+def _publish(event: dict, topics):
+    # Gli iscritti di questo worker subito, quelli degli altri worker via bus
+    _deliver(event, topics)
+    cluster.broadcast("event", event=event, topics=topics)
+
+def receive(message: dict):
+    """Evento pubblicato da un altro worker: listener e iscritti locali come se fosse nato qui"""
+    _deliver(message["event"], message["topics"])
+
+def table_event(kind: str, table_id: int, **fields):
+    """Pubblica un diff di un tavolo sul suo argomento e sulla lobby"""
+    event = {"type": f"table.{kind}", "table_id": table_id, **fields}
+    _publish(event, (f"table:{table_id}", "lobby"))
+
+def tournament_event(kind: str, tournament_id: int, **fields):
+    event = {"type": f"tournament.{kind}", "tournament_id": tournament_id, **fields}
+    _publish(event, (f"tournament:{tournament_id}", "lobby"))
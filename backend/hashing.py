@@ -0,0 +1,78 @@
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from passlib.context import CryptContext
+from config import settings
+from metrics import bcrypt_duration
+import asyncio
+import time
+
+BCRYPT_ROUNDS = settings.BCRYPT_ROUNDS
+HASH_WORKERS = settings.HASH_WORKERS
+HASH_QUEUE_LIMIT = settings.HASH_QUEUE_LIMIT
+
+# Con min/max desiderati uguali al costo corrente, needs_update segnala ogni hash
+# calcolato con un costo diverso e verify_and_update lo ricalcola al login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_desired_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_desired_rounds=BCRYPT_ROUNDS
+)
+
+class HashPoolSaturated(Exception):
+    """Troppe richieste bcrypt in coda: la richiesta va rifiutata subito"""
+
+# Eseguite nei processi del pool: devono restare funzioni di modulo
+def _hash(password: str):
+    return pwd_context.hash(password)
+
+def _verify_and_update(password: str, hashed_password: str):
+    return pwd_context.verify_and_update(password, hashed_password)
+
+class HashPool:
+    """Pool di processi a dimensione fissa per bcrypt, con limite sulla coda"""
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_limit: int = HASH_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self.rejected = 0
+        self._executor = None
+        self._lock = Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def _run(self, operation: str, fn, *args):
+        with self._lock:
+            if self.pending >= self.workers + self.queue_limit:
+                self.rejected += 1
+                raise HashPoolSaturated()
+            self.pending += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool(), fn, *args)
+        finally:
+            bcrypt_duration.observe(time.perf_counter() - start, operation=operation)
+            with self._lock:
+                self.pending -= 1
+
+    async def hash_password(self, password: str):
+        return await self._run("hash", _hash, password)
+
+    async def verify_password(self, password: str, hashed_password: str):
+        """Restituisce (valida, nuovo_hash); nuovo_hash è None se il costo è già quello corrente"""
+        return await self._run("verify", _verify_and_update, password, hashed_password)
+
+    def stats(self):
+        return {"workers": self.workers, "queue_limit": self.queue_limit, "pending": self.pending, "rejected": self.rejected}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+hash_pool = HashPool()
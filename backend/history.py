@@ -0,0 +1,308 @@
+"""Storico delle transazioni dell'utente e rollup giornalieri per le statistiche.
+
+Ogni movimento di saldo passa da ledger, che scrive una Transaction: qui la si
+legge a pagine keyset e la si aggrega in user_daily_stats. Il rollup è
+incrementale: riparte dall'ultimo id aggregato (rollup_state) e avanza a
+blocchi, quindi le statistiche leggono poche righe per utente invece di
+sommare tutto lo storico. Gli id scavalcati senza una transazione committata
+restano in sospeso e vengono ricontrollati per ROLLUP_WINDOW_SECONDS: una
+transazione che committa dopo una con id più alto non si perde. Le
+transazioni oltre l'high-water mark e quelle in sospeso vengono sommate al
+volo: le statistiche restano esatte tra un giro e l'altro.
+
+Le partite giocate sono le iscrizioni pagate (fee di tavolo e torneo) meno i
+rimborsi: il piatto del vincitore è fatto dalle fee dei partecipanti.
+
+Uso: python -m history   aggrega tutte le transazioni non ancora nei rollup
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, select, update, insert, bindparam
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import Transaction, UserDailyStats, RollupState
+from config import settings
+import asyncio
+import time
+import ledger
+
+ROLLUP_INTERVAL = settings.ROLLUP_INTERVAL
+ROLLUP_BATCH = settings.ROLLUP_BATCH
+ROLLUP_LAG = settings.ROLLUP_LAG_SECONDS
+ROLLUP_WINDOW = settings.ROLLUP_WINDOW_SECONDS
+ROLLUP_NAME = "user_daily_stats"
+
+TX_TYPES = ("deposit", "withdraw", "game_fee", "tournament_fee", "win", "refund")
+FEE_TYPES = ("game_fee", "tournament_fee")
+FIELDS = ("deposits_micro", "withdrawals_micro", "fees_micro", "winnings_micro", "refunds_micro",
+          "volume_micro", "transactions", "games", "wins")
+
+def deltas(tx_type: str, amount_micro: int):
+    """Contributo di una transazione alle colonne del rollup"""
+    d = {"volume_micro": abs(amount_micro), "transactions": 1}
+    if tx_type == "deposit":
+        d["deposits_micro"] = amount_micro
+    elif tx_type == "withdraw":
+        d["withdrawals_micro"] = -amount_micro
+    elif tx_type in FEE_TYPES:
+        d["fees_micro"] = -amount_micro
+        d["games"] = 1
+    elif tx_type == "win":
+        d["winnings_micro"] = amount_micro
+        d["wins"] = 1
+    elif tx_type == "refund":
+        d["refunds_micro"] = amount_micro
+        d["games"] = -1
+    return d
+
+# ========== STORICO ==========
+
+def encode_cursor(created_at: datetime, tx_id: int) -> str:
+    return f"{created_at.isoformat()}_{tx_id}"
+
+def decode_cursor(cursor: str):
+    created_at, _, tx_id = cursor.rpartition("_")
+    return datetime.fromisoformat(created_at), int(tx_id)
+
+def transaction_out(row):
+    return {
+        "id": row.id,
+        "type": row.tx_type,
+        "amount": ledger.from_micro(row.amount_micro),
+        "tx_hash": row.tx_hash,
+        "created_at": row.created_at.isoformat(),
+    }
+
+def page(db: Session, user_id: int, tx_type: str = None, after: str = None, limit: int = settings.LIST_PAGE_SIZE):
+    """Transazioni dalla più recente, keyset su (created_at, id) con l'indice (user_id, created_at, id)"""
+    stmt = select(Transaction.id, Transaction.tx_type, Transaction.amount_micro, Transaction.tx_hash, Transaction.created_at) \
+        .where(Transaction.user_id == user_id) \
+        .order_by(Transaction.created_at.desc(), Transaction.id.desc())
+    if tx_type is not None:
+        stmt = stmt.where(Transaction.tx_type == tx_type)
+    if after:
+        created_at, last_id = decode_cursor(after)
+        stmt = stmt.where(or_(Transaction.created_at < created_at,
+                              and_(Transaction.created_at == created_at, Transaction.id < last_id)))
+    rows = db.execute(stmt.limit(limit)).all()
+    next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id) if len(rows) == limit else None
+    return [transaction_out(row) for row in rows], next_cursor
+
+# ========== ROLLUP ==========
+
+def rollup_state(db: Session):
+    """(last_id, id in sospeso, updated_at) del rollup; updated_at fa da versione per i worker concorrenti"""
+    row = db.execute(
+        select(RollupState.last_id, RollupState.pending, RollupState.updated_at).where(RollupState.name == ROLLUP_NAME)
+    ).first()
+    if row is None:
+        return 0, {}, None
+    return row.last_id, {tx_id: seen for tx_id, seen in row.pending or []}, row.updated_at
+
+def high_water_mark(db: Session):
+    return rollup_state(db)[0]
+
+def _aggregate(rows):
+    totals = defaultdict(Counter)
+    for row in rows:
+        totals[(row.user_id, row.created_at.date())].update(deltas(row.tx_type, row.amount_micro))
+    return totals
+
+def _apply(totals, db: Session):
+    """Somma i delta alle righe esistenti con un UPDATE executemany, inserisce le mancanti"""
+    days = [day for _, day in totals]
+    existing = {(user_id, day) for user_id, day in db.execute(
+        select(UserDailyStats.user_id, UserDailyStats.day)
+        .where(UserDailyStats.user_id.in_(list({user_id for user_id, _ in totals})),
+               UserDailyStats.day.between(min(days), max(days)))
+    )}
+    stats = UserDailyStats.__table__
+    updates = [
+        {"b_user_id": user_id, "b_day": day, **{f"b_{f}": values[f] for f in FIELDS}}
+        for (user_id, day), values in totals.items() if (user_id, day) in existing
+    ]
+    if updates:
+        db.execute(
+            update(stats)
+            .where(stats.c.user_id == bindparam("b_user_id"), stats.c.day == bindparam("b_day"))
+            .values(**{f: stats.c[f] + bindparam(f"b_{f}") for f in FIELDS}),
+            updates
+        )
+    inserts = [
+        {"user_id": user_id, "day": day, **{f: values[f] for f in FIELDS}}
+        for (user_id, day), values in totals.items() if (user_id, day) not in existing
+    ]
+    if inserts:
+        db.execute(insert(stats), inserts)
+
+def _transactions(*where):
+    return select(Transaction.id, Transaction.user_id, Transaction.tx_type, Transaction.amount_micro,
+                  Transaction.created_at).where(*where)
+
+def rollup_once(db: Session, batch: int = ROLLUP_BATCH, lag: float = ROLLUP_LAG, window: float = ROLLUP_WINDOW):
+    """Aggrega le transazioni arrivate in ritardo e il blocco dopo l'high-water mark; restituisce quante
+
+    Gli id non seguono l'ordine dei commit: una transazione con id più basso
+    può committare dopo una più alta. Gli id che l'high-water mark scavalca
+    senza trovarli restano in sospeso e si ricontrollano a ogni giro per
+    window secondi; dopo sono rollback o sequenze saltate. Il lag si limita a
+    lasciare fuori le transazioni appena scritte, così i sospesi restano pochi.
+    """
+    last_id, pending, version = rollup_state(db)
+    now = time.time()
+    late = db.execute(_transactions(Transaction.id.in_(list(pending)))).all() if pending else []
+    for row in late:
+        del pending[row.id]
+    expired = [tx_id for tx_id, seen in pending.items() if seen < now - window]
+    for tx_id in expired:
+        del pending[tx_id]
+
+    rows = db.execute(_transactions(Transaction.id > last_id).order_by(Transaction.id).limit(batch)).all()
+    cutoff = datetime.utcnow() - timedelta(seconds=lag)
+    ready = []
+    new_id = last_id
+    for row in rows:
+        if row.created_at > cutoff:
+            break
+        # Buchi più lunghi di un blocco non sono transazioni in volo ma id saltati (import, sequenze)
+        if row.id - new_id <= batch:
+            pending.update((tx_id, now) for tx_id in range(new_id + 1, row.id))
+        ready.append(row)
+        new_id = row.id
+    if not late and not ready and not expired:
+        db.rollback()
+        return 0
+    state = {"last_id": new_id, "pending": sorted(pending.items()), "updated_at": datetime.utcnow()}
+    # Prima lo stato, con la versione letta come guardia: tra due worker ne avanza uno solo
+    if version is not None:
+        moved = db.execute(
+            update(RollupState)
+            .where(RollupState.name == ROLLUP_NAME, RollupState.last_id == last_id, RollupState.updated_at == version)
+            .values(**state),
+            execution_options={"synchronize_session": False}
+        ).rowcount
+        if not moved:
+            db.rollback()
+            return 0
+    else:
+        db.add(RollupState(name=ROLLUP_NAME, **state))
+    if late or ready:
+        _apply(_aggregate(late + ready), db)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Primo giro concorrente su due worker: ha vinto l'altro
+        db.rollback()
+        return 0
+    return len(late) + len(ready)
+
+def catch_up(batch: int = ROLLUP_BATCH, lag: float = ROLLUP_LAG, window: float = ROLLUP_WINDOW):
+    """Aggrega a blocchi finché resta lavoro; gira in un thread con una sessione propria"""
+    db = SessionLocal()
+    total = 0
+    try:
+        while True:
+            done = rollup_once(db, batch, lag, window)
+            total += done
+            if done < batch:
+                return total
+    finally:
+        db.close()
+
+# ========== STATISTICHE ==========
+
+def _period(values: Counter):
+    games = values["games"]
+    return {
+        "deposits": ledger.from_micro(values["deposits_micro"]),
+        "withdrawals": ledger.from_micro(values["withdrawals_micro"]),
+        "fees": ledger.from_micro(values["fees_micro"]),
+        "winnings": ledger.from_micro(values["winnings_micro"]),
+        "refunds": ledger.from_micro(values["refunds_micro"]),
+        "net_pnl": ledger.from_micro(values["winnings_micro"] + values["refunds_micro"] - values["fees_micro"]),
+        "volume": ledger.from_micro(values["volume_micro"]),
+        "transactions": values["transactions"],
+        "games": games,
+        "wins": values["wins"],
+        "win_rate": round(values["wins"] / games, 4) if games > 0 else None,
+    }
+
+def _read_period(db: Session, user_id: int, since, last_id: int, pending):
+    daily = defaultdict(Counter)
+    for row in db.execute(
+        select(UserDailyStats.day, *(getattr(UserDailyStats, f) for f in FIELDS))
+        .where(UserDailyStats.user_id == user_id, UserDailyStats.day >= since)
+    ):
+        daily[row.day].update({f: row._mapping[f] for f in FIELDS})
+    # Coda e sospesi non ancora aggregati: poche righe, sull'indice della chiave primaria
+    unrolled = or_(Transaction.id > last_id, Transaction.id.in_(list(pending))) if pending else Transaction.id > last_id
+    for row in db.execute(
+        select(Transaction.tx_type, Transaction.amount_micro, Transaction.created_at)
+        .where(unrolled, Transaction.user_id == user_id)
+    ):
+        day = row.created_at.date()
+        if day >= since:
+            daily[day].update(deltas(row.tx_type, row.amount_micro))
+    return daily
+
+def user_stats(db: Session, user, days: int):
+    """Contatori a vita dall'utente e importi degli ultimi days giorni dai rollup"""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    for _ in range(3):
+        last_id, pending, version = rollup_state(db)
+        daily = _read_period(db, user.id, since, last_id, pending)
+        # Un giro di rollup committato durante la lettura conterebbe due volte la coda
+        if rollup_state(db)[2] == version:
+            break
+    total = Counter()
+    for values in daily.values():
+        total.update(values)
+    played = user.games_played or 0
+    return {
+        "username": user.username,
+        "usdc_balance": ledger.from_micro(user.balance_micro or 0),
+        "games_played": played,
+        "games_won": user.games_won or 0,
+        "win_rate": round((user.games_won or 0) / played, 4) if played else None,
+        "tournaments_played": user.tournaments_played or 0,
+        "tournaments_won": user.tournaments_won or 0,
+        "days": days,
+        "period": _period(total),
+        "daily": [{"day": day.isoformat(), **_period(daily[day])} for day in sorted(daily)],
+    }
+
+class RollupWorker:
+    """Aggiorna i rollup in background ogni interval secondi"""
+
+    def __init__(self, interval: float = ROLLUP_INTERVAL):
+        self.interval = interval
+        self.rolled = 0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                self.rolled += await asyncio.to_thread(catch_up)
+            except Exception:
+                # L'high-water mark non è avanzato: le stesse righe al prossimo giro
+                pass
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+rollup_worker = RollupWorker()
+
+def main():
+    # Da riga di comando si aggrega tutto: nessuna transazione è ancora in volo nel deploy
+    print(f"{catch_up(lag=0)} transazioni aggregate")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import IdempotencyRecord
+from metrics import idempotency_requests
+from serialization import dumps
+from config import settings
+import asyncio
+import hashlib
+import time
+
+IDEMPOTENCY_CACHE_SIZE = settings.IDEMPOTENCY_CACHE_SIZE
+IDEMPOTENCY_TTL = settings.IDEMPOTENCY_TTL_HOURS * 3600
+IDEMPOTENCY_PURGE_INTERVAL = settings.IDEMPOTENCY_PURGE_INTERVAL
+MAX_KEY_LENGTH = 255
+
+class IdempotencyConflict(Exception):
+    """Chiave già usata per una richiesta diversa (altro endpoint o altro corpo)"""
+
+def fingerprint(method: str, path: str, body: bytes):
+    return hashlib.blake2b(b"%s %s\n%s" % (method.encode(), path.encode(), body), digest_size=16).hexdigest()
+
+class IdempotencyStore:
+    """Risposte delle richieste con Idempotency-Key: LRU in memoria davanti alla tabella idempotency_records
+
+    La riga viene scritta nella stessa transazione dell'operazione di denaro:
+    o sono committate entrambe o nessuna. Le ripetizioni concorrenti nello
+    stesso processo attendono l'esecuzione in corso invece di rieseguire;
+    tra processi diversi decide l'indice unico (user_id, key).
+    """
+
+    def __init__(self, maxsize: int = IDEMPOTENCY_CACHE_SIZE, ttl: float = IDEMPOTENCY_TTL,
+                 purge_interval: float = IDEMPOTENCY_PURGE_INTERVAL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.counts = {"executed": 0, "replayed": 0, "coalesced": 0, "conflict": 0}
+        self._entries = OrderedDict()  # (user_id, key) -> (fingerprint, status_code, body, scadenza)
+        self._inflight = {}
+        self._task = None
+
+    def _record(self, result: str):
+        self.counts[result] += 1
+        idempotency_requests.inc(result=result)
+
+    def _remember(self, cache_key, fp: str, status_code: int, body: bytes, expires: float):
+        self._entries[cache_key] = (fp, status_code, body, expires)
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _cached(self, cache_key):
+        entry = self._entries.get(cache_key)
+        if entry is None:
+            return None
+        if entry[3] < time.time():
+            del self._entries[cache_key]
+            return None
+        self._entries.move_to_end(cache_key)
+        return entry
+
+    def _replay(self, entry, fp: str, result: str = "replayed"):
+        if entry[0] != fp:
+            self._record("conflict")
+            raise IdempotencyConflict()
+        self._record(result)
+        return entry[1], entry[2], True
+
+    def _load(self, db: Session, user_id: int, key: str):
+        """Riga ancora valida per la chiave; quelle scadute vengono cancellate per liberare la chiave"""
+        record = db.scalars(
+            select(IdempotencyRecord).where(IdempotencyRecord.user_id == user_id, IdempotencyRecord.key == key)
+        ).first()
+        if record is None:
+            return None
+        remaining = self.ttl - (datetime.utcnow() - record.created_at).total_seconds()
+        if remaining <= 0:
+            db.delete(record)
+            # Subito: l'INSERT della nuova esecuzione non deve precedere la DELETE
+            db.flush()
+            return None
+        return record.fingerprint, record.status_code, record.body, time.time() + remaining
+
+    async def run(self, db, user_id: int, key: str, fp: str, work, status_code: int = 200):
+        """Esegue work(session) una sola volta per (user_id, key) e ne restituisce la risposta
+
+        work gira in run_sync senza commit e restituisce il dict della risposta.
+        Restituisce (status_code, body, replayed). Solo le esecuzioni riuscite
+        vengono salvate: dopo un errore la stessa chiave si può ritentare.
+        """
+        cache_key = (user_id, key)
+        coalesced = False
+        while True:
+            entry = self._cached(cache_key)
+            if entry is not None:
+                return self._replay(entry, fp, "coalesced" if coalesced else "replayed")
+            pending = self._inflight.get(cache_key)
+            if pending is None:
+                break
+            # Stessa chiave già in esecuzione: si attende e si riguarda la cache
+            coalesced = True
+            await asyncio.wait({pending})
+
+        done = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = done
+        try:
+            entry = await db.run_sync(lambda s: self._load(s, user_id, key))
+            if entry is not None:
+                self._remember(cache_key, *entry)
+                return self._replay(entry, fp)
+
+            def execute(s: Session):
+                body = dumps(work(s))
+                s.add(IdempotencyRecord(user_id=user_id, key=key, fingerprint=fp, status_code=status_code, body=body))
+                return body
+
+            body = await db.run_sync(execute)
+            try:
+                await db.commit()
+            except IntegrityError:
+                # Un altro worker ha committato la stessa chiave: vale la sua risposta, la nostra operazione è annullata
+                await db.rollback()
+                entry = await db.run_sync(lambda s: self._load(s, user_id, key))
+                if entry is None:
+                    raise
+                self._remember(cache_key, *entry)
+                return self._replay(entry, fp)
+            self._remember(cache_key, fp, status_code, body, time.time() + self.ttl)
+            self._record("executed")
+            return status_code, body, False
+        finally:
+            del self._inflight[cache_key]
+            done.set_result(None)
+
+    def stats(self):
+        return {"cached": len(self._entries), "in_flight": len(self._inflight), **self.counts}
+
+    def purge(self):
+        """Cancella le righe scadute; gira in un thread con una sessione propria"""
+        db = SessionLocal()
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+            deleted = db.execute(delete(IdempotencyRecord).where(IdempotencyRecord.created_at < cutoff)).rowcount
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.purge)
+            except Exception:
+                # Nessuna riga persa: le scadute vengono ignorate anche in lettura
+                pass
+            await asyncio.sleep(self.purge_interval)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,199 @@
+from bisect import bisect_left, insort
+from threading import Lock
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from models import User
+from config import settings
+from cache import response_cache
+from cluster import cluster
+from serialization import USER_COLUMNS
+
+# Metrica esposta dall'API -> colonna su cui si ordina
+METRICS = {"games_won": "games_won", "tournaments_won": "tournaments_won", "usdc_balance": "balance_micro"}
+PAGE_SIZE = settings.LEADERBOARD_PAGE_SIZE
+MAX_PAGE_SIZE = settings.LEADERBOARD_MAX_PAGE_SIZE
+
+class RankIndex:
+    """Classifica ordinata in memoria per una singola metrica
+
+    Chiavi (-valore, id), così l'ordine naturale coincide con quello della
+    classifica. Stanno in blocchi ordinati di al più 2 * load chiavi (come
+    sortedcontainers.SortedList) con un albero di Fenwick sulle dimensioni dei
+    blocchi: upsert e rank costano O(log n + load), dove load è una costante.
+    Con una sola lista un upsert costava O(n), a ogni deposito e vincita.
+    Dividere o svuotare un blocco ricostruisce l'albero in O(n / load),
+    al più una volta ogni load inserimenti.
+    """
+
+    def __init__(self, load: int = 512):
+        self.load = load
+        self._blocks = []  # liste ordinate, in ordine tra loro
+        self._maxes = []  # ultima chiave di ogni blocco
+        self._tree = []  # Fenwick sulle dimensioni dei blocchi
+        self._by_id = {}
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def _rebuild(self):
+        tree = [len(block) for block in self._blocks]
+        for i in range(len(tree)):
+            parent = i | (i + 1)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _add(self, i: int, delta: int):
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i |= i + 1
+
+    def _before(self, i: int):
+        """Chiavi nei blocchi prima di i"""
+        total = 0
+        while i > 0:
+            total += self._tree[i - 1]
+            i &= i - 1
+        return total
+
+    def _block(self, key):
+        return min(bisect_left(self._maxes, key), len(self._maxes) - 1)
+
+    def _insert(self, key):
+        if not self._blocks:
+            self._blocks.append([key])
+            self._maxes.append(key)
+            self._rebuild()
+            return
+        i = self._block(key)
+        block = self._blocks[i]
+        insort(block, key)
+        self._maxes[i] = block[-1]
+        if len(block) > 2 * self.load:
+            self._blocks[i:i + 1] = [block[:self.load], block[self.load:]]
+            self._maxes[i:i + 1] = [block[self.load - 1], block[-1]]
+            self._rebuild()
+        else:
+            self._add(i, 1)
+
+    def _remove(self, key):
+        i = self._block(key)
+        block = self._blocks[i]
+        del block[bisect_left(block, key)]
+        if block:
+            self._maxes[i] = block[-1]
+            self._add(i, -1)
+        else:
+            del self._blocks[i]
+            del self._maxes[i]
+            self._rebuild()
+
+    def upsert(self, user_id: int, value):
+        key = (-value, user_id)
+        old = self._by_id.get(user_id)
+        if old == key:
+            return
+        if old is not None:
+            self._remove(old)
+        self._insert(key)
+        self._by_id[user_id] = key
+
+    def rank(self, user_id: int):
+        key = self._by_id.get(user_id)
+        if key is None:
+            return None
+        i = self._block(key)
+        return self._before(i) + bisect_left(self._blocks[i], key) + 1
+
+_indexes = {metric: RankIndex() for metric in METRICS}
+_user_ids = {}
+_stale = set()  # utenti modificati da altri worker, riletti alla prossima rank()
+_lock = Lock()
+_loaded = False
+
+def _upsert(user_id: int, username: str, values: dict):
+    _user_ids[username] = user_id
+    for metric, column in METRICS.items():
+        _indexes[metric].upsert(user_id, values.get(column) or 0)
+
+def ensure_loaded(db: Session):
+    """Costruisce gli indici in memoria alla prima richiesta"""
+    global _loaded
+    if _loaded:
+        return
+    # Query fuori dal lock: dentro run_sync l'I/O cede il loop e il lock bloccherebbe il thread.
+    # Un doppio caricamento concorrente è innocuo, l'upsert è idempotente.
+    rows = db.query(User.id, User.username, *(getattr(User, c) for c in METRICS.values())).all()
+    with _lock:
+        if _loaded:
+            return
+        for row in rows:
+            _upsert(row.id, row.username, row._mapping)
+        _loaded = True
+
+def on_remote(message: dict):
+    with _lock:
+        _stale.update(message["user_ids"])
+
+def _refresh_stale(db: Session):
+    with _lock:
+        user_ids = list(_stale)
+        _stale.clear()
+    if user_ids:
+        _reload(user_ids, db)
+
+def _reload(user_ids, db: Session):
+    rows = db.query(User.id, User.username, *(getattr(User, c) for c in METRICS.values())) \
+        .filter(User.id.in_(list(user_ids))).all()
+    with _lock:
+        for row in rows:
+            _upsert(row.id, row.username, row._mapping)
+
+def track(user: User):
+    """Aggiorna la posizione di un utente dopo una modifica dei contatori"""
+    response_cache.invalidate("leaderboard")
+    cluster.broadcast("leaderboard", user_ids=[user.id])
+    if not _loaded:
+        # Verrà letto dal DB al primo caricamento
+        return
+    with _lock:
+        _upsert(user.id, user.username, {c: getattr(user, c) for c in METRICS.values()})
+
+def rank(username: str, by: str, db: Session):
+    ensure_loaded(db)
+    _refresh_stale(db)
+    with _lock:
+        user_id = _user_ids.get(username)
+        if user_id is None:
+            return None
+        index = _indexes[by]
+        return index.rank(user_id), len(index)
+
+def encode_cursor(user: User, by: str) -> str:
+    return f"{getattr(user, METRICS[by]) or 0}:{user.id}"
+
+def decode_cursor(cursor: str):
+    value, _, user_id = cursor.rpartition(":")
+    return int(value), int(user_id)
+
+def page(db: Session, by: str = "games_won", after: str = None, limit: int = PAGE_SIZE):
+    """Pagina keyset della classifica: (metrica desc, id asc) sugli indici compositi"""
+    column = getattr(User, METRICS[by])
+    # Righe con le sole colonne esposte: niente oggetti ORM da idratare
+    query = db.query(*USER_COLUMNS).order_by(column.desc(), User.id.asc())
+    if after:
+        value, last_id = decode_cursor(after)
+        query = query.filter(or_(column < value, and_(column == value, User.id > last_id)))
+    users = query.limit(limit).all()
+    next_cursor = encode_cursor(users[-1], by) if len(users) == limit else None
+    return users, next_cursor
+
+def track_ids(user_ids, db: Session):
+    """Come track, per molti utenti con una sola query"""
+    # Anche senza vincitori i contatori games_played sono cambiati
+    response_cache.invalidate("leaderboard")
+    if user_ids:
+        cluster.broadcast("leaderboard", user_ids=list(user_ids))
+    if not _loaded or not user_ids:
+        return
+    _reload(user_ids, db)
@@ -0,0 +1,80 @@
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import update, insert, bindparam
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from models import User, Transaction
+
+# I saldi sono interi in micro-USDC: 1 USDC = 1_000_000
+MICRO = 1_000_000
+
+Entry = namedtuple("Entry", ["balance_micro", "transaction_id"])
+
+class InsufficientFunds(Exception):
+    """Il saldo non copre l'addebito richiesto"""
+
+def to_micro(amount) -> int:
+    return int((Decimal(str(amount)) * MICRO).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def from_micro(amount_micro: int) -> float:
+    return amount_micro / MICRO
+
+def _apply(db: Session, user_id: int, delta_micro: int, tx_type: str, tx_hash: str, counters: dict, guard):
+    values = {"balance_micro": User.balance_micro + delta_micro}
+    for counter, increment in counters.items():
+        column = getattr(User, counter)
+        values[counter] = column + increment
+    stmt = update(User).where(User.id == user_id, *guard).values(**values) \
+        .returning(*(getattr(User, name) for name in values))
+    row = db.execute(stmt, execution_options={"synchronize_session": False}).first()
+    if row is None:
+        return None
+    # Allinea l'utente già caricato nella sessione ai valori restituiti dal DB
+    user = db.identity_map.get(Session.identity_key(User, user_id))
+    if user is not None:
+        for name, value in zip(values, row):
+            set_committed_value(user, name, value)
+    balance = row[0]
+    transaction_id = db.execute(
+        insert(Transaction)
+        .values(user_id=user_id, amount_micro=delta_micro, tx_type=tx_type, tx_hash=tx_hash)
+        .returning(Transaction.id)
+    ).scalar_one()
+    return Entry(balance, transaction_id)
+
+def credit(db: Session, user_id: int, amount_micro: int, tx_type: str, tx_hash: str = None, **counters):
+    """Accredita in un solo UPDATE atomico e registra la Transaction; il commit lo fa il chiamante"""
+    entry = _apply(db, user_id, amount_micro, tx_type, tx_hash, counters, ())
+    if entry is None:
+        raise LookupError(f"User {user_id} not found")
+    return entry
+
+def debit(db: Session, user_id: int, amount_micro: int, tx_type: str, tx_hash: str = None, **counters):
+    """UPDATE condizionale balance >= importo: nessun read-modify-write, nessun lock applicativo"""
+    entry = _apply(db, user_id, -amount_micro, tx_type, tx_hash, counters, (User.balance_micro >= amount_micro,))
+    if entry is None:
+        raise InsufficientFunds()
+    return entry
+
+def credit_many(db: Session, rows, tx_type: str, counters=()):
+    """Accrediti e contatori per molti utenti: un UPDATE executemany e un INSERT multiplo
+
+    rows: dict con user_id, amount_micro e un valore per ogni contatore in counters
+    """
+    if not rows:
+        return
+    users = User.__table__
+    values = {"balance_micro": users.c.balance_micro + bindparam("b_amount")}
+    for counter in counters:
+        values[counter] = users.c[counter] + bindparam(f"b_{counter}")
+    params = [
+        {"b_user_id": row["user_id"], "b_amount": row["amount_micro"], **{f"b_{c}": row[c] for c in counters}}
+        for row in rows
+    ]
+    db.execute(update(users).where(users.c.id == bindparam("b_user_id")).values(**values), params)
+    transactions = [
+        {"user_id": row["user_id"], "amount_micro": row["amount_micro"], "tx_type": tx_type}
+        for row in rows if row["amount_micro"]
+    ]
+    if transactions:
+        db.execute(insert(Transaction), transactions)
@@ -0,0 +1,199 @@
+from collections import deque, defaultdict, OrderedDict
+from sqlalchemy import insert
+from database import SessionLocal
+from models import Table, TablePlayer, User
+from events import table_event
+from table_manager import table_manager
+from metrics import matchmaking_wait, matchmaking_tables
+from config import settings
+import asyncio
+import itertools
+import time
+
+MATCH_INTERVAL = settings.MATCH_INTERVAL
+MATCH_BATCH = settings.MATCH_BATCH
+MATCH_DEFAULT_SIZE = settings.MATCH_DEFAULT_SIZE
+MATCH_MAX_SIZE = settings.MATCH_MAX_SIZE
+MATCH_RESULTS_KEEP = settings.MATCH_RESULTS_KEEP
+
+class Ticket:
+    """Un giocatore in coda; future si risolve con l'id del tavolo assegnato"""
+    __slots__ = ("user_id", "username", "stake_micro", "size", "enqueued_at", "cancelled", "matching", "table_id", "future")
+
+    def __init__(self, user_id: int, username: str, stake_micro: int, size: int):
+        self.user_id = user_id
+        self.username = username
+        self.stake_micro = stake_micro
+        self.size = size
+        self.enqueued_at = time.monotonic()
+        self.cancelled = False
+        self.matching = False  # estratto in un gruppo, tavolo in scrittura
+        self.table_id = None
+        self.future = asyncio.get_running_loop().create_future()
+
+    def status(self):
+        if self.table_id is not None:
+            return "matched"
+        if self.cancelled:
+            return "cancelled"
+        return "matching" if self.matching else "queued"
+
+class Matchmaker:
+    """Code in memoria per (puntata, posti): i gruppi completi diventano tavoli scritti in blocco"""
+
+    def __init__(self, interval: float = MATCH_INTERVAL, batch: int = MATCH_BATCH, results_keep: int = MATCH_RESULTS_KEEP):
+        self.interval = interval
+        self.batch = batch
+        self.matched = 0
+        self._buckets = defaultdict(deque)
+        self._live = defaultdict(int)  # ticket non cancellati per coda
+        self._tickets = {}  # ticket in coda o in scrittura
+        self._results = OrderedDict()  # ultimi ticket assegnati, al più results_keep
+        self.results_keep = results_keep
+        self._names = itertools.count(1)
+        self._task = None
+        self._wake = None
+
+    def depth(self):
+        return sum(self._live.values())
+
+    def stats(self):
+        return {
+            "queued": self.depth(),
+            "queues": {f"{stake}:{size}": n for (stake, size), n in self._live.items() if n},
+            "tables_formed": self.matched,
+        }
+
+    def get(self, user_id: int):
+        ticket = self._tickets.get(user_id)
+        return ticket if ticket is not None else self._results.get(user_id)
+
+    def enqueue(self, user: User, stake_micro: int = 0, size: int = MATCH_DEFAULT_SIZE):
+        """Mette in coda; un giocatore già in attesa riceve il suo ticket esistente"""
+        ticket = self._tickets.get(user.id)
+        if ticket is not None:
+            return ticket
+        self._results.pop(user.id, None)
+        ticket = Ticket(user.id, user.username, stake_micro, size)
+        key = (stake_micro, size)
+        self._tickets[user.id] = ticket
+        self._buckets[key].append(ticket)
+        self._live[key] += 1
+        if self._live[key] >= size and self._wake is not None:
+            self._wake.set()
+        return ticket
+
+    def cancel(self, user_id: int):
+        ticket = self._tickets.get(user_id)
+        # Un ticket in scrittura è già fuori da _live e il suo posto sta per essere scritto: troppo tardi
+        if ticket is None or ticket.status() != "queued":
+            return False
+        # Rimozione pigra: il ticket resta nella deque e viene saltato quando si formano i tavoli
+        ticket.cancelled = True
+        self._live[(ticket.stake_micro, ticket.size)] -= 1
+        del self._tickets[user_id]
+        ticket.future.cancel()
+        return True
+
+    def _take(self):
+        """Estrae fino a batch gruppi completi, in O(giocatori estratti)"""
+        groups = []
+        for key, bucket in self._buckets.items():
+            stake, size = key
+            while self._live[key] >= size and len(groups) < self.batch:
+                group = []
+                while len(group) < size:
+                    ticket = bucket.popleft()
+                    if not ticket.cancelled:
+                        ticket.matching = True
+                        group.append(ticket)
+                self._live[key] -= size
+                groups.append(group)
+        return groups
+
+    def _requeue(self, groups):
+        # Scrittura fallita: i gruppi tornano in testa mantenendo l'ordine d'arrivo
+        for group in reversed(groups):
+            key = (group[0].stake_micro, group[0].size)
+            for ticket in group:
+                ticket.matching = False
+            self._buckets[key].extendleft(reversed(group))
+            self._live[key] += len(group)
+
+    @staticmethod
+    def _write(rows):
+        """Crea tavoli e posti con due INSERT multipli; restituisce gli id nell'ordine di rows"""
+        db = SessionLocal()
+        try:
+            table_ids = db.scalars(
+                insert(Table).returning(Table.id, sort_by_parameter_order=True),
+                [{"name": name, "in_game": False} for name, _ in rows]
+            ).all()
+            db.execute(insert(TablePlayer), [
+                {"table_id": table_id, "user_id": user_id}
+                for table_id, (_, user_ids) in zip(table_ids, rows) for user_id in user_ids
+            ])
+            db.commit()
+            return table_ids
+        finally:
+            db.close()
+
+    def _resolve(self, ticket: Ticket):
+        """Sposta il ticket assegnato tra i risultati recenti, che restano limitati"""
+        del self._tickets[ticket.user_id]
+        self._results[ticket.user_id] = ticket
+        self._results.move_to_end(ticket.user_id)
+        while len(self._results) > self.results_keep:
+            self._results.popitem(last=False)
+
+    async def match_once(self):
+        groups = self._take()
+        if not groups:
+            return 0
+        rows = [(f"Match {next(self._names)}", [t.user_id for t in group]) for group in groups]
+        try:
+            table_ids = await asyncio.to_thread(self._write, rows)
+        except Exception:
+            self._requeue(groups)
+            raise
+        now = time.monotonic()
+        for table_id, (name, _), group in zip(table_ids, rows, groups):
+            table_manager.add_seated(table_id, name, {t.user_id: t.username for t in group})
+            for ticket in group:
+                ticket.table_id = table_id
+                ticket.matching = False
+                self._resolve(ticket)
+                if not ticket.future.done():
+                    ticket.future.set_result(table_id)
+                matchmaking_wait.observe(now - ticket.enqueued_at, size=ticket.size)
+            table_event("created", table_id, name=name, players=[t.username for t in group])
+        matchmaking_tables.inc(len(table_ids))
+        self.matched += len(table_ids)
+        return len(table_ids)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                # Continua finché restano gruppi completi, poi torna ad attendere
+                while await self.match_once() == self.batch:
+                    pass
+            except Exception:
+                # I gruppi sono già tornati in coda: si riprova al prossimo giro
+                pass
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+matchmaker = Matchmaker()
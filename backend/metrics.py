@@ -0,0 +1,305 @@
+from collections import defaultdict, deque, Counter as Tally
+from contextvars import ContextVar
+from threading import Lock, Thread, Event, get_ident
+from sqlalchemy import event
+from config import settings
+import hmac
+import logging
+import sys
+import time
+import uuid
+
+SLOW_QUERY_MS = settings.SLOW_QUERY_MS
+PROFILE_TOKEN = settings.PROFILE_TOKEN
+PROFILE_INTERVAL_MS = settings.PROFILE_INTERVAL_MS
+PROFILE_KEEP = settings.PROFILE_KEEP
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+logger = logging.getLogger("lisprocoin.metrics")
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values, extra=""):
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Contatore monotono con etichette"""
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = defaultdict(float)
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, key)} {_number(value)}")
+        return lines
+
+class Histogram:
+    """Istogramma cumulativo in formato Prometheus"""
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        # Per ogni combinazione di etichette: [conteggi per bucket..., somma, conteggio]
+        self._series = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    le = 'le="%s"' % _number(bound)
+                    lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(series[-2])}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+class Gauge:
+    """Valore letto al momento dello scrape da una funzione"""
+
+    def __init__(self, name: str, help: str, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {_number(self.read())}"]
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, read):
+        return self.register(Gauge(name, help, read))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_duration = registry.histogram(
+    "http_request_duration_seconds", "Latenza delle richieste HTTP per route", ("method", "route", "status"))
+db_queries_per_request = registry.histogram(
+    "db_queries_per_request", "Statement SQL eseguiti per richiesta", ("route",), COUNT_BUCKETS)
+db_time_per_request = registry.histogram(
+    "db_time_per_request_seconds", "Tempo speso nel DB per richiesta", ("route",))
+db_query_duration = registry.histogram(
+    "db_query_duration_seconds", "Durata dei singoli statement SQL", ("route",))
+db_slow_queries = registry.counter(
+    "db_slow_queries_total", "Statement SQL oltre SLOW_QUERY_MS", ("route",))
+coinbase_duration = registry.histogram(
+    "coinbase_request_duration_seconds", "Latenza delle chiamate Coinbase", ("operation", "outcome"))
+coinbase_errors = registry.counter(
+    "coinbase_errors_total", "Errori Coinbase (status ritentabili, errori di trasporto)", ("operation", "reason"))
+bcrypt_duration = registry.histogram(
+    "bcrypt_duration_seconds", "Tempo bcrypt incluso l'attesa nel pool", ("operation",))
+jwt_decode_duration = registry.histogram(
+    "jwt_decode_duration_seconds", "Decodifica e verifica dei JWT non in cache")
+cache_requests = registry.counter(
+    "response_cache_requests_total", "Richieste servite dalla cache delle risposte", ("namespace", "result"))
+matchmaking_wait = registry.histogram(
+    "matchmaking_wait_seconds", "Attesa in coda prima di ricevere un tavolo", ("size",),
+    (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+matchmaking_tables = registry.counter(
+    "matchmaking_tables_total", "Tavoli formati dal matchmaking")
+idempotency_requests = registry.counter(
+    "idempotency_requests_total", "Richieste con Idempotency-Key per esito", ("result",))
+rate_limited = registry.counter(
+    "rate_limited_total", "Richieste rifiutate dal rate limiting", ("rule",))
+bulk_rows = registry.counter(
+    "bulk_rows_total", "Righe esportate e importate dagli strumenti di amministrazione", ("operation", "kind"))
+
+class RequestStats:
+    """Contabilità della richiesta corrente, condivisa con i thread tramite il contesto"""
+    __slots__ = ("scope", "queries", "db_time")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.db_time = 0.0
+
+    def route(self):
+        # Il path del template (es. /payouts/{payout_id}) evita etichette ad alta cardinalità
+        route = self.scope.get("route")
+        return getattr(route, "path", "unmatched")
+
+_current = ContextVar("request_stats", default=None)
+
+# ========== SQLALCHEMY ==========
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _current.get()
+    route = stats.route() if stats is not None else "background"
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+    db_query_duration.observe(elapsed, route=route)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        db_slow_queries.inc(route=route)
+        logger.warning("slow query %.1f ms route=%s: %s", elapsed * 1000, route, " ".join(statement.split()))
+
+def _on_error(exception_context):
+    starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+def instrument_engine(engine):
+    """Collega gli hook di timing a un Engine sync (per l'async: async_engine.sync_engine)"""
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute)
+    event.listen(engine, "handle_error", _on_error)
+
+# ========== PROFILER ==========
+
+class SamplingProfiler:
+    """Campiona lo stack di un thread a intervalli fissi e produce stack compressi (formato flamegraph)"""
+
+    def __init__(self, thread_id: int, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+        self.samples = Tally()
+        self._stop = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+profiles = deque(maxlen=PROFILE_KEEP)
+
+def profile_allowed(headers):
+    """Profiling solo se PROFILE_TOKEN è configurato e la richiesta lo presenta"""
+    if not PROFILE_TOKEN:
+        return False
+    return hmac.compare_digest(headers.get("x-profile", ""), PROFILE_TOKEN)
+
+def get_profile(profile_id: str):
+    for profile in profiles:
+        if profile["id"] == profile_id:
+            return profile
+    return None
+
+# ========== MIDDLEWARE ==========
+
+class MetricsMiddleware:
+    """Middleware ASGI: latenza per route, query SQL per richiesta e profiler su richiesta"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+        status = 500
+        profiler = None
+        profile_id = None
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        if profile_allowed(headers):
+            # Campiona il thread del loop: include anche le altre richieste servite nel frattempo
+            profile_id = uuid.uuid4().hex[:12]
+            profiler = SamplingProfiler(get_ident())
+            profiler.start()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profile_id is not None:
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = stats.route()
+            http_duration.observe(elapsed, method=scope["method"], route=route, status=status)
+            db_queries_per_request.observe(stats.queries, route=route)
+            db_time_per_request.observe(stats.db_time, route=route)
+            _current.reset(token)
+            if profiler is not None:
+                profiler.stop()
+                profiles.append({
+                    "id": profile_id,
+                    "route": route,
+                    "seconds": round(elapsed, 4),
+                    "queries": stats.queries,
+                    "samples": sum(profiler.samples.values()),
+                    "collapsed": profiler.collapsed(),
+                })
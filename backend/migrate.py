@@ -0,0 +1,174 @@
+"""Porta lo schema del database allo stato di models.py; da eseguire a ogni deploy, prima dei worker.
+
+Le modifiche sono solo additive: tabelle, colonne e indici mancanti. Una
+colonna NOT NULL senza default su una tabella esistente va migrata a mano.
+
+Unico passo sui dati: i database nati prima del ledger in micro-USDC hanno
+saldi e importi float (users.usdc_balance, transactions.amount,
+payouts.amount). Vengono convertiti una volta in balance_micro/amount_micro
+con round(valore * 1e6) e la colonna float viene rinominata in *_legacy,
+così il passo non si ripete e il dato originale resta consultabile.
+Allo stesso modo tournaments.eliminated (username separati da virgola, in
+ordine di eliminazione) diventa righe di tournament_eliminations e la
+colonna eliminated_legacy. Il turno non era salvato: lo si ricostruisce
+rigiocando la regola del vecchio next_round, max(1, rimasti // 2)
+eliminati per turno; un iscritto arrivato a torneo in corso sposta i
+confini dei turni successivi.
+
+Su SQLite le tabelle dichiarate con sqlite_autoincrement e nate senza
+AUTOINCREMENT vengono ricostruite (ALTER non lo aggiunge), con la sequenza
+che riparte dopo l'id più alto anche dell'archivio: un id archiviato non
+torna in uso. La ricostruzione viene per ultima e conserva le colonne
+*_legacy.
+
+Uso: python -m migrate           applica le modifiche mancanti
+     python -m migrate --check   esce con 1 se ci sono modifiche da applicare
+"""
+from collections import Counter
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateTable
+from database import Base, engine
+import argparse
+import sys
+
+# (tabella, colonna float del vecchio schema, colonna intera in micro-USDC)
+LEGACY_AMOUNTS = (
+    ("users", "usdc_balance", "balance_micro"),
+    ("transactions", "amount", "amount_micro"),
+    ("payouts", "amount", "amount_micro"),
+)
+
+# Archivio delle tabelle con AUTOINCREMENT: la sequenza parte dopo i suoi id
+ARCHIVES = {
+    "tables": "archived_tables",
+    "tournaments": "archived_tournaments",
+}
+
+def _backfill_micro(conn, table: str, legacy: str, target: str):
+    quote = conn.dialect.identifier_preparer.quote
+    table, legacy_q, target = quote(table), quote(legacy), quote(target)
+    conn.exec_driver_sql(
+        f"UPDATE {table} SET {target} = CAST(ROUND({legacy_q} * 1000000) AS BIGINT) WHERE {legacy_q} IS NOT NULL"
+    )
+    conn.exec_driver_sql(f"ALTER TABLE {table} RENAME COLUMN {legacy_q} TO {quote(legacy + '_legacy')}")
+
+def _backfill_eliminations(conn):
+    quote = conn.dialect.identifier_preparer.quote
+    users = dict(conn.exec_driver_sql("SELECT username, id FROM users").all())
+    players = Counter(t for (t,) in conn.exec_driver_sql("SELECT tournament_id FROM tournament_players"))
+    recorded = set(conn.exec_driver_sql("SELECT tournament_id, user_id FROM tournament_eliminations").all())
+    rows = []
+    legacy = conn.exec_driver_sql(f"SELECT id, {quote('eliminated')} FROM tournaments "
+                                  f"WHERE {quote('eliminated')} IS NOT NULL AND {quote('eliminated')} != ''")
+    for tournament_id, eliminated in legacy:
+        names = [name for name in eliminated.split(",") if name]
+        remaining, round, start = players[tournament_id], 1, 0
+        while start < len(names):
+            size = max(1, remaining // 2)
+            for name in names[start:start + size]:
+                # Utenti cancellati o già registrati nel nuovo schema restano fuori
+                user_id = users.get(name)
+                if user_id is not None and (tournament_id, user_id) not in recorded:
+                    recorded.add((tournament_id, user_id))
+                    rows.append({"tournament_id": tournament_id, "user_id": user_id, "round": round})
+            start, remaining, round = start + size, remaining - size, round + 1
+    if rows:
+        conn.execute(Base.metadata.tables["tournament_eliminations"].insert(), rows)
+    conn.exec_driver_sql(f"ALTER TABLE tournaments RENAME COLUMN {quote('eliminated')} TO {quote('eliminated_legacy')}")
+
+def _needs_autoincrement(conn, table):
+    if conn.dialect.name != "sqlite" or not table.dialect_options["sqlite"]["autoincrement"]:
+        return False
+    ddl = conn.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)).scalar()
+    return "AUTOINCREMENT" not in ddl.upper()
+
+def _sqlite_autoincrement(conn, table):
+    """Ricopia la tabella in una nuova con AUTOINCREMENT e ricrea gli indici; FK spente come da default di SQLite"""
+    quote = conn.dialect.identifier_preparer.quote
+    name, rebuilt = quote(table.name), quote(f"_{table.name}_autoincrement")
+    # Le colonne fuori dal modello (i *_legacy) passano nella copia così come sono
+    extra = [column for column in inspect(conn).get_columns(table.name) if column["name"] not in table.c.keys()]
+    columns = ", ".join(quote(column) for column in [*table.c.keys(), *(column["name"] for column in extra)])
+    ddl = str(CreateTable(table).compile(dialect=conn.dialect))
+    conn.exec_driver_sql(ddl.replace(f"CREATE TABLE {name} (", f"CREATE TABLE {rebuilt} (", 1))
+    for column in extra:
+        conn.exec_driver_sql(f"ALTER TABLE {rebuilt} ADD COLUMN {quote(column['name'])} {column['type'].compile(dialect=conn.dialect)}")
+    conn.exec_driver_sql(f"INSERT INTO {rebuilt} ({columns}) SELECT {columns} FROM {name}")
+    conn.exec_driver_sql(f"DROP TABLE {name}")
+    conn.exec_driver_sql(f"ALTER TABLE {rebuilt} RENAME TO {name}")
+    for index in table.indexes:
+        index.create(conn)
+    last = [conn.exec_driver_sql(f"SELECT MAX(id) FROM {name}").scalar() or 0]
+    archive = ARCHIVES.get(table.name)
+    if archive is not None and inspect(conn).has_table(archive):
+        last.append(conn.exec_driver_sql(f"SELECT MAX(id) FROM {quote(archive)}").scalar() or 0)
+    conn.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = ?", (table.name,))
+    conn.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table.name, max(last)))
+
+def pending(conn):
+    """Passi necessari come (descrizione, funzione che li applica su conn)"""
+    import models  # registra le tabelle su Base.metadata
+    inspector = inspect(conn)
+    existing = set(inspector.get_table_names())
+    quote = conn.dialect.identifier_preparer.quote
+    steps, rebuilds = [], []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            # create crea anche gli indici dichiarati sulla tabella
+            steps.append((f"create table {table.name}", lambda c, t=table: t.create(c)))
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            if not column.nullable and column.server_default is None:
+                raise RuntimeError(f"{table.name}.{column.name}: colonna NOT NULL senza default, serve una migrazione manuale")
+            # Le FK non si aggiungono con ALTER su SQLite: la colonna nasce senza vincolo
+            ddl = f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(dialect=conn.dialect)}"
+            if column.server_default is not None:
+                # Le righe esistenti ricevono il default; solo con quello NOT NULL è accettato
+                ddl += f" DEFAULT {column.server_default.arg}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            steps.append((f"add column {table.name}.{column.name}", lambda c, ddl=ddl: c.exec_driver_sql(ddl)))
+        if _needs_autoincrement(conn, table):
+            # Dopo colonne e backfill, che la copia include; gli indici li ricrea la ricostruzione
+            rebuilds.append((f"rebuild {table.name} with AUTOINCREMENT", lambda c, t=table: _sqlite_autoincrement(c, t)))
+            continue
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                steps.append((f"create index {index.name}", lambda c, i=index: i.create(c)))
+    # Dopo le colonne: balance_micro e amount_micro devono già esistere
+    for table_name, legacy, target in LEGACY_AMOUNTS:
+        if table_name in existing and legacy in {column["name"] for column in inspector.get_columns(table_name)}:
+            steps.append((f"backfill {table_name}.{target} from {legacy}",
+                          lambda c, t=table_name, l=legacy, m=target: _backfill_micro(c, t, l, m)))
+    # Dopo le tabelle: tournament_eliminations deve già esistere
+    if "tournaments" in existing and "eliminated" in {column["name"] for column in inspector.get_columns("tournaments")}:
+        steps.append(("backfill tournament_eliminations from tournaments.eliminated", _backfill_eliminations))
+    return steps + rebuilds
+
+def upgrade(bind=engine):
+    """Applica in una transazione i passi mancanti; restituisce le descrizioni"""
+    with bind.begin() as conn:
+        steps = pending(conn)
+        for _, apply in steps:
+            apply(conn)
+    return [description for description, _ in steps]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--check", action="store_true", help="elenca le modifiche senza applicarle")
+    args = parser.parse_args()
+    if args.check:
+        with engine.connect() as conn:
+            steps = [description for description, _ in pending(conn)]
+        for description in steps:
+            print(description)
+        sys.exit(1 if steps else 0)
+    for description in upgrade():
+        print(description)
+
+if __name__ == "__main__":
+    main()
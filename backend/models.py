@@ -1,5 +1,5 @@
-from .database import Base
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime
+from database import Base
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, ForeignKey, Date, DateTime, Index, LargeBinary, JSON, and_
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -8,13 +8,25 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True)
     hashed_password = Column(String)
-    usdc_balance = Column(Float, default=0.0)
+    balance_micro = Column(BigInteger, default=0, server_default="0", nullable=False)  # micro-USDC
     games_played = Column(Integer, default=0)
     games_won = Column(Integer, default=0)
     tournaments_played = Column(Integer, default=0)
     tournaments_won = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Indici per la classifica: ordinamento per metrica decrescente e id come spareggio
+    __table_args__ = (
+        Index("ix_users_games_won_id", "games_won", "id"),
+        Index("ix_users_tournaments_won_id", "tournaments_won", "id"),
+        Index("ix_users_balance_micro_id", "balance_micro", "id"),
+    )
+
+    @property
+    def usdc_balance(self):
+        # Sola lettura: le modifiche passano da ledger con UPDATE atomici
+        return (self.balance_micro or 0) / 1_000_000
+
 class Table(Base):
     __tablename__ = "tables"
     id = Column(Integer, primary_key=True, index=True)
@@ -22,6 +34,23 @@ class Table(Base):
     in_game = Column(Boolean, default=False)
     winner = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)  # chiusura con il vincitore, da qui conta l'archiviazione
+    # Valorizzati solo per i tavoli di un tabellone di torneo
+    tournament_id = Column(Integer, ForeignKey("tournaments.id"), nullable=True)
+    round = Column(Integer, nullable=True)
+
+    # selectin: una sola query IN per tutti i tavoli caricati, niente N+1
+    players = relationship("User", secondary="table_players", lazy="selectin")
+
+    __table_args__ = (
+        Index("ix_tables_tournament_round", "tournament_id", "round"),
+        # Parziale: solo i tavoli vivi della lobby, resta piccolo qualunque sia lo storico
+        Index("ix_tables_live", "in_game", "id",
+              sqlite_where=and_(winner.is_(None), tournament_id.is_(None)),
+              postgresql_where=and_(winner.is_(None), tournament_id.is_(None))),
+        # AUTOINCREMENT: SQLite riassegnerebbe l'id più alto dopo l'archiviazione, in collisione con l'archivio
+        {"sqlite_autoincrement": True},
+    )
 
 class TablePlayer(Base):
     __tablename__ = "table_players"
@@ -29,14 +58,34 @@ class TablePlayer(Base):
     table_id = Column(Integer, ForeignKey("tables.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
 
+    __table_args__ = (
+        Index("ix_table_players_table_user", "table_id", "user_id", unique=True),
+    )
+
 class Tournament(Base):
     __tablename__ = "tournaments"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     round = Column(Integer, default=1)
     winner = Column(String, nullable=True)
-    eliminated = Column(String, default="")
     created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)  # avvio del tabellone, poi iscrizioni chiuse
+    finished_at = Column(DateTime, nullable=True)  # proclamazione del vincitore
+
+    players = relationship("User", secondary="tournament_players", lazy="selectin")
+    eliminated = relationship(
+        "User",
+        secondary="tournament_eliminations",
+        order_by="TournamentElimination.round",
+        lazy="selectin",
+        viewonly=True
+    )
+
+    __table_args__ = (
+        Index("ix_tournaments_live", "id", sqlite_where=winner.is_(None), postgresql_where=winner.is_(None)),
+        # Come tables: gli id archiviati non devono tornare in uso
+        {"sqlite_autoincrement": True},
+    )
 
 class TournamentPlayer(Base):
     __tablename__ = "tournament_players"
@@ -44,11 +93,128 @@ class TournamentPlayer(Base):
     tournament_id = Column(Integer, ForeignKey("tournaments.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
 
+    __table_args__ = (
+        Index("ix_tournament_players_tournament_user", "tournament_id", "user_id", unique=True),
+    )
+
+class TournamentElimination(Base):
+    __tablename__ = "tournament_eliminations"
+    id = Column(Integer, primary_key=True)
+    tournament_id = Column(Integer, ForeignKey("tournaments.id"))
+    user_id = Column(Integer, ForeignKey("users.id"))
+    round = Column(Integer)
+
+    __table_args__ = (
+        Index("ix_tournament_eliminations_tournament_user", "tournament_id", "user_id", unique=True),
+        Index("ix_tournament_eliminations_tournament_round", "tournament_id", "round"),
+    )
+
+class ArchivedTable(Base):
+    """Tavolo concluso spostato da tables dall'archiviazione, con i giocatori denormalizzati"""
+    __tablename__ = "archived_tables"
+    id = Column(Integer, primary_key=True, autoincrement=False)  # lo stesso id del tavolo originale
+    name = Column(String)
+    winner = Column(String)
+    players = Column(JSON)  # username in ordine di arrivo
+    tournament_id = Column(Integer, nullable=True)
+    round = Column(Integer, nullable=True)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_archived_tables_tournament_round", "tournament_id", "round"),
+    )
+
+class ArchivedTournament(Base):
+    """Torneo concluso con iscritti ed eliminati per turno; i suoi tavoli sono in archived_tables"""
+    __tablename__ = "archived_tournaments"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String)
+    round = Column(Integer)
+    winner = Column(String)
+    players = Column(JSON)
+    rounds = Column(JSON)  # [{"round": n, "eliminated": [username, ...]}, ...]
+    created_at = Column(DateTime)
+    started_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
 class Transaction(Base):
     __tablename__ = "transactions"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    amount = Column(Float)
-    tx_type = Column(String)  # 'deposit', 'withdraw', 'win'
+    amount_micro = Column(BigInteger)  # con segno: positivo per gli accrediti
+    tx_type = Column(String)  # 'deposit', 'withdraw', 'win', 'game_fee', 'tournament_fee', 'refund'
     tx_hash = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Storico dell'utente: pagine keyset su (created_at, id) decrescenti
+        Index("ix_transactions_user_created_id", "user_id", "created_at", "id"),
+    )
+
+class UserDailyStats(Base):
+    """Rollup giornaliero delle transazioni di un utente, aggiornato in modo incrementale da history"""
+    __tablename__ = "user_daily_stats"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    day = Column(Date, nullable=False)  # UTC
+    # Importi in micro-USDC, tutti positivi: il segno lo dà la colonna
+    deposits_micro = Column(BigInteger, default=0, nullable=False)
+    withdrawals_micro = Column(BigInteger, default=0, nullable=False)
+    fees_micro = Column(BigInteger, default=0, nullable=False)
+    winnings_micro = Column(BigInteger, default=0, nullable=False)
+    refunds_micro = Column(BigInteger, default=0, nullable=False)
+    volume_micro = Column(BigInteger, default=0, nullable=False)
+    transactions = Column(Integer, default=0, nullable=False)
+    games = Column(Integer, default=0, nullable=False)  # iscrizioni pagate, al netto dei rimborsi
+    wins = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_user_daily_stats_user_day", "user_id", "day", unique=True),
+    )
+
+class RollupState(Base):
+    """High-water mark dei rollup: id dell'ultima transazione già aggregata"""
+    __tablename__ = "rollup_state"
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, default=0, nullable=False)
+    pending = Column(JSON, nullable=True)  # [[id, secondi epoch]] sotto last_id ancora senza transazione committata
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class Payout(Base):
+    """Outbox dei pagamenti verso Coinbase, scritto insieme all'addebito del saldo"""
+    __tablename__ = "payouts"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    amount_micro = Column(BigInteger)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=True)
+    destination = Column(String)
+    kind = Column(String)  # 'game_fee', 'tournament_fee'
+    status = Column(String, default="pending")  # 'pending', 'processing', 'sent', 'failed'
+    idempotency_key = Column(String, unique=True)
+    attempts = Column(Integer, default=0)
+    tx_hash = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_payouts_status_id", "status", "id"),
+    )
+
+class IdempotencyRecord(Base):
+    """Risposta originale di una richiesta con Idempotency-Key, scritta nella stessa transazione dell'operazione"""
+    __tablename__ = "idempotency_records"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    key = Column(String)
+    fingerprint = Column(String)  # hash di metodo, path e corpo della richiesta
+    status_code = Column(Integer)
+    body = Column(LargeBinary)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Fa da arbitro tra worker: due esecuzioni concorrenti della stessa chiave non possono committare entrambe
+        Index("ix_idempotency_records_user_key", "user_id", "key", unique=True),
+        Index("ix_idempotency_records_created_at", "created_at"),
+    )
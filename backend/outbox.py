@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_, update
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import Payout, Transaction, User
+import ledger
+from coinbase import payout_queue
+from config import settings
+import leaderboard
+import asyncio
+import uuid
+
+OUTBOX_WORKERS = settings.OUTBOX_WORKERS
+OUTBOX_BATCH = settings.OUTBOX_BATCH
+OUTBOX_POLL_INTERVAL = settings.OUTBOX_POLL_INTERVAL
+OUTBOX_LEASE_SECONDS = settings.OUTBOX_LEASE_SECONDS
+OUTBOX_MAX_ATTEMPTS = settings.OUTBOX_MAX_ATTEMPTS
+
+# Contatore da ripristinare se un pagamento fallisce definitivamente
+REFUND_COUNTERS = {"tournament_fee": "tournaments_played"}
+
+def enqueue(db: Session, user: User, entry: ledger.Entry, amount_micro: int, destination: str, kind: str):
+    """Aggiunge un pagamento all'outbox; il commit lo fa il chiamante insieme all'addebito"""
+    payout = Payout(
+        user_id=user.id,
+        amount_micro=amount_micro,
+        transaction_id=entry.transaction_id,
+        destination=destination,
+        kind=kind,
+        status="pending",
+        idempotency_key=uuid.uuid4().hex,
+        attempts=0
+    )
+    db.add(payout)
+    return payout
+
+def charge_fee(db: Session, user: User, amount_micro: int, kind: str, **counters):
+    """Addebita la fee e accoda il pagamento nella stessa transazione; restituisce (entry, payout_id)"""
+    entry = ledger.debit(db, user.id, amount_micro, kind, **counters)
+    payout = enqueue(db, user, entry, amount_micro, user.username, kind)
+    db.flush()
+    return entry, payout.id
+
+def get_payout(payout_id: int, user: User, db: Session):
+    return db.query(Payout).filter(Payout.id == payout_id, Payout.user_id == user.id).first()
+
+def claim(limit: int = OUTBOX_BATCH):
+    """Prende in carico i pagamenti pendenti o con lease scaduto (crash di un worker)"""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=OUTBOX_LEASE_SECONDS)
+        claimable = or_(
+            Payout.status == "pending",
+            and_(Payout.status == "processing", Payout.updated_at < stale)
+        )
+        candidates = db.query(Payout.id).filter(claimable).order_by(Payout.id).limit(limit).all()
+        claimed = []
+        for (payout_id,) in candidates:
+            # UPDATE condizionale: se un altro worker l'ha già preso, rowcount è 0
+            result = db.execute(
+                update(Payout)
+                .where(Payout.id == payout_id, claimable)
+                .values(status="processing", attempts=Payout.attempts + 1, updated_at=now)
+            )
+            if result.rowcount == 1:
+                claimed.append(payout_id)
+        db.commit()
+        if not claimed:
+            return []
+        rows = db.query(Payout.id, Payout.amount_micro, Payout.destination, Payout.idempotency_key) \
+            .filter(Payout.id.in_(claimed)).all()
+        return [tuple(row) for row in rows]
+    finally:
+        db.close()
+
+def complete(payout_id: int, ok: bool, message: str, tx_hash: str):
+    db = SessionLocal()
+    try:
+        payout = db.query(Payout).filter(Payout.id == payout_id).first()
+        if payout is None or payout.status != "processing":
+            return
+        payout.updated_at = datetime.utcnow()
+        if ok:
+            payout.status = "sent"
+            payout.tx_hash = tx_hash
+            payout.error = None
+            if payout.transaction_id is not None:
+                db.execute(update(Transaction).where(Transaction.id == payout.transaction_id).values(tx_hash=tx_hash))
+            db.commit()
+            return
+        payout.error = message
+        if payout.attempts < OUTBOX_MAX_ATTEMPTS:
+            payout.status = "pending"
+            db.commit()
+            return
+        # Fallimento definitivo: restituisce la fee nella stessa transazione
+        payout.status = "failed"
+        counter = REFUND_COUNTERS.get(payout.kind)
+        counters = {counter: -1} if counter else {}
+        ledger.credit(db, payout.user_id, payout.amount_micro, "refund", **counters)
+        db.commit()
+        user = db.get(User, payout.user_id)
+        if user:
+            leaderboard.track(user)
+    finally:
+        db.close()
+
+async def _process(payout):
+    payout_id, amount_micro, destination, idempotency_key = payout
+    ok, message, tx_hash = await payout_queue.submit(ledger.from_micro(amount_micro), destination, idempotency_key)
+    await asyncio.to_thread(complete, payout_id, ok, message, tx_hash)
+
+async def _worker():
+    while True:
+        try:
+            batch = await asyncio.to_thread(claim)
+        except Exception:
+            batch = []
+        if not batch:
+            await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+            continue
+        await asyncio.gather(*(_process(payout) for payout in batch), return_exceptions=True)
+
+_tasks = []
+
+def start(workers: int = OUTBOX_WORKERS):
+    """Avvia il pool di worker che svuota l'outbox"""
+    loop = asyncio.get_running_loop()
+    for _ in range(workers):
+        _tasks.append(loop.create_task(_worker()))
+
+async def stop():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
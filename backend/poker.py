@@ -1,8 +1,13 @@
-from database import SessionLocal, Table, User
+from models import Table, User
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-import os
+from events import table_event
+from serialization import table_rows
+from config import settings
 
-GAME_FEE = float(os.getenv("GAME_FEE", "0.03"))
+GAME_FEE = settings.GAME_FEE
+LIST_PAGE_SIZE = settings.LIST_PAGE_SIZE
+TABLE_STATUSES = ("open", "in_game", "finished")
 
 def create_table(name: str, creator: User, db: Session):
     table = Table(name=name, in_game=False, winner=None)
@@ -10,34 +15,24 @@ def create_table(name: str, creator: User, db: Session):
     db.add(table)
     db.commit()
     db.refresh(table)
+    table_event("created", table.id, name=table.name, players=[creator.username])
     return table
 
-def join_table(table_id: int, user: User, db: Session):
-    table = db.query(Table).filter(Table.id == table_id).first()
-    if table and not table.in_game and user not in table.players:
-        table.players.append(user)
-        db.commit()
-    return table
-
-def start_table(table_id: int, db: Session):
-    table = db.query(Table).filter(Table.id == table_id).first()
-    if table and not table.in_game:
-        table.in_game = True
-        db.commit()
-    return table
-
-def declare_winner(table_id: int, winner_username: str, db: Session):
-    table = db.query(Table).filter(Table.id == table_id).first()
-    if table and table.in_game:
-        table.winner = winner_username
-        table.in_game = False
-        db.commit()
-        user = db.query(User).filter(User.username == winner_username).first()
-        if user:
-            user.games_won += 1
-            user.usdc_balance += GAME_FEE * len(table.players)
-            db.commit()
-    return table
+def list_tables(db: Session, status: str = None, after: int = None, limit: int = LIST_PAGE_SIZE):
+    """Tavoli paginati per id, già nella forma TableInfo; status: 'open', 'in_game' o 'finished'
 
-def list_tables(db: Session):
-    return db.query(Table).all()
+    I conclusi restano qui solo finché l'archiviazione non li sposta: i più
+    vecchi si leggono da archive.
+    """
+    # Solo le colonne servite dall'API; i tavoli dei tornei non compaiono nella lobby
+    stmt = select(Table.id, Table.name, Table.in_game, Table.winner).where(Table.tournament_id.is_(None))
+    if status == "open":
+        stmt = stmt.where(Table.in_game == False, Table.winner.is_(None))
+    elif status == "in_game":
+        # winner IS NULL è già implicito (la chiusura azzera in_game) ma serve per usare ix_tables_live
+        stmt = stmt.where(Table.in_game == True, Table.winner.is_(None))
+    elif status == "finished":
+        stmt = stmt.where(Table.winner.isnot(None))
+    if after is not None:
+        stmt = stmt.where(Table.id > after)
+    return table_rows(db, stmt.order_by(Table.id).limit(limit))
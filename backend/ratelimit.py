@@ -0,0 +1,191 @@
+from collections import OrderedDict
+from config import settings
+from metrics import rate_limited
+from cluster import cluster, CLIENT_IP_HEADER
+import math
+import time
+
+RATE_LIMIT_ENABLED = settings.RATE_LIMIT_ENABLED
+RATE_LIMIT_BACKEND = settings.RATE_LIMIT_BACKEND
+RATE_LIMIT_MAX_KEYS = settings.RATE_LIMIT_MAX_KEYS
+RATE_LIMIT_TRUST_PROXY = settings.RATE_LIMIT_TRUST_PROXY
+REDIS_URL = settings.REDIS_URL
+EVICT_BATCH = 8  # chiavi inattive controllate per richiesta
+
+class RateLimited(Exception):
+    """Bucket vuoto: la richiesta va rifiutata con 429 e Retry-After"""
+
+    def __init__(self, rule: str, retry_after: float):
+        super().__init__(rule)
+        self.rule = rule
+        self.retry_after = retry_after
+
+class Rule:
+    """capacity richieste di picco, ricaricate al ritmo di capacity ogni period secondi"""
+    __slots__ = ("name", "capacity", "period", "rate")
+
+    def __init__(self, name: str, capacity: int, period: float):
+        self.name = name
+        self.capacity = capacity
+        self.period = period
+        self.rate = capacity / period
+
+def parse_rules(spec: str):
+    """Da "token=10/60,leaderboard=60/10" a {nome: Rule}"""
+    rules = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, limit = item.partition("=")
+        capacity, _, period = limit.partition("/")
+        rules[name.strip()] = Rule(name.strip(), int(capacity), float(period or 1))
+    return rules
+
+class MemoryStore:
+    """Token bucket in-process: per chiave solo [token, ultimo aggiornamento, istante in cui torna pieno]
+
+    Un bucket pieno equivale a una chiave assente, quindi le chiavi ferme da
+    abbastanza tempo per essersi ricaricate si possono scartare senza perdere
+    nulla. L'ordine di inserimento segue l'ultimo accesso: a ogni chiamata si
+    controllano solo le prime EVICT_BATCH, quindi la pulizia è O(1).
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    async def take(self, key: str, rule: Rule):
+        """Consuma un token; restituisce 0 se concesso, altrimenti i secondi d'attesa"""
+        now = time.monotonic()
+        buckets = self._buckets
+        bucket = buckets.get(key)
+        if bucket is None:
+            # Prima di inserire: la chiave nuova non deve finire tra quelle controllate
+            self._evict(now)
+            tokens = rule.capacity
+            bucket = buckets[key] = [tokens, now, now]
+        else:
+            tokens = min(rule.capacity, bucket[0] + (now - bucket[1]) * rule.rate)
+            buckets.move_to_end(key)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / rule.rate
+        bucket[0] = tokens
+        bucket[1] = now
+        # Istante in cui il bucket torna pieno, cioè indistinguibile da una chiave nuova
+        bucket[2] = now + (rule.capacity - tokens) / rule.rate
+        return wait
+
+    def _evict(self, now: float):
+        buckets = self._buckets
+        for _ in range(EVICT_BATCH):
+            if not buckets:
+                return
+            key, bucket = next(iter(buckets.items()))
+            if bucket[2] > now and len(buckets) <= self.max_keys:
+                return
+            # Pieno oppure oltre il limite di chiavi: si scarta la meno recente
+            del buckets[key]
+
+    def size(self):
+        return len(self._buckets)
+
+# Lo stesso algoritmo in un solo round trip; TIME del server evita di dipendere dagli orologi dei worker
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+class RedisStore:
+    """Bucket condivisi tra processi su un server compatibile Redis (EVAL con TIME, HSET, PEXPIRE)
+
+    client: un client con l'interfaccia di redis.asyncio; se omesso si usa REDIS_URL.
+    """
+
+    def __init__(self, client=None, url: str = REDIS_URL, prefix: str = "lisprocoin:ratelimit:"):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    async def take(self, key: str, rule: Rule):
+        wait = await self.client.eval(TAKE_SCRIPT, 1, self.prefix + key, rule.capacity, rule.rate)
+        return float(wait)
+
+    def size(self):
+        return None
+
+class RateLimiter:
+    """Applica le regole configurate; chiavi per utente autenticato o per IP"""
+
+    def __init__(self, store, rules, enabled: bool = RATE_LIMIT_ENABLED):
+        self.store = store
+        self.rules = rules
+        self.enabled = enabled
+        self.allowed = 0
+        self.rejected = 0
+        self.errors = 0
+
+    async def check(self, rule_name: str, key: str):
+        """Consuma un token della regola per key; solleva RateLimited se il bucket è vuoto"""
+        rule = self.rules.get(rule_name)
+        if not self.enabled or rule is None:
+            return
+        try:
+            wait = await self.store.take(f"{rule_name}:{key}", rule)
+        except Exception:
+            # Backend condiviso irraggiungibile: meglio lasciar passare che bloccare tutte le API
+            self.errors += 1
+            return
+        if wait:
+            self.rejected += 1
+            rate_limited.inc(rule=rule_name)
+            raise RateLimited(rule_name, wait)
+        self.allowed += 1
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.store).__name__,
+            "keys": self.store.size(),
+            "rules": {name: f"{rule.capacity}/{rule.period:g}" for name, rule in self.rules.items()},
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "errors": self.errors,
+        }
+
+def retry_after_header(exc: RateLimited):
+    return str(max(1, math.ceil(exc.retry_after)))
+
+def client_ip(request, trust_proxy: bool = RATE_LIMIT_TRUST_PROXY):
+    # Una richiesta inoltrata da un altro worker arriva dal suo IP: conta quello del client originale
+    if cluster.enabled and CLIENT_IP_HEADER in request.headers and cluster.trusted(request):
+        return request.headers[CLIENT_IP_HEADER]
+    if trust_proxy:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",", 1)[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def make_store(name: str = RATE_LIMIT_BACKEND):
+    if name == "redis":
+        return RedisStore()
+    return MemoryStore()
+
+limiter = RateLimiter(make_store(), parse_rules(settings.RATE_LIMIT_RULES))
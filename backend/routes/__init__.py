@@ -0,0 +1 @@
+"""Router dell'API, uno per area; li registra app.create_app"""
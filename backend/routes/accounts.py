@@ -0,0 +1,54 @@
+"""Registrazione, login e profilo dell'utente"""
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import User
+from schemas import UserCreate, Token, UserOut
+from auth import create_access_token
+from hashing import hash_pool
+from serialization import user_out
+from deps import get_db, get_current_user, limit_by_ip
+import leaderboard
+
+router = APIRouter()
+
+@router.post("/register", response_model=Token, dependencies=[limit_by_ip("register")])
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    if await db.scalar(select(User.id).where(User.username == user.username)):
+        raise HTTPException(status_code=400, detail="Username already registered")
+    # bcrypt può restare in coda a lungo: la connessione torna al pool durante l'attesa
+    await db.close()
+    hashed_password = await hash_pool.hash_password(user.password)
+    db_user = User(
+        username=user.username,
+        hashed_password=hashed_password,
+        balance_micro=0
+    )
+    db.add(db_user)
+    await db.commit()
+    leaderboard.track(db_user)
+    access_token = create_access_token(data={"sub": db_user.username})
+    return {"access_token": access_token, "token_type": "bearer"}
+
+@router.post("/token", response_model=Token, dependencies=[limit_by_ip("token")])
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(User).where(User.username == form_data.username))
+    if not user:
+        raise HTTPException(status_code=400, detail="Incorrect username or password")
+    # Come in register; close() stacca l'utente dalla sessione senza scaderne gli attributi
+    await db.close()
+    valid, new_hash = await hash_pool.verify_password(form_data.password, user.hashed_password)
+    if not valid:
+        raise HTTPException(status_code=400, detail="Incorrect username or password")
+    if new_hash:
+        # Il costo bcrypt è cambiato: aggiorna l'hash in modo trasparente
+        user.hashed_password = new_hash
+        db.add(user)
+        await db.commit()
+    access_token = create_access_token(data={"sub": user.username})
+    return {"access_token": access_token, "token_type": "bearer"}
+
+@router.get("/me", response_model=UserOut)
+async def read_users_me(current_user: User = Depends(get_current_user)):
+    return user_out(current_user)
@@ -0,0 +1,79 @@
+"""Export in streaming e import a blocchi per riconciliazioni e migrazioni; serve X-Admin-Token"""
+from anyio import from_thread
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from deps import get_db, require_admin
+import bulk
+import codecs
+import leaderboard
+import time
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.get("/admin/export/{kind}")
+def api_export(kind: str, format: str = "ndjson", after: int | None = None):
+    if kind not in bulk.KINDS:
+        raise HTTPException(status_code=404, detail="Export not found")
+    if format not in bulk.FORMATS:
+        raise HTTPException(status_code=400, detail="Formato non valido")
+    # Generatore sincrono: Starlette lo consuma nel threadpool, un blocco alla volta
+    return StreamingResponse(bulk.export(kind, format, after), media_type=bulk.MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="{kind}.{format}"'})
+
+def body_lines(request: Request):
+    """Righe del corpo con il loro a capo, come da un file, man mano che arrivano
+
+    Generatore sincrono per csv.reader: va consumato in un thread del
+    threadpool, da cui ogni blocco del corpo si attende sul loop.
+    """
+    chunks = request.stream()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    while True:
+        try:
+            chunk = from_thread.run(chunks.__anext__)
+        except StopAsyncIteration:
+            break
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+@router.post("/admin/import/{kind}")
+async def api_import(request: Request, kind: str, format: str = "ndjson", db: AsyncSession = Depends(get_db)):
+    if kind not in bulk.IMPORT_KINDS:
+        raise HTTPException(status_code=404, detail="Import not found")
+    if format not in bulk.FORMATS:
+        raise HTTPException(status_code=400, detail="Formato non valido")
+    parser = bulk.Parser(kind, format)
+    inserted = skipped = 0
+    start = time.perf_counter()
+
+    async def flush(rows):
+        nonlocal inserted, skipped
+        ids, n = await db.run_sync(lambda s: bulk.import_batch(s, kind, rows))
+        await db.commit()
+        inserted += len(ids)
+        skipped += n
+        if kind == "users":
+            await db.run_sync(lambda s: leaderboard.track_ids(ids, s))
+
+    # I blocchi già committati restano: rilanciando lo stesso file vengono saltati
+    try:
+        # Lettura e parsing nel threadpool, un blocco per passaggio; gli INSERT restano sul loop
+        async for rows in iterate_in_threadpool(bulk.batches(parser.rows(body_lines(request)), bulk.IMPORT_BATCH)):
+            await flush(rows)
+        await db.run_sync(lambda s: bulk.sync_sequence(s, kind))
+        await db.commit()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"{e} ({inserted} righe importate)")
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=f"Righe in conflitto con dati esistenti ({inserted} righe importate)")
+    return bulk.summary(kind, inserted, skipped, time.perf_counter() - start)
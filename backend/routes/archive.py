@@ -0,0 +1,33 @@
+"""Lettura di tavoli e tornei archiviati: liste dal più recente e dettaglio"""
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from schemas import TableInfo
+from deps import get_db, cached_json
+import archive
+
+router = APIRouter()
+
+@router.get("/archive/tables", response_model=list[TableInfo])
+async def api_archived_tables(request: Request, before: int | None = None, limit: int = settings.LIST_PAGE_SIZE, db: AsyncSession = Depends(get_db)):
+    limit = max(1, min(limit, settings.LIST_MAX_PAGE_SIZE))
+    return await cached_json(request, "archive", lambda: db.run_sync(lambda s: archive.list_tables(s, before, limit)))
+
+@router.get("/archive/tables/{table_id}", response_model=TableInfo)
+async def api_archived_table(table_id: int, db: AsyncSession = Depends(get_db)):
+    info = await db.run_sync(lambda s: archive.get_table(s, table_id))
+    if info is None:
+        raise HTTPException(status_code=404, detail="Table not found")
+    return info
+
+@router.get("/archive/tournaments")
+async def api_archived_tournaments(request: Request, before: int | None = None, limit: int = settings.LIST_PAGE_SIZE, db: AsyncSession = Depends(get_db)):
+    limit = max(1, min(limit, settings.LIST_MAX_PAGE_SIZE))
+    return await cached_json(request, "archive", lambda: db.run_sync(lambda s: archive.list_tournaments(s, before, limit)))
+
+@router.get("/archive/tournaments/{tournament_id}")
+async def api_archived_tournament(tournament_id: int, db: AsyncSession = Depends(get_db)):
+    info = await db.run_sync(lambda s: archive.get_tournament(s, tournament_id))
+    if info is None:
+        raise HTTPException(status_code=404, detail="Tournament not found")
+    return info
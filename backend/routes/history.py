@@ -0,0 +1,29 @@
+"""Storico delle transazioni e statistiche del giocatore autenticato"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from models import User
+from deps import get_db, get_current_user
+import history
+
+router = APIRouter()
+
+@router.get("/me/transactions")
+async def api_my_transactions(tx_type: str | None = Query(None, alias="type"), after: str | None = None, limit: int = settings.LIST_PAGE_SIZE,
+                              current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    if tx_type is not None and tx_type not in history.TX_TYPES:
+        raise HTTPException(status_code=400, detail="Tipo di transazione non valido")
+    limit = max(1, min(limit, settings.LIST_MAX_PAGE_SIZE))
+    if after:
+        try:
+            history.decode_cursor(after)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursore non valido")
+    items, next_cursor = await db.run_sync(lambda s: history.page(s, current_user.id, tx_type, after, limit))
+    return {"items": items, "next": next_cursor}
+
+@router.get("/me/stats")
+async def api_my_stats(days: int = settings.STATS_DEFAULT_DAYS, current_user: User = Depends(get_current_user),
+                       db: AsyncSession = Depends(get_db)):
+    days = max(1, min(days, settings.STATS_MAX_DAYS))
+    return await db.run_sync(lambda s: history.user_stats(s, current_user, days))
@@ -0,0 +1,136 @@
+"""Tavoli della lobby e coda di matchmaking
+
+Con più worker le operazioni su un tavolo vengono servite dal suo proprietario
+e quelle di matchmaking dal worker delle code: gli altri le inoltrano.
+"""
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from models import User
+from schemas import TableCreate, TableInfo, TableJoin, TableWinner, MatchRequest
+from poker import create_table, list_tables, TABLE_STATUSES
+from table_manager import table_manager
+from matchmaking import matchmaker, MATCH_DEFAULT_SIZE, MATCH_MAX_SIZE
+from serialization import table_from_active
+from cluster import cluster, MATCHMAKING_WORKER
+from deps import get_db, get_current_user, cached_json, require_admin
+from collections import defaultdict
+import ledger
+import asyncio
+import json
+
+router = APIRouter()
+
+# ========== TAVOLI MULTIPLAYER ==========
+
+@router.post("/tables", response_model=TableInfo)
+async def api_create_table(table: TableCreate, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    # La relazione players va letta dentro run_sync, dove il lazy load sincrono è permesso
+    active = await db.run_sync(lambda s: table_manager.add(create_table(table.name, current_user, s)))
+    return table_from_active(active)
+
+@router.post("/tables/join", response_model=TableInfo)
+async def api_join_table(request: Request, join: TableJoin, current_user: User = Depends(get_current_user)):
+    worker = cluster.owner(join.table_id)
+    if not cluster.local(request, worker):
+        return await cluster.forward(worker, request)
+    obj = await table_manager.join(join.table_id, current_user)
+    if obj is None:
+        raise HTTPException(status_code=404, detail="Table not found or already in game")
+    return table_from_active(obj)
+
+@router.get("/tables", response_model=list[TableInfo])
+async def api_list_tables(request: Request, status: str | None = None, after: int | None = None, limit: int = settings.LIST_PAGE_SIZE, db: AsyncSession = Depends(get_db)):
+    if status is not None and status not in TABLE_STATUSES:
+        raise HTTPException(status_code=400, detail="Stato non valido")
+    limit = max(1, min(limit, settings.LIST_MAX_PAGE_SIZE))
+    return await cached_json(request, "tables", lambda: build_tables(db, status, after, limit))
+
+async def build_tables(db: AsyncSession, status: str | None, after: int | None, limit: int):
+    return await db.run_sync(lambda s: list_tables(s, status, after, limit))
+
+@router.post("/tables/start", response_model=TableInfo)
+async def api_start_table(request: Request, table_id: int):
+    worker = cluster.owner(table_id)
+    if not cluster.local(request, worker):
+        return await cluster.forward(worker, request)
+    obj = await table_manager.start(table_id)
+    if obj is None:
+        raise HTTPException(status_code=404, detail="Table not found or already started")
+    return table_from_active(obj)
+
+# Chiusure e pagamenti in blocco: solo con il token di amministrazione
+@router.post("/tables/settle", dependencies=[Depends(require_admin)])
+async def api_settle_tables(request: Request, winners: list[TableWinner]):
+    by_worker = defaultdict(list)
+    for w in winners:
+        worker = cluster.owner(w.table_id)
+        by_worker[cluster.worker_id if cluster.local(request, worker) else worker].append(w)
+    local = by_worker.pop(cluster.worker_id, [])
+    # Ogni proprietario chiude i suoi tavoli, in parallelo con quelli di questo worker
+    remote = [
+        cluster.forward(worker, request, json.dumps([w.model_dump() for w in group]).encode())
+        for worker, group in by_worker.items()
+    ]
+    settled, *responses = await asyncio.gather(table_manager.settle([(w.table_id, w.winner) for w in local]), *remote)
+    for response in responses:
+        if response.status_code != 200:
+            return response
+        settled.extend(json.loads(response.body)["settled"])
+    return {"settled": settled}
+
+# Come settle: il vincitore decide il piatto, quindi solo con il token di amministrazione
+@router.post("/tables/winner", response_model=TableInfo, dependencies=[Depends(require_admin)])
+async def api_table_winner(request: Request, winner: TableWinner):
+    worker = cluster.owner(winner.table_id)
+    if not cluster.local(request, worker):
+        return await cluster.forward(worker, request)
+    obj = await table_manager.declare_winner(winner.table_id, winner.winner)
+    if obj is None:
+        raise HTTPException(status_code=404, detail="Table not found, not in game or winner not seated")
+    return table_from_active(obj)
+
+# ========== MATCHMAKING ==========
+
+def ticket_info(ticket):
+    return {
+        "status": ticket.status(),
+        "table_id": ticket.table_id,
+        "stake": ledger.from_micro(ticket.stake_micro),
+        "size": ticket.size
+    }
+
+@router.post("/matchmaking")
+async def api_enqueue(http_request: Request, request: MatchRequest, current_user: User = Depends(get_current_user)):
+    if not cluster.local(http_request, MATCHMAKING_WORKER):
+        return await cluster.forward(MATCHMAKING_WORKER, http_request)
+    size = request.size or MATCH_DEFAULT_SIZE
+    if not 2 <= size <= MATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"Posti per tavolo tra 2 e {MATCH_MAX_SIZE}")
+    stake = ledger.to_micro(request.stake)
+    if stake < 0:
+        raise HTTPException(status_code=400, detail="Puntata non valida")
+    return ticket_info(matchmaker.enqueue(current_user, stake, size))
+
+@router.get("/matchmaking")
+async def api_ticket(request: Request, wait: float = 0, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    """Stato del ticket; con wait > 0 attende l'assegnazione del tavolo (long polling)"""
+    if not cluster.local(request, MATCHMAKING_WORKER):
+        await db.close()
+        return await cluster.forward(MATCHMAKING_WORKER, request)
+    ticket = matchmaker.get(current_user.id)
+    if ticket is None:
+        raise HTTPException(status_code=404, detail="Not in queue")
+    if wait > 0 and ticket.status() in ("queued", "matching"):
+        # Restituisce subito la connessione al pool: l'attesa può durare decine di secondi
+        await db.close()
+        await asyncio.wait({ticket.future}, timeout=min(wait, settings.MATCH_WAIT_TIMEOUT))
+    return ticket_info(ticket)
+
+@router.delete("/matchmaking")
+async def api_cancel(request: Request, current_user: User = Depends(get_current_user)):
+    if not cluster.local(request, MATCHMAKING_WORKER):
+        return await cluster.forward(MATCHMAKING_WORKER, request)
+    if not matchmaker.cancel(current_user.id):
+        raise HTTPException(status_code=404, detail="Not in queue")
+    return {"status": "cancelled"}
@@ -0,0 +1,61 @@
+"""Metriche Prometheus, profili e statistiche dei componenti in memoria"""
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from auth import token_cache
+from hashing import hash_pool
+from events import hub
+from cache import response_cache
+from matchmaking import matchmaker
+from idempotency import idempotency_store
+from ratelimit import limiter
+from cluster import cluster
+import metrics
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/metrics/profiles/{profile_id}", response_class=PlainTextResponse)
+def profile_report(profile_id: str, request: Request):
+    # Stesso token che abilita il profiler: gli stack possono esporre dettagli interni
+    if not metrics.profile_allowed(request.headers):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    profile = metrics.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    header = f"# route={profile['route']} seconds={profile['seconds']} queries={profile['queries']} samples={profile['samples']}\n"
+    return PlainTextResponse(header + profile["collapsed"])
+
+@router.get("/stats/auth_cache")
+def auth_cache_stats():
+    return token_cache.stats()
+
+@router.get("/stats/hash_pool")
+def hash_pool_stats():
+    return hash_pool.stats()
+
+@router.get("/stats/events")
+def events_stats():
+    return hub.stats()
+
+@router.get("/stats/cache")
+def cache_stats():
+    return response_cache.stats()
+
+@router.get("/stats/matchmaking")
+def matchmaking_stats():
+    return matchmaker.stats()
+
+@router.get("/stats/idempotency")
+def idempotency_stats():
+    return idempotency_store.stats()
+
+@router.get("/stats/ratelimit")
+def ratelimit_stats():
+    return limiter.stats()
+
+@router.get("/stats/cluster")
+def cluster_stats():
+    return cluster.stats()
@@ -0,0 +1,34 @@
+"""Classifica paginata e posizione del singolo utente"""
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from serialization import user_out
+from deps import get_db, cached_json, limit_by_ip
+import leaderboard
+
+router = APIRouter()
+
+@router.get("/leaderboard", dependencies=[limit_by_ip("leaderboard")])
+async def api_leaderboard(request: Request, by: str = "games_won", after: str | None = None, limit: int = leaderboard.PAGE_SIZE, db: AsyncSession = Depends(get_db)):
+    if by not in leaderboard.METRICS:
+        raise HTTPException(status_code=400, detail="Metrica non valida")
+    limit = max(1, min(limit, leaderboard.MAX_PAGE_SIZE))
+    if after:
+        try:
+            leaderboard.decode_cursor(after)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursore non valido")
+    return await cached_json(request, "leaderboard", lambda: build_leaderboard(db, by, after, limit))
+
+async def build_leaderboard(db: AsyncSession, by: str, after: str | None, limit: int):
+    users, next_cursor = await db.run_sync(lambda s: leaderboard.page(s, by, after, limit))
+    return {"items": [user_out(u) for u in users], "next": next_cursor}
+
+@router.get("/leaderboard/rank/{username}", dependencies=[limit_by_ip("leaderboard")])
+async def api_leaderboard_rank(username: str, by: str = "games_won", db: AsyncSession = Depends(get_db)):
+    if by not in leaderboard.METRICS:
+        raise HTTPException(status_code=400, detail="Metrica non valida")
+    result = await db.run_sync(lambda s: leaderboard.rank(username, by, s))
+    if result is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    position, total = result
+    return {"username": username, "by": by, "rank": position, "total": total}
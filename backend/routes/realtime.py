@@ -0,0 +1,51 @@
+"""Eventi in tempo reale via WebSocket e Server-Sent Events"""
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from config import settings
+from events import hub, valid_topic
+import asyncio
+
+router = APIRouter()
+
+@router.websocket("/ws/{topic}")
+async def ws_subscribe(websocket: WebSocket, topic: str):
+    if not valid_topic(topic):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    subscriber = hub.subscribe(topic)
+    try:
+        while True:
+            data = await subscriber.queue.get()
+            if data is None:
+                # Client troppo lento: deve ricaricare lo stato e iscriversi di nuovo
+                await websocket.close(code=1013, reason="resync")
+                break
+            await websocket.send_text(data)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.unsubscribe(topic, subscriber)
+
+@router.get("/events/{topic}")
+async def sse_subscribe(topic: str, request: Request):
+    if not valid_topic(topic):
+        raise HTTPException(status_code=404, detail="Topic not found")
+    subscriber = hub.subscribe(topic)
+
+    async def stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    data = await asyncio.wait_for(subscriber.queue.get(), settings.SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if data is None:
+                    yield "event: resync\ndata: {}\n\n"
+                    break
+                yield f"data: {data}\n\n"
+        finally:
+            hub.unsubscribe(topic, subscriber)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
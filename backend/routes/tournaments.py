@@ -0,0 +1,122 @@
+"""Tornei: iscrizioni, turni, tabellone e chiusura"""
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from models import User, Table, Tournament
+from schemas import TournamentCreate, TournamentInfo, TournamentJoin, TournamentWinner, TableWinner
+from tournament import create_tournament, join_tournament, next_round, declare_tournament_winner, list_tournaments, round_history, TOURNAMENT_STATUSES
+from bracket import bracket_scheduler, start_bracket, report_matches
+from serialization import tournament_from_orm
+from deps import get_db, get_current_user, cached_json, require_admin
+import settlement
+
+router = APIRouter()
+
+@router.post("/tournaments", response_model=TournamentInfo)
+async def api_create_tournament(tournament: TournamentCreate, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    def work(s: Session):
+        obj = create_tournament(tournament.name, current_user, s)
+        return tournament_from_orm(obj)
+
+    return await db.run_sync(work)
+
+@router.post("/tournaments/join", response_model=TournamentInfo)
+async def api_join_tournament(join: TournamentJoin, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    def work(s: Session):
+        obj = join_tournament(join.tournament_id, current_user, s)
+        if obj is None:
+            return None
+        return tournament_from_orm(obj)
+
+    info = await db.run_sync(work)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Tournament not found or already finished")
+    return info
+
+@router.get("/tournaments", response_model=list[TournamentInfo])
+async def api_list_tournaments(request: Request, status: str | None = None, after: int | None = None, limit: int = settings.LIST_PAGE_SIZE, db: AsyncSession = Depends(get_db)):
+    if status is not None and status not in TOURNAMENT_STATUSES:
+        raise HTTPException(status_code=400, detail="Stato non valido")
+    limit = max(1, min(limit, settings.LIST_MAX_PAGE_SIZE))
+    return await cached_json(request, "tournaments", lambda: build_tournaments(db, status, after, limit))
+
+async def build_tournaments(db: AsyncSession, status: str | None, after: int | None, limit: int):
+    return await db.run_sync(lambda s: list_tournaments(s, status, after, limit))
+
+# L'ultimo turno proclama il vincitore, come /tournaments/winner: solo amministrazione
+@router.post("/tournaments/next_round", response_model=TournamentInfo, dependencies=[Depends(require_admin)])
+async def api_next_round(tournament_id: int, db: AsyncSession = Depends(get_db)):
+    def work(s: Session):
+        obj = next_round(tournament_id, s)
+        if obj is None:
+            return None
+        return tournament_from_orm(obj)
+
+    info = await db.run_sync(work)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Tournament not found or already finished")
+    return info
+
+@router.get("/tournaments/{tournament_id}/rounds")
+async def api_tournament_rounds(tournament_id: int, db: AsyncSession = Depends(get_db)):
+    return await db.run_sync(lambda s: round_history(tournament_id, s))
+
+# Chiusure e pagamenti in blocco: solo con il token di amministrazione
+@router.post("/tournaments/settle", dependencies=[Depends(require_admin)])
+async def api_settle_tournaments(winners: list[TournamentWinner], db: AsyncSession = Depends(get_db)):
+    settled = await db.run_sync(
+        lambda s: settlement.settle_tournaments([(w.tournament_id, w.winner) for w in winners], s)
+    )
+    return {"settled": settled}
+
+# Il tabellone fa avanzare i giocatori e finisce con il montepremi: avvio e risultati solo da amministratore
+@router.post("/tournaments/{tournament_id}/start", dependencies=[Depends(require_admin)])
+async def api_start_bracket(tournament_id: int, db: AsyncSession = Depends(get_db)):
+    tournament = await db.run_sync(lambda s: start_bracket(tournament_id, s))
+    if tournament is None:
+        raise HTTPException(status_code=400, detail="Torneo non avviabile: servono almeno 2 iscritti")
+    return {"tournament_id": tournament_id, "round": tournament.round}
+
+@router.get("/tournaments/{tournament_id}/bracket")
+async def api_bracket(tournament_id: int, round: int | None = None, db: AsyncSession = Depends(get_db)):
+    def work(s: Session):
+        tournament = s.get(Tournament, tournament_id)
+        if tournament is None:
+            return None
+        current = round or tournament.round
+        tables = s.query(Table).filter(Table.tournament_id == tournament_id, Table.round == current) \
+            .order_by(Table.id).all()
+        return {
+            "tournament_id": tournament_id,
+            "round": current,
+            "tables": [
+                {"table_id": t.id, "players": [u.username for u in t.players], "winner": t.winner}
+                for t in tables
+            ]
+        }
+
+    bracket = await db.run_sync(work)
+    if bracket is None:
+        raise HTTPException(status_code=404, detail="Tournament not found")
+    return bracket
+
+@router.post("/tournaments/matches", dependencies=[Depends(require_admin)])
+async def api_report_matches(results: list[TableWinner], db: AsyncSession = Depends(get_db)):
+    closed, _ = await db.run_sync(lambda s: report_matches([(r.table_id, r.winner) for r in results], s))
+    if closed:
+        bracket_scheduler.wake()
+    return {"reported": closed}
+
+@router.post("/tournaments/winner", response_model=TournamentInfo, dependencies=[Depends(require_admin)])
+async def api_tournament_winner(winner: TournamentWinner, db: AsyncSession = Depends(get_db)):
+    def work(s: Session):
+        obj = declare_tournament_winner(winner.tournament_id, winner.winner, s)
+        if obj is None:
+            return None
+        return tournament_from_orm(obj)
+
+    info = await db.run_sync(work)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Tournament not found or already finished")
+    return info
@@ -0,0 +1,82 @@
+"""Depositi, prelievi e fee: ogni operazione di denaro accetta Idempotency-Key"""
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from models import User
+from schemas import TransactionCreate
+from deps import get_db, get_current_user, limit_by_user, idempotent
+import leaderboard
+import ledger
+import outbox
+
+router = APIRouter()
+
+@router.post("/deposit")
+async def deposit(request: Request, transaction: TransactionCreate, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    amount = ledger.to_micro(transaction.amount)
+    if amount <= 0:
+        raise HTTPException(status_code=400, detail="Importo non valido")
+
+    def work(s: Session):
+        entry = ledger.credit(s, current_user.id, amount, "deposit")
+        return {"message": "Deposito effettuato", "usdc_balance": ledger.from_micro(entry.balance_micro)}
+
+    response = await idempotent(request, current_user, db, work)
+    leaderboard.track(current_user)
+    return response
+
+@router.post("/withdraw", dependencies=[limit_by_user("payments")])
+async def withdraw(request: Request, transaction: TransactionCreate, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    amount = ledger.to_micro(transaction.amount)
+    if amount <= 0:
+        raise HTTPException(status_code=400, detail="Importo non valido")
+
+    def work(s: Session):
+        try:
+            entry = ledger.debit(s, current_user.id, amount, "withdraw")
+        except ledger.InsufficientFunds:
+            raise HTTPException(status_code=400, detail="Saldo insufficiente")
+        return {"message": "Prelievo effettuato", "usdc_balance": ledger.from_micro(entry.balance_micro)}
+
+    response = await idempotent(request, current_user, db, work)
+    leaderboard.track(current_user)
+    return response
+
+def fee_work(current_user: User, fee: int, kind: str, message: str, **counters):
+    def work(s: Session):
+        try:
+            entry, payout_id = outbox.charge_fee(s, current_user, fee, kind, **counters)
+        except ledger.InsufficientFunds:
+            raise HTTPException(status_code=400, detail="Saldo insufficiente")
+        return {"message": message, "usdc_balance": ledger.from_micro(entry.balance_micro), "payout_id": payout_id}
+    return work
+
+@router.post("/pay_game_fee", dependencies=[limit_by_user("payments")])
+async def pay_game_fee(request: Request, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    fee = ledger.to_micro(settings.GAME_FEE)
+    response = await idempotent(request, current_user, db, fee_work(current_user, fee, "game_fee", "Fee in elaborazione"))
+    leaderboard.track(current_user)
+    return response
+
+@router.post("/pay_tournament_fee", dependencies=[limit_by_user("payments")])
+async def pay_tournament_fee(request: Request, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    fee = ledger.to_micro(settings.TOURNAMENT_FEE)
+    work = fee_work(current_user, fee, "tournament_fee", "Fee torneo in elaborazione", tournaments_played=1)
+    response = await idempotent(request, current_user, db, work)
+    leaderboard.track(current_user)
+    return response
+
+@router.get("/payouts/{payout_id}")
+async def payout_status(payout_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    payout = await db.run_sync(lambda s: outbox.get_payout(payout_id, current_user, s))
+    if payout is None:
+        raise HTTPException(status_code=404, detail="Payout not found")
+    return {
+        "payout_id": payout.id,
+        "kind": payout.kind,
+        "amount": ledger.from_micro(payout.amount_micro),
+        "status": payout.status,
+        "tx_hash": payout.tx_hash,
+        "error": payout.error
+    }
@@ -1,6 +1,5 @@
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime
 
 class UserCreate(BaseModel):
     username: str
@@ -13,7 +12,6 @@ class UserOut(BaseModel):
     games_won: int
     tournaments_played: int
     tournaments_won: int
-    created_at: datetime
 
 class Token(BaseModel):
     access_token: str
@@ -26,12 +24,11 @@ class TableCreate(BaseModel):
     name: str
 
 class TableInfo(BaseModel):
-    id: int
+    table_id: int
     name: str
     players: List[str]
     in_game: bool
-    winner: Optional[str]
-    created_at: datetime
+    winner: Optional[str] = None
 
 class TableJoin(BaseModel):
     table_id: int
@@ -40,17 +37,20 @@ class TableWinner(BaseModel):
     table_id: int
     winner: str
 
+class MatchRequest(BaseModel):
+    stake: float = 0.0
+    size: Optional[int] = None
+
 class TournamentCreate(BaseModel):
     name: str
 
 class TournamentInfo(BaseModel):
-    id: int
+    tournament_id: int
     name: str
     round: int
     players: List[str]
     eliminated: List[str]
-    winner: Optional[str]
-    created_at: datetime
+    winner: Optional[str] = None
 
 class TournamentJoin(BaseModel):
     tournament_id: int
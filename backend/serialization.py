@@ -0,0 +1,86 @@
+from collections import defaultdict
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from models import User, TablePlayer, TournamentPlayer, TournamentElimination
+from fastapi.responses import ORJSONResponse
+import orjson
+
+# Colonne di User esposte dalle API: niente hash della password, niente created_at
+USER_COLUMNS = (User.id, User.username, User.balance_micro, User.games_played, User.games_won,
+                User.tournaments_played, User.tournaments_won)
+
+def dumps(data) -> bytes:
+    return orjson.dumps(data)
+
+def table_info(table_id: int, name: str, players, in_game: bool, winner: str = None):
+    """Unico costruttore della forma TableInfo usata da tutte le risposte sui tavoli"""
+    return {"table_id": table_id, "name": name, "players": players, "in_game": bool(in_game), "winner": winner}
+
+def table_from_active(table):
+    return table_info(table.id, table.name, table.player_names(), table.in_game, table.winner)
+
+def tournament_info(tournament_id: int, name: str, round: int, players, eliminated, winner: str = None):
+    return {
+        "tournament_id": tournament_id,
+        "name": name,
+        "round": round,
+        "players": players,
+        "eliminated": eliminated,
+        "winner": winner
+    }
+
+def tournament_from_orm(tournament):
+    """Da un Tournament ORM; va chiamata dentro run_sync perché legge le relazioni"""
+    return tournament_info(
+        tournament.id, tournament.name, tournament.round,
+        [u.username for u in tournament.players], [u.username for u in tournament.eliminated],
+        tournament.winner
+    )
+
+def user_out(user):
+    """User ORM o riga proiettata con USER_COLUMNS"""
+    return {
+        "username": user.username,
+        "usdc_balance": (user.balance_micro or 0) / 1_000_000,
+        "games_played": user.games_played,
+        "games_won": user.games_won,
+        "tournaments_played": user.tournaments_played,
+        "tournaments_won": user.tournaments_won
+    }
+
+def usernames_by(db: Session, owner_column, ids, join_column, order_by):
+    """owner_id -> [username], con una sola query sulla tabella di associazione"""
+    names = defaultdict(list)
+    if ids:
+        rows = db.execute(
+            select(owner_column, User.username)
+            .join(User, User.id == join_column)
+            .where(owner_column.in_(ids))
+            .order_by(owner_column, *order_by)
+        )
+        for owner_id, username in rows:
+            names[owner_id].append(username)
+    return names
+
+def table_rows(db: Session, stmt):
+    """stmt seleziona (id, name, in_game, winner) dei tavoli: due query, nessun oggetto ORM"""
+    rows = db.execute(stmt).all()
+    players = usernames_by(db, TablePlayer.table_id, [r[0] for r in rows], TablePlayer.user_id, (TablePlayer.id,))
+    return [table_info(table_id, name, players[table_id], in_game, winner) for table_id, name, in_game, winner in rows]
+
+def tournament_rows(db: Session, stmt):
+    """stmt seleziona (id, name, round, winner) dei tornei: tre query, nessun oggetto ORM"""
+    rows = db.execute(stmt).all()
+    ids = [r[0] for r in rows]
+    players = usernames_by(db, TournamentPlayer.tournament_id, ids, TournamentPlayer.user_id, (TournamentPlayer.id,))
+    eliminated = usernames_by(db, TournamentElimination.tournament_id, ids, TournamentElimination.user_id,
+                               (TournamentElimination.round, TournamentElimination.id))
+    return [
+        tournament_info(tournament_id, name, round, players[tournament_id], eliminated[tournament_id], winner)
+        for tournament_id, name, round, winner in rows
+    ]
+
+__all__ = [
+    "ORJSONResponse", "USER_COLUMNS", "dumps", "table_info", "table_from_active", "tournament_info",
+    "tournament_from_orm", "user_out", "usernames_by", "table_rows", "tournament_rows"
+]
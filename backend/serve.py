@@ -0,0 +1,90 @@
+"""Avvia N worker uvicorn, uno per porta, configurati come un cluster.
+
+Ogni worker è un processo `uvicorn --factory app:create_app` con il suo
+WORKER_ID e l'elenco di tutti i peer (CLUSTER_PEERS); lo schema viene
+applicato una volta con `python -m migrate` prima di avviarli. Un worker che
+termina viene riavviato. Davanti ai worker va un bilanciatore: --nginx stampa
+un blocco upstream pronto da includere.
+
+Con più di un worker servono CLUSTER_BACKEND=redis e RATE_LIMIT_BACKEND=redis,
+e un database che regga scrittori concorrenti (PostgreSQL): ogni worker
+avvisa nei log se la configurazione fa divergere lo stato. Le richieste
+inoltrate tra worker sono firmate con CLUSTER_SECRET (o SECRET_KEY): deve
+essere uguale su tutti i worker e diverso dal default.
+
+Uso: python -m serve --workers 4 --port 8001
+     python -m serve --workers 4 --port 8001 --nginx > lisprocoin-upstream.conf
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+BACKEND = os.path.dirname(os.path.abspath(__file__))
+
+def peers(host: str, port: int, workers: int):
+    return [f"http://{host}:{port + i}" for i in range(workers)]
+
+def worker_env(worker_id: int, urls, base=None):
+    return dict(base if base is not None else os.environ, WORKER_ID=str(worker_id), CLUSTER_PEERS=",".join(urls))
+
+def spawn(worker_id: int, urls, bind: str, port: int, env=None, quiet: bool = False):
+    """Processo uvicorn del worker worker_id, in ascolto su port + worker_id"""
+    command = [
+        sys.executable, "-m", "uvicorn", "--factory", "app:create_app",
+        "--host", bind, "--port", str(port + worker_id), "--no-access-log",
+    ]
+    output = subprocess.DEVNULL if quiet else None
+    return subprocess.Popen(command, cwd=BACKEND, env=worker_env(worker_id, urls, env), stdout=output, stderr=output)
+
+def nginx_upstream(urls, name: str = "lisprocoin"):
+    servers = "".join(f"    server {url.removeprefix('http://')};\n" for url in urls)
+    # Le connessioni WebSocket/SSE restano aperte a lungo: least_conn le distribuisce meglio del round robin
+    return f"upstream {name} {{\n    least_conn;\n{servers}    keepalive 64;\n}}\n"
+
+def migrate(env=None):
+    subprocess.run([sys.executable, "-m", "migrate"], cwd=BACKEND, env=env, check=True)
+
+def run(workers: int, bind: str, host: str, port: int):
+    urls = peers(host, port, workers)
+    procs = {i: spawn(i, urls, bind, port) for i in range(workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while not stopping:
+        time.sleep(0.5)
+        for i, proc in procs.items():
+            if proc.poll() is not None and not stopping:
+                # Il proprietario dei tavoli torna sulla stessa porta e li ricarica dal DB
+                print(f"worker {i} terminato ({proc.returncode}), riavvio", file=sys.stderr)
+                procs[i] = spawn(i, urls, bind, port)
+    for proc in procs.values():
+        proc.terminate()
+    for proc in procs.values():
+        proc.wait()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--port", type=int, default=8001, help="porta del worker 0; gli altri seguono")
+    parser.add_argument("--bind", default="0.0.0.0")
+    parser.add_argument("--host", default="127.0.0.1", help="indirizzo con cui i worker si raggiungono tra loro")
+    parser.add_argument("--nginx", action="store_true", help="stampa il blocco upstream ed esce")
+    parser.add_argument("--skip-migrate", action="store_true")
+    args = parser.parse_args()
+    if args.nginx:
+        print(nginx_upstream(peers(args.host, args.port, args.workers)), end="")
+        return
+    if not args.skip_migrate:
+        migrate()
+    run(args.workers, args.bind, args.host, args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+from collections import Counter, defaultdict
+from datetime import datetime
+from sqlalchemy import update, func, case, exists
+from sqlalchemy.orm import Session
+from models import User, Table, TablePlayer, Tournament, TournamentPlayer
+from events import table_event, tournament_event
+from config import settings
+import leaderboard
+import ledger
+
+GAME_FEE = settings.GAME_FEE
+TOURNAMENT_FEE = settings.TOURNAMENT_FEE
+
+def _user_ids(usernames, db: Session):
+    if not usernames:
+        return {}
+    return dict(db.query(User.username, User.id).filter(User.username.in_(list(usernames))).all())
+
+def settle_tables(results, db: Session):
+    """Chiude molti tavoli in una sola transazione
+
+    results: coppie (table_id, winner_username). Ogni partecipante riceve
+    games_played, il vincitore games_won e il piatto. I tavoli non in gioco o
+    con un vincitore non seduto al tavolo vengono ignorati, come in
+    bracket.report_matches. Restituisce gli id dei tavoli chiusi.
+    """
+    winners = dict(results)
+    if not winners:
+        return []
+    # UPDATE condizionale come in ledger.debit: tra due settle concorrenti dello
+    # stesso tavolo solo uno lo trova ancora in gioco e paga il piatto.
+    # I tavoli di torneo si chiudono da bracket.report_matches, senza piatto
+    winner = case(winners, value=Table.id)
+    seated = exists().where(TablePlayer.table_id == Table.id, TablePlayer.user_id == User.id, User.username == winner)
+    table_ids = db.execute(
+        update(Table)
+        .where(Table.id.in_(list(winners)), Table.in_game == True, Table.winner.is_(None), Table.tournament_id.is_(None), seated)
+        .values(winner=winner, in_game=False, finished_at=datetime.utcnow())
+        .returning(Table.id),
+        execution_options={"synchronize_session": False}
+    ).scalars().all()
+    if not table_ids:
+        # Il chiamante può aver scritto i posti nella stessa transazione
+        db.commit()
+        return []
+
+    seats = defaultdict(list)
+    for table_id, user_id in db.query(TablePlayer.table_id, TablePlayer.user_id) \
+            .filter(TablePlayer.table_id.in_(table_ids)):
+        seats[table_id].append(user_id)
+    user_ids = _user_ids({winners[t] for t in table_ids}, db)
+
+    played, won, prize = Counter(), Counter(), Counter()
+    fee = ledger.to_micro(GAME_FEE)
+    for table_id in table_ids:
+        players = seats[table_id]
+        played.update(players)
+        winner_id = user_ids.get(winners[table_id])
+        if winner_id is not None:
+            won[winner_id] += 1
+            prize[winner_id] += fee * len(players)
+
+    ledger.credit_many(
+        db,
+        [
+            {"user_id": user_id, "amount_micro": prize[user_id], "games_played": played[user_id], "games_won": won[user_id]}
+            for user_id in played.keys() | won.keys()
+        ],
+        "win",
+        counters=("games_played", "games_won")
+    )
+    db.commit()
+
+    leaderboard.track_ids(won.keys(), db)
+    for table_id in table_ids:
+        table_event("winner", table_id, winner=winners[table_id])
+    return table_ids
+
+def settle_tournaments(results, db: Session):
+    """Chiude molti tornei in una sola transazione: winner, tournaments_won e montepremi"""
+    winners = dict(results)
+    if not winners:
+        return []
+    # Come per i tavoli: il bracket e /tournaments/settle possono chiudere lo stesso torneo insieme
+    rows = db.execute(
+        update(Tournament)
+        .where(Tournament.id.in_(list(winners)), Tournament.winner.is_(None))
+        .values(winner=case(winners, value=Tournament.id), finished_at=datetime.utcnow())
+        .returning(Tournament.id, Tournament.round),
+        execution_options={"synchronize_session": False}
+    ).all()
+    rounds = dict(rows)
+    if not rounds:
+        db.commit()
+        return []
+
+    entrants = dict(
+        db.query(TournamentPlayer.tournament_id, func.count(TournamentPlayer.user_id))
+        .filter(TournamentPlayer.tournament_id.in_(list(rounds)))
+        .group_by(TournamentPlayer.tournament_id)
+        .all()
+    )
+    user_ids = _user_ids({winners[t] for t in rounds}, db)
+
+    won, prize = Counter(), Counter()
+    fee = ledger.to_micro(TOURNAMENT_FEE)
+    for tournament_id in rounds:
+        winner_id = user_ids.get(winners[tournament_id])
+        if winner_id is not None:
+            won[winner_id] += 1
+            prize[winner_id] += fee * entrants.get(tournament_id, 0)
+
+    ledger.credit_many(
+        db,
+        [{"user_id": user_id, "amount_micro": prize[user_id], "tournaments_won": won[user_id]} for user_id in won],
+        "win",
+        counters=("tournaments_won",)
+    )
+    db.commit()
+
+    leaderboard.track_ids(won.keys(), db)
+    for tournament_id, round in rounds.items():
+        tournament_event("winner", tournament_id, round=round, winner=winners[tournament_id])
+    return list(rounds)
@@ -0,0 +1,244 @@
+from contextlib import AsyncExitStack
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session, selectinload
+from database import SessionLocal
+from models import Table, TablePlayer, User
+from events import table_event
+from config import settings
+from cache import response_cache
+from cluster import cluster
+import settlement
+import asyncio
+
+TABLE_FLUSH_INTERVAL = settings.TABLE_FLUSH_INTERVAL
+
+class ActiveTable:
+    """Stato in memoria di un tavolo non ancora concluso"""
+    __slots__ = ("id", "name", "in_game", "winner", "seats", "usernames", "new_seats", "dirty", "lock")
+
+    def __init__(self, id: int, name: str, in_game: bool, usernames: dict):
+        self.id = id
+        self.name = name
+        self.in_game = in_game
+        self.winner = None
+        self.seats = set(usernames)
+        self.usernames = usernames
+        self.new_seats = set()  # posti non ancora scritti sul DB
+        self.dirty = False
+        self.lock = asyncio.Lock()
+
+    def player_names(self):
+        return list(self.usernames.values())
+
+class TableManager:
+    """Tavoli attivi in memoria, persistiti sul DB in write-behind"""
+
+    def __init__(self, flush_interval: float = TABLE_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._tables = {}
+        self._dirty = set()
+        self._write_lock = asyncio.Lock()
+        self._flusher = None
+
+    def __len__(self):
+        return len(self._tables)
+
+    def get(self, table_id: int):
+        return self._tables.get(table_id)
+
+    @staticmethod
+    def _query(db: Session):
+        return db.query(Table).options(selectinload(Table.players)).filter(Table.winner.is_(None), Table.tournament_id.is_(None))
+
+    def load(self):
+        """Ripristino dopo un crash: ricarica dal DB i tavoli senza vincitore di cui questo worker è proprietario"""
+        db = SessionLocal()
+        try:
+            query = self._query(db)
+            if cluster.enabled:
+                query = query.filter(Table.id % cluster.size == cluster.worker_id)
+            self._tables = {
+                t.id: ActiveTable(t.id, t.name, bool(t.in_game), {u.id: u.username for u in t.players})
+                for t in query.all()
+            }
+            self._dirty.clear()
+        finally:
+            db.close()
+
+    def _load_one(self, table_id: int):
+        db = SessionLocal()
+        try:
+            t = self._query(db).filter(Table.id == table_id).first()
+            if t is None:
+                return None
+            return ActiveTable(t.id, t.name, bool(t.in_game), {u.id: u.username for u in t.players})
+        finally:
+            db.close()
+
+    async def _lookup(self, table_id: int):
+        """Tavolo attivo; con più worker quelli creati altrove vengono caricati al primo accesso"""
+        table = self._tables.get(table_id)
+        if table is not None or not cluster.enabled or not cluster.owns(table_id):
+            return table
+        loaded = await asyncio.to_thread(self._load_one, table_id)
+        if loaded is None:
+            return None
+        # Due caricamenti concorrenti: vale il primo, che potrebbe avere già modifiche in memoria
+        return self._tables.setdefault(table_id, loaded)
+
+    def add(self, table: Table):
+        """Registra un tavolo appena creato (la creazione resta sincrona per avere l'id)"""
+        return self.add_seated(table.id, table.name, {u.id: u.username for u in table.players}, bool(table.in_game))
+
+    def add_seated(self, table_id: int, name: str, usernames: dict, in_game: bool = False):
+        """Registra un tavolo già scritto sul DB con i suoi posti (es. dal matchmaking)"""
+        active = ActiveTable(table_id, name, in_game, usernames)
+        # Il tavolo di un altro worker è già sul DB: il proprietario lo caricherà al primo accesso
+        if cluster.owns(table_id):
+            self._tables[table_id] = active
+        return active
+
+    def _mark(self, table: ActiveTable):
+        table.dirty = True
+        self._dirty.add(table.id)
+
+    def _alive(self, table: ActiveTable):
+        return self._tables.get(table.id) is table and table.winner is None
+
+    async def join(self, table_id: int, user: User):
+        table = await self._lookup(table_id)
+        if table is None:
+            return None
+        async with table.lock:
+            # Un settle concluso durante l'attesa del lock ha già tolto il tavolo
+            if not self._alive(table):
+                return None
+            if not table.in_game and user.id not in table.seats:
+                table.seats.add(user.id)
+                table.usernames[user.id] = user.username
+                table.new_seats.add(user.id)
+                self._mark(table)
+                table_event("join", table_id, player=user.username)
+        return table
+
+    async def start(self, table_id: int):
+        table = await self._lookup(table_id)
+        if table is None:
+            return None
+        async with table.lock:
+            if not self._alive(table):
+                return None
+            if not table.in_game:
+                table.in_game = True
+                self._mark(table)
+                table_event("start", table_id)
+        return table
+
+    def _snapshot(self, table_ids):
+        # Chiamata sul loop: i posti passano da new_seats allo snapshot una sola volta
+        snapshot = []
+        for table_id in table_ids:
+            table = self._tables.get(table_id)
+            if table is None or not table.dirty:
+                continue
+            snapshot.append((table_id, table.in_game, list(table.new_seats)))
+            table.new_seats.clear()
+            table.dirty = False
+            self._dirty.discard(table_id)
+        return snapshot
+
+    def _restore(self, snapshot):
+        for table_id, _, seats in snapshot:
+            table = self._tables.get(table_id)
+            if table is not None:
+                table.new_seats.update(seats)
+                self._mark(table)
+
+    @staticmethod
+    def _persist(snapshot, db: Session):
+        seats = [{"table_id": table_id, "user_id": user_id} for table_id, _, users in snapshot for user_id in users]
+        if seats:
+            db.execute(insert(TablePlayer), seats)
+        db.execute(update(Table), [{"id": table_id, "in_game": in_game} for table_id, in_game, _ in snapshot])
+
+    def _write(self, snapshot, results=None):
+        db = SessionLocal()
+        try:
+            if snapshot:
+                self._persist(snapshot, db)
+            if results:
+                # settle_tables fa il commit: posti e chiusura finiscono nella stessa transazione
+                return settlement.settle_tables(results, db)
+            db.commit()
+            return []
+        finally:
+            db.close()
+
+    async def flush(self):
+        """Scrive sul DB i tavoli modificati dall'ultimo flush"""
+        async with self._write_lock:
+            snapshot = self._snapshot(list(self._dirty))
+            if not snapshot:
+                return
+            try:
+                await asyncio.to_thread(self._write, snapshot)
+            except Exception:
+                self._restore(snapshot)
+                raise
+            # Gli eventi join/start precedono la scrittura: la lobby in cache va riletta dopo il flush
+            response_cache.invalidate("tables")
+
+    async def settle(self, results):
+        """Chiude i tavoli in gioco: flush dei loro posti e settlement in un'unica transazione"""
+        winners = {table_id: winner for table_id, winner in results if await self._lookup(table_id) is not None}
+        async with AsyncExitStack() as stack:
+            # Lock acquisiti in ordine di id per evitare deadlock tra settle concorrenti
+            for table_id in sorted(winners):
+                table = self._tables.get(table_id)
+                if table is not None:
+                    await stack.enter_async_context(table.lock)
+            winners = {t: w for t, w in winners.items() if t in self._tables and self._tables[t].in_game}
+            if not winners:
+                return []
+            async with self._write_lock:
+                snapshot = self._snapshot(list(winners))
+                try:
+                    settled = await asyncio.to_thread(self._write, snapshot, list(winners.items()))
+                except Exception:
+                    self._restore(snapshot)
+                    raise
+            for table_id in settled:
+                table = self._tables.pop(table_id)
+                table.winner = winners[table_id]
+                table.in_game = False
+            return settled
+
+    async def declare_winner(self, table_id: int, winner_username: str):
+        table = await self._lookup(table_id)
+        if table is None:
+            return None
+        # Nessuna chiusura se il vincitore non è seduto al tavolo
+        if not await self.settle([(table_id, winner_username)]):
+            return None
+        return table
+
+    async def _run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                # I posti restano in memoria e verranno riscritti al prossimo giro
+                pass
+
+    def start_flusher(self):
+        self._flusher = asyncio.get_running_loop().create_task(self._run_flusher())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+table_manager = TableManager()
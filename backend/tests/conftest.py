@@ -0,0 +1,10 @@
+"""Ambiente dei test: database SQLite temporaneo, impostato prima di importare l'app"""
+import os
+import sys
+import tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+# database.py legge DATABASE_URL all'import
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="lisprocoin-test-"), "test.db")
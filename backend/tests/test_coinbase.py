@@ -0,0 +1,132 @@
+"""Client Coinbase e PayoutQueue contro un httpx.MockTransport: batch, retry, Retry-After e idempotenza"""
+import asyncio
+import json
+import httpx
+import pytest
+import coinbase
+from coinbase import CoinbaseClient, PayoutQueue
+
+class FakeCoinbase:
+    """Risponde con gli status in coda, poi 201; registra le richieste ricevute"""
+
+    def __init__(self, *statuses, headers=None):
+        self.statuses = list(statuses)
+        self.headers = headers or {}
+        self.requests = []
+
+    def __call__(self, request: httpx.Request):
+        self.requests.append(json.loads(request.content))
+        if self.statuses:
+            status = self.statuses.pop(0)
+            if isinstance(status, Exception):
+                raise status
+            return httpx.Response(status, headers=self.headers, json={"error": status})
+        return httpx.Response(201, json={"data": {"id": f"tx-{len(self.requests)}"}})
+
+    def keys(self):
+        return [body["idem"] for body in self.requests]
+
+def client_for(fake: FakeCoinbase, **options):
+    options.setdefault("backoff", 0.001)
+    return CoinbaseClient(base_url="http://coinbase.test", api_key="k", wallet_id="w",
+                          transport=httpx.MockTransport(fake), **options)
+
+def send(client: CoinbaseClient, *args):
+    async def run():
+        try:
+            return await client.send_usdc(*args)
+        finally:
+            await client.aclose()
+    return asyncio.run(run())
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Attese del backoff registrate invece che dormite"""
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(coinbase.asyncio, "sleep", sleep)
+    return delays
+
+def test_retries_keep_the_idempotency_key(sleeps):
+    fake = FakeCoinbase(503, 502)
+    assert send(client_for(fake), 1.5, "wallet-a") == (True, "Success", "tx-3")
+    assert len(fake.requests) == 3
+    # Ogni tentativo riusa la stessa chiave: Coinbase non può pagare due volte
+    assert len(set(fake.keys())) == 1
+    assert len(sleeps) == 2
+
+def test_explicit_idempotency_key_is_sent():
+    fake = FakeCoinbase()
+    send(client_for(fake), 2, "wallet-a", "payout-42")
+    assert fake.keys() == ["payout-42"]
+
+def test_transport_errors_are_retried(sleeps):
+    fake = FakeCoinbase(httpx.ConnectError("down"))
+    assert send(client_for(fake), 1, "wallet-a")[0] is True
+    assert len(fake.requests) == 2
+
+def test_retry_after_sets_the_minimum_delay(sleeps):
+    fake = FakeCoinbase(429, headers={"Retry-After": "3"})
+    assert send(client_for(fake), 1, "wallet-a")[0] is True
+    # delay * (1 + jitter) con delay almeno Retry-After
+    assert len(sleeps) == 1 and 3 <= sleeps[0] < 6
+
+def test_gives_up_after_max_retries(sleeps):
+    fake = FakeCoinbase(*[503] * 10)
+    ok, message, tx_hash = send(client_for(fake, max_retries=2), 1, "wallet-a")
+    assert (ok, tx_hash) == (False, None) and message.startswith("Error 503")
+    assert len(fake.requests) == 3
+
+def test_client_errors_are_not_retried(sleeps):
+    fake = FakeCoinbase(400)
+    assert send(client_for(fake), 1, "wallet-a")[0] is False
+    assert len(fake.requests) == 1 and not sleeps
+
+def test_queue_batches_close_payouts():
+    fake = FakeCoinbase()
+    queue = PayoutQueue(client_for(fake), window=0.05, max_batch=5)
+    batches = []
+    flush = queue._flush
+
+    async def spy(batch):
+        batches.append(len(batch))
+        await flush(batch)
+
+    queue._flush = spy
+
+    async def run():
+        try:
+            return await asyncio.gather(*(queue.submit(1, f"wallet-{i}", f"key-{i}") for i in range(12)))
+        finally:
+            await queue.aclose()
+
+    results = asyncio.run(run())
+    assert all(ok for ok, _, _ in results)
+    assert batches == [5, 5, 2]
+    assert sorted(fake.keys()) == sorted(f"key-{i}" for i in range(12))
+
+def test_aclose_sends_queued_payouts_and_queue_survives_a_new_loop():
+    fake = FakeCoinbase()
+    queue = PayoutQueue(client_for(fake), window=10, max_batch=100)
+
+    async def shutdown_with_pending():
+        pending = [asyncio.create_task(queue.submit(1, f"wallet-{i}")) for i in range(3)]
+        await asyncio.sleep(0.01)
+        # La finestra è lunga: i payout sono ancora in raccolta quando arriva lo shutdown
+        await queue.aclose()
+        return await asyncio.wait_for(asyncio.gather(*pending), 1)
+
+    assert all(ok for ok, _, _ in asyncio.run(shutdown_with_pending()))
+
+    async def next_lifespan():
+        try:
+            return await asyncio.wait_for(queue.submit(1, "wallet-after"), 1)
+        finally:
+            await queue.aclose()
+
+    queue.window = 0.01
+    assert asyncio.run(next_lifespan())[0] is True
+    assert len(fake.requests) == 4
@@ -0,0 +1,73 @@
+"""Prelievi concorrenti sullo stesso conto: l'UPDATE condizionale non lascia mai il saldo negativo"""
+from concurrent.futures import ThreadPoolExecutor
+import uuid
+import pytest
+from sqlalchemy.exc import OperationalError
+from database import Base, SessionLocal, engine
+from models import User, Transaction
+import ledger
+
+AMOUNT = 30_000
+THREADS = 8
+PER_THREAD = 10
+
+def make_user(balance_micro: int):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = User(username=f"ledger-{uuid.uuid4().hex[:8]}", hashed_password="x", balance_micro=balance_micro)
+        db.add(user)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+def withdraw(user_id: int, attempts: int):
+    succeeded = 0
+    db = SessionLocal()
+    try:
+        for _ in range(attempts):
+            while True:
+                try:
+                    ledger.debit(db, user_id, AMOUNT, "withdraw")
+                    db.commit()
+                    succeeded += 1
+                except ledger.InsufficientFunds:
+                    db.rollback()
+                except OperationalError:
+                    # SQLite occupato da un altro writer: si riprova lo stesso prelievo
+                    db.rollback()
+                    continue
+                break
+    finally:
+        db.close()
+    return succeeded
+
+def test_concurrent_debits_never_overdraw():
+    # Il saldo copre metà dei tentativi: l'altra metà deve essere rifiutata
+    initial = AMOUNT * THREADS * PER_THREAD // 2
+    user_id = make_user(initial)
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        succeeded = sum(pool.map(withdraw, [user_id] * THREADS, [PER_THREAD] * THREADS))
+
+    db = SessionLocal()
+    try:
+        final = db.query(User.balance_micro).filter(User.id == user_id).scalar()
+        recorded = db.query(Transaction).filter(Transaction.user_id == user_id).count()
+    finally:
+        db.close()
+    assert succeeded == initial // AMOUNT
+    assert final == initial - succeeded * AMOUNT == 0
+    assert recorded == succeeded
+
+def test_debit_over_balance_changes_nothing():
+    user_id = make_user(AMOUNT - 1)
+    db = SessionLocal()
+    try:
+        with pytest.raises(ledger.InsufficientFunds):
+            ledger.debit(db, user_id, AMOUNT, "withdraw")
+        db.rollback()
+        assert db.query(User.balance_micro).filter(User.id == user_id).scalar() == AMOUNT - 1
+        assert db.query(Transaction).filter(Transaction.user_id == user_id).count() == 0
+    finally:
+        db.close()
@@ -0,0 +1,61 @@
+"""Regressione N+1: le liste della lobby eseguono lo stesso numero di query con 3 o 30 righe"""
+import asyncio
+import httpx
+import pytest
+from sqlalchemy import event
+from database import Base, SessionLocal, engine, async_engine
+from models import User, Table, TablePlayer, Tournament, TournamentPlayer, TournamentElimination
+from cache import response_cache
+from app import create_app
+
+def seed(rows: int):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        users = [User(username=f"u{i}", hashed_password="x") for i in range(4)]
+        db.add_all(users)
+        db.flush()
+        for i in range(rows):
+            table = Table(name=f"t{i}")
+            tournament = Tournament(name=f"c{i}")
+            db.add_all([table, tournament])
+            db.flush()
+            db.add_all([TablePlayer(table_id=table.id, user_id=u.id) for u in users])
+            db.add_all([TournamentPlayer(tournament_id=tournament.id, user_id=u.id) for u in users])
+            db.add(TournamentElimination(tournament_id=tournament.id, user_id=users[0].id, round=1))
+        db.commit()
+    finally:
+        db.close()
+
+def count_queries(path: str):
+    """Statement SQL eseguiti da una GET a path e dimensione della risposta"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    async def request():
+        app = create_app()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            # La cache delle risposte nasconderebbe le query: ogni misura parte da vuota
+            response_cache.invalidate("tables")
+            response_cache.invalidate("tournaments")
+            event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+            try:
+                response = await client.get(path)
+            finally:
+                event.remove(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+        assert response.status_code == 200
+        return len(statements), len(response.json())
+
+    return asyncio.run(request())
+
+@pytest.mark.parametrize("path", ["/tables", "/tournaments"])
+def test_list_query_count_is_constant(path):
+    seed(3)
+    few, few_rows = count_queries(path)
+    seed(30)
+    many, many_rows = count_queries(path)
+    assert (few_rows, many_rows) == (3, 30)
+    assert 0 < few == many
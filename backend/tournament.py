@@ -1,53 +1,90 @@
-from database import SessionLocal, Tournament, User
-from sqlalchemy.orm import Session
-import os
+from models import Tournament, User, TournamentPlayer, TournamentElimination
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session, lazyload
+from events import tournament_event
+from settlement import settle_tournaments
+from serialization import tournament_rows
+from config import settings
 import random
 
-TOURNAMENT_FEE = float(os.getenv("TOURNAMENT_FEE", "1"))
+TOURNAMENT_FEE = settings.TOURNAMENT_FEE
+LIST_PAGE_SIZE = settings.LIST_PAGE_SIZE
+TOURNAMENT_STATUSES = ("open", "finished")
 
 def create_tournament(name: str, creator: User, db: Session):
-    tournament = Tournament(name=name, round=1, winner=None, eliminated="")
+    tournament = Tournament(name=name, round=1, winner=None)
     tournament.players.append(creator)
     db.add(tournament)
     db.commit()
     db.refresh(tournament)
+    tournament_event("created", tournament.id, name=tournament.name, players=[creator.username])
     return tournament
 
 def join_tournament(tournament_id: int, user: User, db: Session):
     tournament = db.query(Tournament).filter(Tournament.id == tournament_id).first()
-    if tournament and not tournament.winner and user not in tournament.players:
+    if tournament and not tournament.winner and not tournament.started_at and user not in tournament.players:
         tournament.players.append(user)
         db.commit()
+        tournament_event("join", tournament.id, player=user.username)
     return tournament
 
+def remaining_players(tournament_id: int, db: Session):
+    """Coppie (id, username) ancora in gara, calcolate in SQL con un anti-join sugli eliminati"""
+    eliminated = select(TournamentElimination.user_id).where(TournamentElimination.tournament_id == tournament_id)
+    rows = db.query(User.id, User.username) \
+        .join(TournamentPlayer, TournamentPlayer.user_id == User.id) \
+        .filter(TournamentPlayer.tournament_id == tournament_id, User.id.not_in(eliminated))
+    return [tuple(row) for row in rows]
+
+def eliminate(tournament_id: int, round: int, user_ids, db: Session):
+    """Registra le eliminazioni di un turno con un unico INSERT multiplo"""
+    if user_ids:
+        db.execute(
+            insert(TournamentElimination),
+            [{"tournament_id": tournament_id, "user_id": user_id, "round": round} for user_id in user_ids]
+        )
+
 def next_round(tournament_id: int, db: Session):
-    tournament = db.query(Tournament).filter(Tournament.id == tournament_id).first()
-    if tournament and not tournament.winner:
-        eliminated = tournament.eliminated.split(",") if tournament.eliminated else []
-        remaining = [u.username for u in tournament.players if u.username not in eliminated]
+    # Le liste giocatori/eliminati non servono qui: il turno si calcola in SQL
+    tournament = db.query(Tournament).options(lazyload("*")).filter(Tournament.id == tournament_id).first()
+    # Con il tabellone avviato i turni avanzano dai risultati dei tavoli, non a mano
+    if tournament and not tournament.winner and not tournament.started_at:
+        remaining = remaining_players(tournament_id, db)
         if len(remaining) == 1:
-            tournament.winner = remaining[0]
-            tournament.round += 1
-            db.commit()
+            # Come /tournaments/winner: chiusura condizionale, tournaments_won e montepremi
+            settle_tournaments([(tournament_id, remaining[0][1])], db)
+            db.refresh(tournament)
             return tournament
         to_eliminate = random.sample(remaining, max(1, len(remaining)//2))
-        eliminated += to_eliminate
-        tournament.eliminated = ",".join(eliminated)
+        eliminate(tournament_id, tournament.round, [user_id for user_id, _ in to_eliminate], db)
         tournament.round += 1
         db.commit()
+        tournament_event("round", tournament_id, round=tournament.round,
+                         eliminated=[username for _, username in to_eliminate])
         return tournament
 
+def round_history(tournament_id: int, db: Session):
+    """Eliminati per turno, letti dall'indice (tournament_id, round)"""
+    rows = db.query(TournamentElimination.round, User.username) \
+        .join(User, User.id == TournamentElimination.user_id) \
+        .filter(TournamentElimination.tournament_id == tournament_id) \
+        .order_by(TournamentElimination.round, User.username)
+    history = {}
+    for round, username in rows:
+        history.setdefault(round, []).append(username)
+    return [{"round": round, "eliminated": usernames} for round, usernames in history.items()]
+
 def declare_tournament_winner(tournament_id: int, winner_username: str, db: Session):
-    tournament = db.query(Tournament).filter(Tournament.id == tournament_id).first()
-    if tournament and not tournament.winner:
-        tournament.winner = winner_username
-        db.commit()
-        user = db.query(User).filter(User.username == winner_username).first()
-        if user:
-            user.tournaments_won += 1
-            user.usdc_balance += TOURNAMENT_FEE * len(tournament.players)
-            db.commit()
-    return tournament
+    settle_tournaments([(tournament_id, winner_username)], db)
+    return db.query(Tournament).filter(Tournament.id == tournament_id).first()
 
-def list_tournaments(db: Session):
-    return db.query(Tournament).all()
+def list_tournaments(db: Session, status: str = None, after: int = None, limit: int = LIST_PAGE_SIZE):
+    """Tornei paginati per id, già nella forma TournamentInfo; status: 'open' o 'finished'"""
+    stmt = select(Tournament.id, Tournament.name, Tournament.round, Tournament.winner)
+    if status == "open":
+        stmt = stmt.where(Tournament.winner.is_(None))
+    elif status == "finished":
+        stmt = stmt.where(Tournament.winner.isnot(None))
+    if after is not None:
+        stmt = stmt.where(Tournament.id > after)
+    return tournament_rows(db, stmt.order_by(Tournament.id).limit(limit))